@@ -1,6 +1,5 @@
-import asyncio, traceback
+import asyncio, threading, time, traceback
 
-import psutil
 import socket
 import ipaddress
 from typing import List
@@ -12,21 +11,49 @@ from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
 from fastapi import status, HTTPException
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 import uvicorn
 
-from helpers.levels import load_levels_directory
+from helpers import metrics, profiling, shared_state
+from helpers.levels import load_levels_directory, has_pending_folders
+from helpers.watcher import create_watcher
 
 # CONSTANTS
 PORT = 3939
 DEBUG = False
 SONOLUS_VERSION = "1.0.2"
 BACKGROUND_VERSION = "v3"  # v3, v1
+METRICS = True  # /metrics, and the counters behind it
+WORKERS = 1  # HTTP worker processes (main.py --workers); >1: see serve_workers
+
+metrics.enabled = METRICS
 
 RELATIVE_PATH = Path(__file__).parent
 
+# app.files key -> file under assets/
+ASSETS = {
+    "banner": "banner.png",
+    "thumbnail": "thumbnail.png",
+    "bg_config": "background/configuration",
+    "bg_data": "background/data",
+    "engine_watch": "engine/EngineWatchData",
+    "engine_play": "engine/EnginePlayData",
+    "engine_preview": "engine/EnginePreviewData",
+    "engine_rom": "engine/EngineRom",
+    "engine_tut": "engine/EngineTutorialData",
+    "engine_config": "engine/EngineConfiguration",
+    "bg_image": "background/image.png",
+    "sfx_audio": "effect/audio",
+    "sfx_data": "effect/data",
+    "skin_texture": "skin/texture",
+    "skin_data": "skin/data",
+    "particle_texture": "particle/texture",
+    "particle_data": "particle/data",
+}
+
 
 def get_local_ipv4() -> List[str]:
+    import psutil
+
     addresses: list[str] = []
 
     for iface_addrs in psutil.net_if_addrs().values():
@@ -51,6 +78,8 @@ class SonolusFastAPI(FastAPI):
         self.executor = ThreadPoolExecutor(max_workers=16)
 
         self.files = {}
+        self.loader = None  # the background_loader task, once started
+        self.follower = None  # shared_state.SharedFollower, in a worker
         self.bgver = BACKGROUND_VERSION
 
         self.exception_handlers.setdefault(HTTPException, self.http_exception_handler)
@@ -74,28 +103,78 @@ class SonolusFastAPI(FastAPI):
             return JSONResponse(content={}, status_code=exc.status_code)
 
 
-class SonolusMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["Sonolus-Version"] = SONOLUS_VERSION
-        return response
+class SonolusMiddleware:
+    """
+    Adds the Sonolus-Version header, turns unhandled errors into a 500,
+    records per-route latency and bytes sent for /metrics and, with
+    profiling on, dumps a cProfile of any request over the threshold.
 
+    Plain ASGI: it only wraps `send`, so responses (blob downloads too) pass
+    straight through, with no extra task or buffering per request.
+    """
 
-app = SonolusFastAPI(debug=DEBUG)
+    VERSION_HEADER = (b"sonolus-version", SONOLUS_VERSION.encode("latin-1"))
 
+    def __init__(self, app):
+        self.app = app
 
-@app.middleware("http")
-async def no_unhandled_exceptions(request: Request, call_next):
-    try:
-        return await call_next(request)
-    except Exception:
-        traceback.print_exc()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unhandled error. Report to discord.gg/UntitledCharts",
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = False
+        timed = metrics.enabled
+        start = time.perf_counter() if timed else 0.0
+        sent = 0
+        profile = (
+            profiling.RequestProfile(f"{scope['method']} {scope['path']}")
+            if profiling.enabled
+            else None
         )
 
+        async def send_with_version(message):
+            nonlocal started, sent
+            kind = message["type"]
+            if kind == "http.response.start":
+                started = True
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    self.VERSION_HEADER,
+                ]
+            elif timed:
+                if kind == "http.response.body":
+                    sent += len(message.get("body", b""))
+                elif kind == "http.response.zerocopysend":
+                    sent += message.get("count") or 0
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_version)
+        except Exception:
+            traceback.print_exc()
+            if started:
+                raise  # half-sent; let the server drop the connection
+            response = await app.http_exception_handler(
+                Request(scope),
+                HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Unhandled error. Report to discord.gg/UntitledCharts",
+                ),
+            )
+            await response(scope, receive, send_with_version)
+        finally:
+            if profile is not None:
+                profile.finish()
+            if timed:
+                # route template, not the path: one series per endpoint
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                metrics.request_seconds.observe(
+                    time.perf_counter() - start, (scope["method"], route)
+                )
+                metrics.response_bytes.inc(sent, (route,))
+
 
+app = SonolusFastAPI(debug=DEBUG)
 app.add_middleware(SonolusMiddleware)
 
 
@@ -106,66 +185,36 @@ async def startup_event():
         app.include_router(router)
 
     import helpers.repository
+    from helpers.hash_manifest import get_hash_manifest
 
-    app.files["banner"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/banner.png"
-    )
-    app.files["thumbnail"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/thumbnail.png"
-    )
-    app.files["bg_config"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/background/configuration"
-    )
-    app.files["bg_data"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/background/data"
-    )
-    app.files["engine_watch"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EngineWatchData"
-    )
-    app.files["engine_play"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EnginePlayData"
-    )
-    app.files["engine_preview"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EnginePreviewData"
-    )
-    app.files["engine_rom"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EngineRom"
-    )
-    app.files["engine_tut"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EngineTutorialData"
-    )
-    app.files["engine_config"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/engine/EngineConfiguration"
-    )
-    app.files["bg_image"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/background/image.png"
-    )
-    app.files["sfx_audio"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/effect/audio"
-    )
-    app.files["sfx_data"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/effect/data"
-    )
-    app.files["skin_texture"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/skin/texture"
-    )
-    app.files["skin_data"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/skin/data"
-    )
-    app.files["particle_texture"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/particle/texture"
-    )
-    app.files["particle_data"] = helpers.repository.repo.add_file(
-        RELATIVE_PATH / "assets/particle/data"
-    )
+    # one stat per asset; only files that changed since the last start are read
+    paths = {key: RELATIVE_PATH / "assets" / rel for key, rel in ASSETS.items()}
+    hashes = get_hash_manifest("levels_cache").hash_files(paths.values())
+    for key, path in paths.items():
+        app.files[key] = helpers.repository.repo.add_file(path, sha1=hashes[str(path)])
+
+    # every client downloads these; keep them in memory for good, from the
+    # first request on (reading them now would be the full hash over again)
+    for key, hash in app.files.items():
+        if key.startswith(("engine_", "skin_", "sfx_", "particle_")):
+            helpers.repository.repo.pin(hash, load=False)
 
-    load_levels_directory(BACKGROUND_VERSION)
+    if shared_state.is_worker():
+        # serve_workers: the main process scans, this one takes what it publishes
+        app.loader = asyncio.create_task(follow_scanner(app))
+        return
 
+    # the library is ingested by background_loader once the port is open;
+    # levels show up as their folders are committed
+    print_banner()
+    app.loader = asyncio.create_task(background_loader(app))
+
+
+def print_banner():
     print("OK!")
     ips = get_local_ipv4()
     for ip in ips:
         print(f"Go to server https://open.sonolus.com/{ip}:{PORT}/")
-    asyncio.create_task(background_loader(app))
 
 
 app.add_event_handler("startup", startup_event)
@@ -173,9 +222,96 @@ app.add_event_handler("startup", startup_event)
 
 
 async def background_loader(app: SonolusFastAPI):
+    # watching starts before the first scan, so nothing changed during it is missed
+    watcher = create_watcher("levels")
+    if not watcher.event_driven:
+        print("inotify unavailable, polling levels/ every 0.1s")
+    try:
+        started = time.perf_counter()
+        levels = await app.run_blocking(load_levels_directory, BACKGROUND_VERSION)
+        print(f"{len(levels)} levels loaded in {time.perf_counter() - started:.1f}s")
+        # what changed during that scan is still queued; no second full scan
+        watcher.mark_scanned()
+        while True:
+            # inotify: blocks until something changes (wakes once a second to
+            # expire missing-grace timers); polling: sleeps 0.1s, returns None
+            dirty = await app.run_blocking(watcher.wait, 1.0)
+            if dirty is None:
+                await app.run_blocking(load_levels_directory, BACKGROUND_VERSION)
+            elif dirty or has_pending_folders():
+                await app.run_blocking(
+                    load_levels_directory, BACKGROUND_VERSION, only_folders=dirty
+                )
+    finally:
+        watcher.close()
+
+
+async def follow_scanner(app: SonolusFastAPI):
+    follower = shared_state.SharedFollower("levels_cache")
+    app.follower = follower
+    try:
+        while True:
+            await app.run_blocking(follower.poll)
+            await asyncio.sleep(shared_state.POLL_INTERVAL)
+    finally:
+        app.follower = None
+        follower.close()
+
+
+async def publish_scanner_metrics(
+    app: SonolusFastAPI, publisher: shared_state.SharedPublisher
+):
+    # the workers' /metrics can't see this process's scans and jobs otherwise
+    from routes.metrics import scanner_state
+
     while True:
-        await app.run_blocking(load_levels_directory, BACKGROUND_VERSION)
-        await asyncio.sleep(0.1)
+        await app.run_blocking(lambda: publisher.publish_metrics(scanner_state()))
+        await asyncio.sleep(shared_state.METRICS_INTERVAL)
+
+
+async def run_scanner(app: SonolusFastAPI, publisher: shared_state.SharedPublisher):
+    tasks = [background_loader(app)]
+    if metrics.enabled:
+        tasks.append(publish_scanner_metrics(app, publisher))
+    await asyncio.gather(*tasks)
+
+
+def _run_scanner(loop: asyncio.AbstractEventLoop, task: asyncio.Task):
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        loop.close()
+
+
+def serve_workers(workers: int):
+    """
+    `workers` uvicorn processes serve HTTP; this process only ingests the
+    library (background_loader, on a thread) and hands every snapshot it
+    publishes to them through helpers.shared_state. Blocks until shut down.
+    """
+    publisher = shared_state.start_publishing("levels_cache")
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(run_scanner(app, publisher))
+    scanner = threading.Thread(
+        target=_run_scanner, args=(loop, task), name="scanner", daemon=True
+    )
+    scanner.start()
+    print_banner()
+    try:
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=PORT,
+            workers=workers,
+            access_log=DEBUG,
+            log_level="error" if not DEBUG else None,
+        )
+    finally:
+        if scanner.is_alive():
+            loop.call_soon_threadsafe(task.cancel)
+            scanner.join(timeout=5)
 
 
 async def start_fastapi():
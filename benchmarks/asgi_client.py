@@ -0,0 +1,108 @@
+"""
+Minimal in-process ASGI client for the benchmarks: calls the app directly,
+no sockets, no extra dependencies. Counts what would go over the wire.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+
+class Result(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def wire_bytes(self) -> int:
+        # status line + headers + blank line + body, as HTTP/1.1 would send it
+        head = len(f"HTTP/1.1 {self.status} X\r\n") + 2
+        head += sum(len(k) + len(v) + 4 for k, v in self.headers.items())
+        return head + len(self.body)
+
+
+async def request(
+    app,
+    path: str,
+    method: str = "GET",
+    headers: Optional[Dict[str, str]] = None,
+) -> Result:
+    url = urlsplit(path)
+    raw_headers: List[Tuple[bytes, bytes]] = [(b"host", b"bench")]
+    for k, v in (headers or {}).items():
+        raw_headers.append((k.lower().encode(), v.encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 3939),
+    }
+
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    status = 0
+    response_headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for k, v in message.get("headers", []):
+                response_headers[k.decode("latin-1")] = v.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return Result(status, response_headers, b"".join(chunks))
+
+
+async def load(
+    app,
+    paths: Sequence[str],
+    n: int,
+    concurrency: int = 16,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, float]:
+    """
+    n requests cycling through `paths`, `concurrency` at a time.
+    Returns requests/s and p50/p99 latency in ms; every response must be 200.
+    """
+    latencies: List[float] = []
+    queue = iter(range(n))
+
+    async def worker():
+        for i in queue:
+            start = time.perf_counter()
+            result = await request(app, paths[i % len(paths)], headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if result.status != 200:
+                raise RuntimeError(f"{paths[i % len(paths)]}: {result.status}")
+
+    await request(app, paths[0], headers=headers)  # warm-up, not timed
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    took = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": n,
+        "rps": n / took,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
@@ -0,0 +1,151 @@
+"""
+Bytes on the wire for a typical browse session, per Accept-Encoding.
+
+    python benchmarks/bench_compression.py [--levels 60] [--play 3]
+
+Builds a throwaway library with synthetic_library.py, starts the app
+in-process and replays what a client does: /info, every /list page, the
+detail of each listed level and its cover/background thumbnails, then
+everything needed to play `--play` of them (score, bgm, engine assets).
+Each URL is fetched once, like the client's own cache. The session runs
+twice per encoding; the second run is the cached one.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synthetic_library  # noqa: E402
+from asgi_client import request  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # the server won't offer br either
+        brotli = None
+
+ENCODINGS = {"identity": "identity", "gzip": "gzip", "br": "br, gzip;q=0.5"}
+
+
+def _srls(obj, found: set) -> set:
+    if isinstance(obj, dict):
+        if set(obj) == {"hash", "url"} and obj["url"]:
+            found.add(obj["url"])
+        for v in obj.values():
+            _srls(v, found)
+    elif isinstance(obj, list):
+        for v in obj:
+            _srls(v, found)
+    return found
+
+
+async def _session(app, accept: str, play: int):
+    headers = {"accept-encoding": accept}
+    totals = {"json": 0, "repository": 0}
+    requests = 0
+
+    def decode(result):
+        encoding = result.headers.get("content-encoding")
+        if encoding == "gzip":
+            return json.loads(gzip.decompress(result.body))
+        if encoding == "br":
+            return json.loads(brotli.decompress(result.body))
+        return json.loads(result.body)
+
+    async def get(path: str, kind: str):
+        nonlocal requests
+        result = await request(app, path, headers=headers)
+        assert result.status == 200, (path, result.status)
+        totals[kind] += result.wire_bytes
+        requests += 1
+        return result
+
+    decode(await get("/sonolus/levels/info", "json"))
+    first = decode(await get("/sonolus/levels/list?page=0", "json"))
+    names = [item["name"] for item in first["items"]]
+    for page in range(1, first["pageCount"]):
+        listed = decode(await get(f"/sonolus/levels/list?page={page}", "json"))
+        names.extend(item["name"] for item in listed["items"])
+
+    # cover + background for every level looked at, everything for played ones
+    thumbnails, full = set(), set()
+    for i, name in enumerate(names):
+        detail = decode(await get(f"/sonolus/levels/{name}", "json"))
+        item = detail["item"]
+        thumbnails.add(item["cover"]["url"])
+        thumbnails.add(item["useBackground"]["item"]["image"]["url"])
+        if i < play:
+            _srls(item, full)
+
+    for url in sorted(thumbnails | full):
+        await get(url, "repository")
+    return totals, requests
+
+
+async def _run(args) -> None:
+    import app as app_module
+    from helpers.levels import load_levels_directory
+
+    # startup_event only starts ingest in the background; load the library
+    # first, or the sessions would replay against an empty one
+    load_levels_directory(app_module.BACKGROUND_VERSION)
+    await app_module.startup_event()
+    app = app_module.app
+
+    print(f"{args.levels} levels, {args.play} played")
+    if brotli is None:
+        print("(brotli not installed: the br row is gzip)")
+    print(
+        f"{'encoding':<10} {'json':>12} {'repository':>12} {'total':>12} "
+        f"{'1st':>9} {'2nd':>9}"
+    )
+    for label, accept in ENCODINGS.items():
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            totals, requests = await _session(app, accept, args.play)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{label:<10} {totals['json']:>12,} {totals['repository']:>12,} "
+            f"{sum(totals.values()):>12,} {timings[0] * 1000:>7.1f}ms "
+            f"{timings[1] * 1000:>7.1f}ms"
+        )
+    print(f"{requests} requests per session")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, default=60)
+    parser.add_argument("--play", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        os.chdir(tmp)
+        synthetic_library.generate(Path(tmp) / "levels", args.levels)
+        asyncio.run(_run(args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(tmp, ignore_errors=True)
+    # the watcher task holds an executor thread; the pool goes down first
+    from helpers.jobs import pipeline
+
+    pipeline.shutdown(kill=True)
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark on a synthetic library, written out as JSON.
+
+    python benchmarks/bench_library.py [--sizes 10,1000,10000]
+        [--out bench_results.json] [--requests 2000] [--edits 5]
+
+For each size, in a fresh process and a fresh temp dir (see
+synthetic_library.py for what the folders contain):
+
+  cold_ingest_s       first load_levels_directory(), empty levels_cache
+  rescan_s            median of 3 full rescans with nothing changed
+  edit_to_visible_ms  rewrite one folder's score, wait until the published
+                      snapshot has the new hash (watcher + partial scan +
+                      conversion), per edit
+  list, repository    /sonolus/levels/list and /sonolus/repository/{hash}
+                      through the in-process ASGI client: req/s, p50, p99
+
+The result file also records the commit, Python and CPU count, so runs from
+different versions can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synthetic_library  # noqa: E402
+from asgi_client import load  # noqa: E402
+
+EDIT_TIMEOUT = 60.0
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+async def _edit_to_visible(levels_dir: Path, count: int, edits: int):
+    from helpers.snapshot import current_snapshot
+
+    latencies, timeouts = [], 0
+    # spread the edits over the library, SUS folders only (index % 3 == 0)
+    picks = sorted({(count * k // max(edits, 1)) // 3 * 3 for k in range(edits)})
+    for variant, i in enumerate(picks, start=1):
+        name = synthetic_library.folder_name(i)
+        before = current_snapshot().levels.get(name, {}).get("score")
+        start = time.perf_counter()
+        synthetic_library.write_score(levels_dir, i, variant)
+        while time.perf_counter() - start < EDIT_TIMEOUT:
+            entry = current_snapshot().levels.get(name)
+            if entry is not None and entry.get("score") not in (None, before):
+                latencies.append((time.perf_counter() - start) * 1000)
+                break
+            await asyncio.sleep(0.002)
+        else:
+            timeouts += 1
+    return latencies, timeouts
+
+
+async def _measure(count: int, args) -> dict:
+    result: dict = {"levels": count}
+    levels_dir = Path("levels")
+    result["generate_s"], names = _timed(synthetic_library.generate, levels_dir, count)
+
+    import app as app_module
+    from helpers.levels import load_levels_directory
+    from helpers.snapshot import current_snapshot
+
+    bg = app_module.BACKGROUND_VERSION
+    result["cold_ingest_s"], _ = _timed(load_levels_directory, bg)
+
+    levels = current_snapshot().levels
+    converted = {fmt: 0 for fmt in synthetic_library.FORMATS}
+    for i, name in enumerate(names):
+        if (levels.get(name) or {}).get("score") is not None:
+            converted[synthetic_library.format_of(i)] += 1
+    result["published"] = len(levels)
+    result["scores_converted"] = converted
+
+    result["rescan_s"] = statistics.median(
+        _timed(load_levels_directory, bg)[0] for _ in range(3)
+    )
+
+    # registers the engine assets and starts the watcher
+    await app_module.startup_event()
+    app = app_module.app
+
+    latencies, timeouts = await _edit_to_visible(levels_dir, count, args.edits)
+    result["edit_to_visible_ms"] = {
+        "samples": [round(ms, 2) for ms in latencies],
+        "median": statistics.median(latencies) if latencies else None,
+        "max": max(latencies) if latencies else None,
+        "timeouts": timeouts,
+    }
+
+    snapshot = current_snapshot()
+    pages = max(1, (len(snapshot.levels) + 9) // 10)
+    result["list"] = await load(
+        app,
+        [f"/sonolus/levels/list?page={p}" for p in range(min(pages, 100))],
+        args.requests,
+        args.concurrency,
+    )
+    hashes = [
+        h
+        for entry in snapshot.levels.values()
+        for h in (entry.get("cover"), entry.get("score"))
+        if h is not None
+    ][:1000]
+    result["repository"] = await load(
+        app,
+        [f"/sonolus/repository/{h}" for h in hashes],
+        args.requests,
+        args.concurrency,
+    )
+    return result
+
+
+def _run_one(args) -> None:
+    tmp = tempfile.mkdtemp(prefix="bench-library-")
+    try:
+        os.chdir(tmp)
+        result = asyncio.run(_measure(args.one, args))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(tmp, ignore_errors=True)
+    Path(args.result_file).write_text(json.dumps(result))
+    # the watcher task holds an executor thread; the pool goes down first
+    from helpers.jobs import pipeline
+
+    pipeline.shutdown(kill=True)
+    os._exit(0)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        return _run_one(args)
+
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "sizes": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        fd, result_file = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--one",
+                    str(size),
+                    "--result-file",
+                    result_file,
+                    "--requests",
+                    str(args.requests),
+                    "--concurrency",
+                    str(args.concurrency),
+                    "--edits",
+                    str(args.edits),
+                ],
+                check=True,
+            )
+            result = json.loads(Path(result_file).read_text())
+        finally:
+            os.unlink(result_file)
+        results["sizes"].append(result)
+        edit_ms = result["edit_to_visible_ms"]["median"]
+        print(
+            f"{size:>6} levels: ingest {result['cold_ingest_s']:.2f}s, "
+            f"rescan {result['rescan_s'] * 1000:.1f}ms, "
+            f"edit->visible "
+            f"{'-' if edit_ms is None else f'{edit_ms:.1f}'}ms, "
+            f"list {result['list']['rps']:.0f} req/s, "
+            f"repository {result['repository']['rps']:.0f} req/s"
+        )
+
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
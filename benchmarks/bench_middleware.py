@@ -0,0 +1,117 @@
+"""
+Middleware overhead: requests/s and latency percentiles per middleware stack.
+
+    python benchmarks/bench_middleware.py [--requests 5000] [--concurrency 32]
+
+Runs the same FastAPI routes (a small JSON body, a 1 MiB body and a 1 MiB
+streamed body) behind:
+
+  none     no middleware
+  before   BaseHTTPMiddleware + @app.middleware("http"), as app.py had them
+  after    app.SonolusMiddleware (pure ASGI)
+
+Requests go through the in-process ASGI client, so the numbers are the
+framework and middleware cost alone, no sockets.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import traceback
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fastapi import FastAPI, HTTPException, Request, Response, status  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from asgi_client import load  # noqa: E402
+
+SMALL = b'{"message":"ok"}' * 16
+BIG = os.urandom(1024 * 1024)
+
+
+def _routes(app: FastAPI) -> FastAPI:
+    @app.get("/small")
+    async def small():
+        return Response(SMALL, media_type="application/json")
+
+    @app.get("/big")
+    async def big():
+        return Response(BIG, media_type="application/octet-stream")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(0, len(BIG), 64 * 1024):
+                yield BIG[i : i + 64 * 1024]
+
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    return app
+
+
+def _before() -> FastAPI:
+    from app import SONOLUS_VERSION
+
+    class LegacySonolusMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            response = await call_next(request)
+            response.headers["Sonolus-Version"] = SONOLUS_VERSION
+            return response
+
+    app = _routes(FastAPI())
+
+    @app.middleware("http")
+    async def no_unhandled_exceptions(request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception:
+            traceback.print_exc()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Unhandled error. Report to discord.gg/UntitledCharts",
+            )
+
+    app.add_middleware(LegacySonolusMiddleware)
+    return app
+
+
+def _after() -> FastAPI:
+    from app import SonolusMiddleware
+
+    app = _routes(FastAPI())
+    app.add_middleware(SonolusMiddleware)
+    return app
+
+
+async def _run(args) -> None:
+    stacks = {"none": _routes(FastAPI()), "before": _before(), "after": _after()}
+    print(f"{args.requests} requests per row, concurrency {args.concurrency}")
+    print(f"{'route':<8} {'stack':<8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for path, n in (
+        ("/small", args.requests),
+        ("/big", args.requests // 10),
+        ("/stream", args.requests // 10),
+    ):
+        for label, app in stacks.items():
+            r = await load(app, [path], n, args.concurrency)
+            print(
+                f"{path:<8} {label:<8} {r['rps']:>10.0f} "
+                f"{r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Repository add/lookup benchmark.
+
+    python benchmarks/bench_repository.py [--entries 10000]
+
+Creates N small files in a temp dir, then times add_file (full ingest),
+re-adding every file (the scanner's "changed file" path),
+get_hash_from_file_path, get_srl and get_file.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from helpers.repository import Repository  # noqa: E402
+
+
+def _timed(label: str, n: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    took = time.perf_counter() - start
+    print(f"{label:<28} {took * 1000:10.1f} ms total {took / n * 1e6:9.2f} us/op")
+    return took
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10_000)
+    args = parser.parse_args()
+    n = args.entries
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n):
+            p = os.path.join(tmp, f"{i:06d}.bin")
+            with open(p, "wb") as f:
+                f.write(i.to_bytes(8, "little") * 16)
+            paths.append(p)
+
+        repo = Repository()
+        hashes = []
+
+        print(f"{n} entries")
+        _timed("add_file (ingest)", n, lambda: hashes.extend(map(repo.add_file, paths)))
+        _timed("add_file (re-add)", n, lambda: list(map(repo.add_file, paths)))
+        _timed(
+            "get_hash_from_file_path",
+            n,
+            lambda: list(map(repo.get_hash_from_file_path, paths)),
+        )
+        _timed("get_srl", n, lambda: list(map(repo.get_srl, hashes)))
+        _timed("get_file", n, lambda: list(map(repo.get_file, hashes)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Startup cost: import time, and how soon a server with a library answers.
+
+    python benchmarks/bench_startup.py [--levels 1000] [--runs 5] [--workers 1]
+
+  import_ms        `import app` in a fresh interpreter (median of --runs),
+                   plus which of the heavy modules (Pillow, numpy, the
+                   converters, the background renderer) it pulled in
+  first_response   from spawning the server to the first 200 from
+                   /sonolus/info, i.e. port bound and assets registered
+  first_level      to the first level showing up (scoresync_levels on
+                   /metrics)
+  all_levels       to all --levels of them
+
+--workers above 1 serves through app.serve_workers (the main process scans,
+the workers follow it), so first_level/all_levels include the hop through
+levels_cache/shared.sqlite3; whichever worker answers a poll counts.
+
+The server side runs twice in the same temp dir, holding a synthetic
+library (synthetic_library.py): "cold" with an empty levels_cache, then
+"warm" with the cache the first run left behind.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synthetic_library  # noqa: E402
+
+HEAVY_MODULES = ("PIL.Image", "numpy", "sonolus_converters", "pjsk_background_gen_PIL")
+TIMEOUT = 600.0
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in %r if m in sys.modules]]))
+"""
+
+
+def _import_app(runs: int) -> dict:
+    times, heavy = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE % (HEAVY_MODULES,)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        elapsed, heavy = json.loads(out.strip().splitlines()[-1])
+        times.append(elapsed * 1000)
+    return {"median_ms": statistics.median(times), "heavy_modules": heavy}
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(port: int, path: str):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def _levels_shown(port: int) -> int:
+    status, body = _get(port, "/metrics")
+    if status != 200:
+        return 0
+    for line in body.decode().splitlines():
+        if line.startswith("scoresync_levels "):
+            return int(float(line.split()[1]))
+    return 0
+
+
+def _serve_once(workdir: Path, levels: int, workers: int) -> dict:
+    port = _free_port()
+    with open(workdir / "server.log", "ab") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, __file__, "--serve", str(port), "--workers", str(workers)],
+            cwd=workdir,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # so the job workers go down with it
+        )
+    result = {}
+    try:
+        while "all_levels_s" not in result:
+            if time.perf_counter() - start > TIMEOUT:
+                raise TimeoutError(f"server not done after {TIMEOUT:.0f}s")
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited, see {workdir / 'server.log'}")
+            try:
+                if "first_response_s" not in result:
+                    if _get(port, "/sonolus/info")[0] == 200:
+                        result["first_response_s"] = time.perf_counter() - start
+                    continue
+                shown = _levels_shown(port)
+            except OSError:
+                time.sleep(0.005)
+                continue
+            elapsed = time.perf_counter() - start
+            if shown and "first_level_s" not in result:
+                result["first_level_s"] = elapsed
+            if shown >= levels:
+                result["all_levels_s"] = elapsed
+            else:
+                time.sleep(0.01)
+    finally:
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=10)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            os.killpg(proc.pid, signal.SIGKILL)
+    return result
+
+
+def _serve(port: int, workers: int) -> None:
+    import app
+
+    app.PORT = port
+    if workers > 1:
+        app.serve_workers(workers)
+    else:
+        asyncio.run(app.start_fastapi())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        return _serve(args.serve, args.workers)
+
+    imported = _import_app(args.runs)
+    print(
+        f"import app: {imported['median_ms']:.0f}ms, heavy modules: "
+        f"{', '.join(imported['heavy_modules']) or 'none'}"
+    )
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    try:
+        synthetic_library.generate(tmp / "levels", args.levels)
+        for label in ("cold", "warm"):
+            r = _serve_once(tmp, args.levels, args.workers)
+            print(
+                f"{label}: first response {r['first_response_s'] * 1000:.0f}ms, "
+                f"first level {r['first_level_s']:.2f}s, "
+                f"all {args.levels} levels {r['all_levels_s']:.2f}s"
+            )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
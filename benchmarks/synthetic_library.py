@@ -0,0 +1,229 @@
+"""
+Synthetic levels/ library for the benchmarks.
+
+    python benchmarks/synthetic_library.py DIR [--levels 1000] [--seed 0]
+
+Each folder gets a PNG cover, a dummy MP3 and one score, cycling through
+SUS, USC and MMWS. Covers and audio are derived from (seed, index), scores
+from (index, variant), so the same arguments always give byte-identical
+files, and a score can be rewritten with another variant to simulate an
+edit.
+
+The MMWS files are minimal (one tempo, one time signature, a few taps) in
+MikuMikuWorld's v3 layout. Nothing here checks them against a real parser,
+which is why the runner reports how many folders of each format converted.
+"""
+
+import argparse
+import json
+import random
+import struct
+import zlib
+from pathlib import Path
+from typing import List, Tuple
+
+FORMATS = ("sus", "usc", "mmws")
+
+# table[k] adds k to every byte, so a row can be shifted with bytes.translate
+_SHIFT = [bytes((v + k) % 256 for v in range(256)) for k in range(256)]
+
+
+def folder_name(i: int) -> str:
+    return f"Synthetic {i:05d}"
+
+
+def format_of(i: int) -> str:
+    return FORMATS[i % len(FORMATS)]
+
+
+# ----- covers and audio -----
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    body = kind + data
+    return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+
+def cover_png(seed: int, size: int = 128) -> bytes:
+    """
+    An RGB gradient, different per seed.
+    """
+    rng = random.Random(seed)
+    r, g, b = rng.randrange(256), rng.randrange(256), rng.randrange(256)
+    row = bytes(
+        (r + x) % 256 if c == 0 else (g + x * 2) % 256 if c == 1 else b
+        for x in range(size)
+        for c in range(3)
+    )
+    pixels = b"".join(b"\0" + row.translate(_SHIFT[y % 256]) for y in range(size))
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)),
+            _png_chunk(b"IDAT", zlib.compress(pixels, 6)),
+            _png_chunk(b"IEND", b""),
+        )
+    )
+
+
+def dummy_mp3(seed: int, size: int = 64 * 1024) -> bytes:
+    """
+    An ID3v2 header and noise: the right name and magic, not playable.
+    """
+    return b"ID3\x03\x00\x00\x00\x00\x00\x00" + random.Random(seed).randbytes(size)
+
+
+# ----- scores -----
+
+
+def _notes(seed: int, count: int = 64) -> List[Tuple[int, int, int]]:
+    # (tick, lane 0-9, width 1-3), 480 ticks per beat
+    rng = random.Random(seed)
+    return [(i * 240, rng.randrange(0, 10), rng.randrange(1, 4)) for i in range(count)]
+
+
+def sus_score(i: int, variant: int = 0) -> bytes:
+    lines = [
+        f'#TITLE "Synthetic {i}"',
+        '#ARTIST "benchmarks"',
+        '#DESIGNER "synthetic_library"',
+        '#REQUEST "ticks_per_beat 480"',
+        "#00002: 4",
+        f"#BPM01: {120 + (i + variant) % 80}",
+        "#00008: 01",
+    ]
+    # one line per note: 8 slots of 240 ticks in a 4-beat (1920 tick) measure
+    for tick, lane, width in _notes(i * 7919 + variant, 64 + variant):
+        measure, offset = divmod(tick, 1920)
+        slots = ["00"] * 8
+        slots[offset // 240] = f"1{width}"
+        lines.append(f"#{measure:03d}1{lane + 2:x}: " + "".join(slots))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def usc_score(i: int, variant: int = 0) -> bytes:
+    objects = [
+        {"type": "bpm", "beat": 0.0, "bpm": float(120 + (i + variant) % 80)},
+        {"type": "timeScaleGroup", "changes": [{"beat": 0.0, "timeScale": 1.0}]},
+    ]
+    for tick, lane, width in _notes(i * 7919 + variant, 64 + variant):
+        objects.append(
+            {
+                "type": "single",
+                "beat": tick / 480,
+                "lane": lane - 5.5 + width / 2,
+                "size": width / 2,
+                "critical": False,
+                "trace": False,
+                "timeScaleGroup": 0,
+            }
+        )
+    return json.dumps(
+        {"usc": {"offset": 0.0, "objects": objects}, "version": 2}
+    ).encode()
+
+
+def _mmws_string(s: str) -> bytes:
+    return s.encode() + b"\0"
+
+
+def mmws_score(i: int, variant: int = 0) -> bytes:
+    notes = _notes(i * 7919 + variant, 64 + variant)
+    metadata = b"".join(
+        (
+            _mmws_string(f"Synthetic {i}"),  # title
+            _mmws_string("synthetic_library"),  # author
+            _mmws_string("benchmarks"),  # artist
+            _mmws_string(""),  # music file
+            struct.pack("<f", 0.0),  # music offset
+            _mmws_string(""),  # jacket file
+            struct.pack("<i", 0),  # lane extension
+        )
+    )
+    events = b"".join(
+        (
+            struct.pack("<i", 1) + struct.pack("<iii", 0, 4, 4),  # time signatures
+            struct.pack("<i", 1)
+            + struct.pack("<if", 0, float(120 + (i + variant) % 80)),  # tempos
+            struct.pack("<i", 0),  # hi-speeds
+            struct.pack("<i", 0),  # skills
+            struct.pack("<ii", -1, -1),  # fever
+        )
+    )
+    # tick, lane, width, critical, friction, flick
+    taps = struct.pack("<i", len(notes)) + b"".join(
+        struct.pack("<iiiiii", tick, lane, width, 0, 0, 0)
+        for tick, lane, width in notes
+    )
+    holds = struct.pack("<i", 0)
+
+    header_size = len(_mmws_string("MMWS")) + 4 + 4 * 4
+    metadata_at = header_size
+    events_at = metadata_at + len(metadata)
+    taps_at = events_at + len(events)
+    holds_at = taps_at + len(taps)
+    return b"".join(
+        (
+            _mmws_string("MMWS"),
+            struct.pack("<i", 3),
+            struct.pack("<IIII", metadata_at, events_at, taps_at, holds_at),
+            metadata,
+            events,
+            taps,
+            holds,
+        )
+    )
+
+
+_SCORES = {"sus": sus_score, "usc": usc_score, "mmws": mmws_score}
+
+
+def score_bytes(i: int, variant: int = 0) -> Tuple[str, bytes]:
+    """
+    (file name, content) of folder i's score.
+    """
+    fmt = format_of(i)
+    return f"score.{fmt}", _SCORES[fmt](i, variant)
+
+
+# ----- library -----
+
+
+def write_score(levels_dir: Path, i: int, variant: int = 0) -> Path:
+    name, data = score_bytes(i, variant)
+    path = Path(levels_dir) / folder_name(i) / name
+    path.write_bytes(data)
+    return path
+
+
+def generate(
+    levels_dir: Path, count: int, seed: int = 0, mp3_bytes: int = 64 * 1024
+) -> List[str]:
+    """
+    Creates `count` level folders under levels_dir; returns their names.
+    """
+    levels_dir = Path(levels_dir)
+    names = []
+    for i in range(count):
+        folder = levels_dir / folder_name(i)
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / "cover.png").write_bytes(cover_png(seed * 1_000_003 + i))
+        (folder / "music.mp3").write_bytes(dummy_mp3(seed * 1_000_003 + i, mp3_bytes))
+        write_score(levels_dir, i)
+        names.append(folder.name)
+    return names
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("levels_dir", type=Path)
+    parser.add_argument("--levels", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mp3-kib", type=int, default=64)
+    args = parser.parse_args()
+    generate(args.levels_dir, args.levels, args.seed, args.mp3_kib * 1024)
+    print(f"{args.levels} levels in {args.levels_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
-import pjsk_background_gen_PIL
-from PIL import Image
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+
+# the package that does the actual rendering (its version keys cached renders);
+# imported on the first render, in a job worker, so the server doesn't pay
+# for Pillow and numpy at startup
+BACKGROUND_GENERATOR = "pjsk_background_gen_PIL"
+
+# bump when render_png changes, so cached backgrounds are redone
+RENDER_REVISION = 1
 
 
 def render_png(version: str, original_image: Image) -> Image:
+    import pjsk_background_gen_PIL
+
     if version == "v1":
         return pjsk_background_gen_PIL.render_v1(original_image)
     return pjsk_background_gen_PIL.render_v3(original_image)
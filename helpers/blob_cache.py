@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+import threading
+
+
+class BlobCache:
+    """
+    Byte-budgeted LRU of repository blobs, keyed by sha1.
+
+    Pinned keys (engine/skin/effect/particle assets every client downloads)
+    live outside the LRU: they never get evicted and don't count against
+    max_bytes, though they do count in resident_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 0):
+        self.max_bytes = max_bytes
+        # blobs bigger than this (bgm, mostly) would just flush everything else
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lru_bytes = 0
+        self._pinned: Dict[str, bytes] = {}
+        self._pinned_bytes = 0
+        self._pin_keys: Set[str] = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._lru_bytes + self._pinned_bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._pinned.get(key)
+            if data is None:
+                data = self._lru.get(key)
+                if data is not None:
+                    self._lru.move_to_end(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        size = len(data)
+        with self._lock:
+            if key in self._pin_keys:
+                if key not in self._pinned:
+                    self._pinned[key] = data
+                    self._pinned_bytes += size
+                return
+            if size > self.max_entry_bytes or key in self._lru:
+                return
+            self._lru[key] = data
+            self._lru_bytes += size
+            while self._lru_bytes > self.max_bytes:
+                _, evicted = self._lru.popitem(last=False)
+                self._lru_bytes -= len(evicted)
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pin_keys.add(key)
+            data = self._lru.pop(key, None)
+            if data is not None:
+                self._lru_bytes -= len(data)
+                self._pinned[key] = data
+                self._pinned_bytes += len(data)
+
+    def is_pinned(self, key: str) -> bool:
+        return key in self._pin_keys
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            data = self._lru.pop(key, None)
+            if data is not None:
+                self._lru_bytes -= len(data)
+            data = self._pinned.pop(key, None)
+            if data is not None:
+                self._pinned_bytes -= len(data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "resident_bytes": self._lru_bytes + self._pinned_bytes,
+                "entries": len(self._lru),
+                "pinned_entries": len(self._pinned),
+            }
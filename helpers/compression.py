@@ -0,0 +1,147 @@
+"""
+Content-Encoding negotiation (gzip, and brotli when installed).
+
+Compressed variants are made once and kept: repository blobs in `variants`
+(keyed by content hash, so they never go stale), JSON pages by
+helpers.level_json next to the pages themselves. Media that is already
+compressed (gzipped LevelData, PNG/JPEG, MP3/OGG) is never touched, and
+anything that doesn't shrink by at least 10% is remembered as "send as is".
+"""
+
+from __future__ import annotations
+
+import gzip
+from typing import Dict, Optional, Tuple
+
+from fastapi import Response
+
+from helpers.blob_cache import BlobCache
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # optional; gzip only
+        brotli = None
+
+# most preferred first
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+MIN_SIZE = 256  # below this the headers cost more than they save
+_MAX_RATIO = 0.9
+
+_PRECOMPRESSED_TYPES = (
+    "application/gzip",
+    "application/zip",
+    "image/png",
+    "image/jpeg",
+    "image/webp",
+    "audio/",
+    "video/",
+)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Best encoding we support from an Accept-Encoding header, or None for
+    identity. Honours q-values (q=0 means "not this one") and "*".
+    """
+    if not accept_encoding:
+        return None
+    q_values = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        q_values[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = q_values.get(encoding, q_values.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible_type(media_type: Optional[str]) -> bool:
+    return not (media_type or "").startswith(_PRECOMPRESSED_TYPES)
+
+
+def worth_compressing(media_type: Optional[str], size: int) -> bool:
+    return size >= MIN_SIZE and compressible_type(media_type)
+
+
+def compress(data: bytes, encoding: str, quick: bool = False) -> bytes:
+    """
+    quick: for bodies that get built per snapshot (JSON pages) rather than
+    once per content hash.
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6 if quick else 9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=5 if quick else 9)
+    raise ValueError(f"unsupported encoding {encoding!r}")
+
+
+def maybe_compress(
+    data: bytes, encoding: Optional[str], media_type: Optional[str], quick=False
+) -> Optional[bytes]:
+    """
+    The compressed body, or None if it should go out as is.
+    """
+    if encoding is None or not worth_compressing(media_type, len(data)):
+        return None
+    out = compress(data, encoding, quick)
+    if len(out) > len(data) * _MAX_RATIO:
+        return None
+    return out
+
+
+class CompressedVariants:
+    """
+    Compressed copies of repository blobs, keyed by (sha1, encoding).
+    An empty entry means "tried, didn't shrink"; those cost nothing to keep.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.cache = BlobCache(max_bytes)
+
+    def get(
+        self, hash: str, data: bytes, encoding: Optional[str], media_type: Optional[str]
+    ) -> Optional[bytes]:
+        if encoding is None or not worth_compressing(media_type, len(data)):
+            return None
+        key = f"{hash}:{encoding}"
+        out = self.cache.get(key)
+        if out is None:
+            out = maybe_compress(data, encoding, media_type) or b""
+            self.cache.put(key, out)
+        return out or None
+
+
+variants = CompressedVariants()
+
+
+def encoded_response(
+    body: bytes,
+    encoding: Optional[str],
+    media_type: Optional[str],
+    headers: Optional[Dict[str, str]] = None,
+    status_code: int = 200,
+) -> Response:
+    headers = dict(headers or {})
+    headers["vary"] = "Accept-Encoding"
+    if encoding is not None:
+        headers["content-encoding"] = encoding
+    return Response(
+        content=body, status_code=status_code, media_type=media_type, headers=headers
+    )
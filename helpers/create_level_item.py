@@ -1,21 +1,24 @@
 from helpers.repository import repo
 
 
-def create_level_item(request, data, folder_name):
-    engine_data = {
+def create_engine_data(files):
+    """
+    The engine/skin/effect/particle/background part every level item shares.
+    """
+    return {
         "name": "NextRUSH_P",
         "version": 13,
         "tags": [],
         "title": "NextRUSH+",
         "subtitle": "NextRUSH+",
         "author": "hyeong",
-        "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
-        "configuration": repo.get_srl(request.app.files["engine_config"]),
-        "playData": repo.get_srl(request.app.files["engine_play"]),
-        "watchData": repo.get_srl(request.app.files["engine_watch"]),
-        "previewData": repo.get_srl(request.app.files["engine_preview"]),
-        "tutorialData": repo.get_srl(request.app.files["engine_tut"]),
-        "rom": repo.get_srl(request.app.files["engine_rom"]),
+        "thumbnail": repo.get_srl(files["thumbnail"]),
+        "configuration": repo.get_srl(files["engine_config"]),
+        "playData": repo.get_srl(files["engine_play"]),
+        "watchData": repo.get_srl(files["engine_watch"]),
+        "previewData": repo.get_srl(files["engine_preview"]),
+        "tutorialData": repo.get_srl(files["engine_tut"]),
+        "rom": repo.get_srl(files["engine_rom"]),
         "skin": {
             "name": "nextrushpskin",
             "version": 4,
@@ -23,9 +26,9 @@ def create_level_item(request, data, folder_name):
             "subtitle": "JP v3",
             "author": "hyeong",
             "tags": [],
-            "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
-            "data": repo.get_srl(request.app.files["skin_data"]),
-            "texture": repo.get_srl(request.app.files["skin_texture"]),
+            "thumbnail": repo.get_srl(files["thumbnail"]),
+            "data": repo.get_srl(files["skin_data"]),
+            "texture": repo.get_srl(files["skin_texture"]),
         },
         "background": {
             "name": "black",
@@ -34,10 +37,10 @@ def create_level_item(request, data, folder_name):
             "subtitle": "black",
             "author": "RGB(0,0,0)",
             "tags": [],
-            "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
-            "data": repo.get_srl(request.app.files["bg_data"]),
-            "configuration": repo.get_srl(request.app.files["bg_config"]),
-            "image": repo.get_srl(request.app.files["bg_image"]),
+            "thumbnail": repo.get_srl(files["thumbnail"]),
+            "data": repo.get_srl(files["bg_data"]),
+            "configuration": repo.get_srl(files["bg_config"]),
+            "image": repo.get_srl(files["bg_image"]),
         },
         "effect": {
             "name": "v3",
@@ -46,9 +49,9 @@ def create_level_item(request, data, folder_name):
             "subtitle": "v3",
             "author": "Burrito",
             "tags": [],
-            "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
-            "data": repo.get_srl(request.app.files["sfx_data"]),
-            "audio": repo.get_srl(request.app.files["sfx_audio"]),
+            "thumbnail": repo.get_srl(files["thumbnail"]),
+            "data": repo.get_srl(files["sfx_data"]),
+            "audio": repo.get_srl(files["sfx_audio"]),
         },
         "particle": {
             "name": "Standard",
@@ -57,12 +60,17 @@ def create_level_item(request, data, folder_name):
             "subtitle": "Standard",
             "author": "ToastedBread",
             "tags": [],
-            "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
-            "data": repo.get_srl(request.app.files["particle_data"]),
-            "texture": repo.get_srl(request.app.files["particle_texture"]),
+            "thumbnail": repo.get_srl(files["thumbnail"]),
+            "data": repo.get_srl(files["particle_data"]),
+            "texture": repo.get_srl(files["particle_texture"]),
         },
     }
 
+
+def create_level_item(request, data, folder_name, engine_data=None):
+    if engine_data is None:
+        engine_data = create_engine_data(request.app.files)
+
     background = {
         "name": f"levelbg",
         "version": 2,
@@ -70,7 +78,7 @@ def create_level_item(request, data, folder_name):
         "title": folder_name,
         "subtitle": f"{folder_name} Background",
         "author": "ScoreSync Modern",
-        "thumbnail": repo.get_srl(request.app.files["thumbnail"]),
+        "thumbnail": engine_data["thumbnail"],
         "data": engine_data["background"]["data"],
         "image": repo.get_srl(data["background"]) or engine_data["background"]["image"],
         "configuration": engine_data["background"]["configuration"],
@@ -0,0 +1,299 @@
+"""
+Content-addressed caches of things derived from level files: converted
+scores (levels_cache/conversions) and rendered backgrounds
+(levels_cache/backgrounds).
+
+An entry is keyed by (source sha1, params, version). params is whatever else
+the output depends on: the detected score format, or the background version.
+version identifies the code that made it: the converters or renderer release.
+A score that was touched or rewritten with the same bytes, reverted, or copied
+into another folder maps straight to its existing output without another
+parse/export/render. Blobs are stored as <dir>/<result sha1> and served by the
+repository from there. The index is <dir>/index.sqlite3, so hits survive
+restarts.
+
+Garbage collection: rows from another version are dropped at load, together
+with blobs no row points to. After that, eviction is by size, least recently
+used first, and never touches a result that a folder still points at
+(see evict()).
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from helpers.sha1 import calculate_sha1
+from helpers.sqlite_store import Registry, connect
+
+MAX_BYTES = 256 * 1024 * 1024
+
+_INDEX_NAME = "index.sqlite3"
+_TMP_NAME = "tmp"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " source_sha1 TEXT NOT NULL,"
+    " params TEXT NOT NULL,"
+    " version TEXT NOT NULL,"
+    " result_sha1 TEXT NOT NULL,"
+    " size INTEGER NOT NULL,"
+    " last_used REAL NOT NULL,"
+    " PRIMARY KEY (source_sha1, params, version))"
+)
+
+
+class DerivedEntry(NamedTuple):
+    source_sha1: str
+    params: str
+    version: str
+    result_sha1: str
+    size: int
+
+
+class DerivedCache:
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        name: str,
+        version: str,
+        max_bytes: int = MAX_BYTES,
+    ):
+        self.name = name
+        self.dir = Path(cache_dir) / name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = self.dir / _TMP_NAME
+        self.tmp_dir.mkdir(exist_ok=True)
+        self.version = version
+        self.max_bytes = max_bytes
+
+        self._entries: Dict[Tuple[str, str], DerivedEntry] = {}
+        self._last_used: Dict[Tuple[str, str], float] = {}
+        # some params are only known after the work (a score's format is
+        # detected while converting), so lookups can also go by source alone
+        self._by_source: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+        self._db = connect(self.dir / _INDEX_NAME, (_SCHEMA,))
+
+        self._load()
+
+    # ----- loading -----
+
+    def _load(self) -> None:
+        stale = []
+        for row in self._db.execute(
+            "SELECT source_sha1, params, version, result_sha1, size, last_used"
+            " FROM entries"
+        ):
+            entry = DerivedEntry(*row[:5])
+            if entry.version != self.version:
+                stale.append(entry)  # can never hit again
+                continue
+            self._add_locked(entry, row[5])
+
+        for entry in stale:
+            self._execute(
+                "DELETE FROM entries"
+                " WHERE source_sha1 = ? AND params = ? AND version = ?",
+                (entry.source_sha1, entry.params, entry.version),
+            )
+
+        # nothing is being served from here yet, so anything no row points to
+        # (stale versions, tmp files of conversions that never got committed,
+        # a crash between the rename and the insert) can go
+        live = {e.result_sha1 for e in self._entries.values()}
+        for p in list(self.dir.iterdir()) + list(self.tmp_dir.iterdir()):
+            if p.name in live or p.name in (_TMP_NAME, _INDEX_NAME):
+                continue
+            if p.name.startswith(_INDEX_NAME):
+                continue  # -wal / -shm
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    def _add_locked(self, entry: DerivedEntry, last_used: float) -> None:
+        key = (entry.source_sha1, entry.params)
+        self._entries[key] = entry
+        self._last_used[key] = last_used
+        self._by_source[entry.source_sha1] = key
+
+    def _pop_locked(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+        self._last_used.pop(key, None)
+        if self._by_source.get(key[0]) == key:
+            del self._by_source[key[0]]
+
+    # ----- lookups -----
+
+    def blob_path(self, result_sha1: str) -> Path:
+        return self.dir / result_sha1
+
+    def new_tmp_path(self) -> Path:
+        return self.tmp_dir / uuid.uuid4().hex
+
+    def get(
+        self, source_sha1: str, params: Optional[str] = None
+    ) -> Optional[DerivedEntry]:
+        """
+        params=None matches whatever params the source was last stored with.
+        """
+        with self._lock:
+            key = (
+                self._by_source.get(source_sha1)
+                if params is None
+                else (source_sha1, params)
+            )
+            entry = self._entries.get(key) if key else None
+        if entry is None:
+            return None
+        if not self.blob_path(entry.result_sha1).is_file():
+            # somebody cleaned the folder under us
+            with self._lock:
+                self._pop_locked(key)
+            self._delete_row(entry)
+            return None
+        now = time.time()
+        with self._lock:
+            self._last_used[key] = now
+        self._execute(
+            "UPDATE entries SET last_used = ?"
+            " WHERE source_sha1 = ? AND params = ? AND version = ?",
+            (now, entry.source_sha1, entry.params, entry.version),
+        )
+        return entry
+
+    # ----- inserting -----
+
+    def put(
+        self,
+        source_sha1: str,
+        params: str,
+        tmp_path: str | Path,
+        result_sha1: Optional[str] = None,
+    ) -> DerivedEntry:
+        """
+        Moves finished work (written to new_tmp_path()) into the store.
+        result_sha1 is the tmp file's hash if the writer already knows it.
+        """
+        tmp_path = Path(tmp_path)
+        if not tmp_path.exists():
+            # the same job shared by several folders; the first one stored it
+            entry = self.get(source_sha1, params)
+            if entry is not None:
+                return entry
+        if result_sha1 is None:
+            result_sha1 = calculate_sha1(tmp_path)
+        size = tmp_path.stat().st_size
+        blob = self.blob_path(result_sha1)
+        if blob.is_file():
+            tmp_path.unlink()  # identical output already stored
+        else:
+            os.replace(tmp_path, blob)
+
+        entry = DerivedEntry(source_sha1, params, self.version, result_sha1, size)
+        now = time.time()
+        with self._lock:
+            self._add_locked(entry, now)
+        self._execute(
+            "INSERT OR REPLACE INTO entries"
+            " (source_sha1, params, version, result_sha1, size, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            entry + (now,),
+        )
+        return entry
+
+    # ----- eviction -----
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            sizes = {e.result_sha1: e.size for e in self._entries.values()}
+        return sum(sizes.values())
+
+    def evict(self, keep: Iterable[Optional[str]] = ()) -> int:
+        """
+        Drops least recently used entries until the blobs fit in max_bytes.
+        keep holds result hashes still in use (a folder's committed score);
+        those are never removed, even if that leaves the cache over budget.
+        Returns the number of entries dropped.
+        """
+        keep = {h for h in keep if h}
+        with self._lock:
+            sizes: Dict[str, int] = {}
+            refs: Dict[str, int] = {}
+            for e in self._entries.values():
+                sizes[e.result_sha1] = e.size
+                refs[e.result_sha1] = refs.get(e.result_sha1, 0) + 1
+            total = sum(sizes.values())
+            if total <= self.max_bytes:
+                return 0
+
+            dropped = []
+            for key in sorted(self._entries, key=self._last_used.__getitem__):
+                if total <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                if entry.result_sha1 in keep:
+                    continue
+                self._pop_locked(key)
+                dropped.append(entry)
+                refs[entry.result_sha1] -= 1
+                if refs[entry.result_sha1] == 0:
+                    total -= entry.size
+
+        for entry in dropped:
+            self._delete_row(entry)
+        return len(dropped)
+
+    def _delete_row(self, entry: DerivedEntry) -> None:
+        self._execute(
+            "DELETE FROM entries"
+            " WHERE source_sha1 = ? AND params = ? AND version = ?",
+            (entry.source_sha1, entry.params, entry.version),
+        )
+        # several sources can convert to identical bytes; the blob goes with the last
+        with self._lock:
+            still_used = any(
+                e.result_sha1 == entry.result_sha1 for e in self._entries.values()
+            )
+        if not still_used:
+            try:
+                self.blob_path(entry.result_sha1).unlink()
+            except OSError:
+                pass
+
+    # ----- sqlite -----
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        try:
+            with self._lock:
+                self._db.execute(sql, params)
+        except sqlite3.Error:
+            traceback.print_exc()  # the index is only a cache; carry on without it
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_CACHES: Registry[DerivedCache] = Registry()
+
+
+def get_derived_cache(cache_dir: str | Path, name: str, version: str) -> DerivedCache:
+    key = (Path(cache_dir).resolve(), name)
+    return _CACHES.get(
+        key,
+        lambda: DerivedCache(key[0], name, version),
+        reuse=lambda cache: cache.version == version,
+    )
+
+
+def derived_caches() -> List[DerivedCache]:
+    return _CACHES.values()
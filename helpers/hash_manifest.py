@@ -0,0 +1,133 @@
+"""
+File hashes that survive restarts: path -> (size, mtime_ns, inode, sha1) in
+levels_cache/hashes.sqlite3.
+
+A file whose stat still matches its row is taken at the recorded hash, so
+the bundled assets (engine data, skin and particle textures, effect audio),
+which only change between releases, cost one stat each at startup instead
+of a full read. Files that did change are rehashed on a thread pool
+(hashlib drops the GIL while it hashes) and their rows replaced.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from helpers.sha1 import calculate_sha1
+from helpers.sqlite_store import Registry, connect
+
+_NAME = "hashes.sqlite3"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS files ("
+    " path TEXT PRIMARY KEY,"
+    " size INTEGER NOT NULL,"
+    " mtime_ns INTEGER NOT NULL,"
+    " inode INTEGER NOT NULL,"
+    " sha1 TEXT NOT NULL)"
+)
+
+# size, mtime_ns, inode
+Fingerprint = Tuple[int, int, int]
+
+
+def fingerprint(st: os.stat_result) -> Fingerprint:
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _key(path: str | os.PathLike) -> str:
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+class HashManifest:
+    def __init__(self, cache_dir: str | Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / _NAME
+
+        self._rows: Dict[str, Tuple[Fingerprint, str]] = {}
+        self._lock = threading.Lock()
+        self._db = connect(self.path, (_SCHEMA,))
+        for path, size, mtime_ns, inode, sha1 in self._db.execute(
+            "SELECT path, size, mtime_ns, inode, sha1 FROM files"
+        ):
+            self._rows[path] = ((size, mtime_ns, inode), sha1)
+
+    def lookup(self, path: str | os.PathLike, fp: Fingerprint) -> Optional[str]:
+        """
+        The recorded hash, if the file still has fingerprint fp.
+        """
+        row = self._rows.get(_key(path))
+        if row is None or row[0] != fp:
+            return None
+        return row[1]
+
+    def record(self, items: Iterable[Tuple[str | os.PathLike, Fingerprint, str]]):
+        """
+        Saves (path, fingerprint, sha1) rows, in one transaction.
+        """
+        rows = [(_key(p), *fp, sha1) for p, fp, sha1 in items]
+        if not rows:
+            return
+        with self._lock:
+            for key, size, mtime_ns, inode, sha1 in rows:
+                self._rows[key] = ((size, mtime_ns, inode), sha1)
+            try:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO files"
+                        " (path, size, mtime_ns, inode, sha1) VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except sqlite3.Error:
+                traceback.print_exc()  # only a cache; next start rehashes
+
+    def hash_files(
+        self, paths: Iterable[str | os.PathLike], workers: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        sha1 of every path (keyed by str(path)): one stat each, a read only
+        for files whose fingerprint changed, those in parallel.
+        Raises OSError for a path that doesn't exist, like calculate_sha1.
+        """
+        hashes: Dict[str, str] = {}
+        stale: Dict[str, Fingerprint] = {}
+        for path in paths:
+            fp = fingerprint(os.stat(path))
+            sha1 = self.lookup(path, fp)
+            if sha1 is None:
+                stale[str(path)] = fp
+            else:
+                hashes[str(path)] = sha1
+        if not stale:
+            return hashes
+
+        workers = workers or min(len(stale), os.cpu_count() or 1)
+        if workers > 1:
+            with ThreadPoolExecutor(workers, thread_name_prefix="rehash") as pool:
+                fresh = dict(zip(stale, pool.map(calculate_sha1, stale)))
+        else:
+            fresh = {path: calculate_sha1(path) for path in stale}
+        # a file rewritten while it was read gets the new stat next time
+        self.record((path, stale[path], sha1) for path, sha1 in fresh.items())
+        hashes.update(fresh)
+        return hashes
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_MANIFESTS: Registry[HashManifest] = Registry()
+
+
+def get_hash_manifest(cache_dir: str | Path) -> HashManifest:
+    key = Path(cache_dir).resolve()
+    return _MANIFESTS.get(key, lambda: HashManifest(key))
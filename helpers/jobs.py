@@ -0,0 +1,249 @@
+"""
+Process pool for the CPU-heavy part of ingest (score conversion, background
+renders), so it runs on every core instead of under the GIL next to request
+threads.
+
+Jobs must be top-level functions with picklable arguments. A job that raises
+just fails (result() returns None). A job that hangs past its timeout gets its
+pool killed and replaced. A worker that dies (segfault in a native decoder,
+OOM kill) breaks the whole pool. Either way every other job that was queued or
+running on the old pool is retried once on the fresh one, so only the job
+that actually hangs or crashes fails.
+"""
+
+from __future__ import annotations
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from helpers import profiling
+
+JOB_TIMEOUT = 120.0  # seconds, per job, counted from the first result() call
+
+
+def _default_workers() -> int:
+    # leave a core for uvicorn and the scanner thread
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _timed_call(
+    fn: Callable[..., Any], *args: Any
+) -> Tuple[float, Any, Optional[Dict[str, float]]]:
+    # runs in the worker, so the time excludes queueing and pickling
+    if profiling.enabled:
+        with profiling.collecting({}) as phases:
+            start = time.perf_counter()
+            value = fn(*args)
+            return time.perf_counter() - start, value, phases
+    start = time.perf_counter()
+    value = fn(*args)
+    return time.perf_counter() - start, value, None
+
+
+def _describe_arg(arg: Any) -> str:
+    if isinstance(arg, (bytes, bytearray, memoryview)):
+        return f"<{len(arg)} bytes>"
+    text = repr(arg)
+    return text if len(text) <= 80 else text[:77] + "..."
+
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    terminate = getattr(pool, "terminate_workers", None)  # 3.14+
+    if terminate is not None:
+        try:
+            terminate()
+            return
+        except Exception:
+            pass
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Job:
+    def __init__(
+        self,
+        pipeline: "JobPipeline",
+        fn: Callable[..., Any],
+        args: Tuple[Any, ...],
+        timeout: float,
+        source: Optional[str] = None,
+    ):
+        self._pipeline = pipeline
+        self.fn = fn
+        self.args = args
+        self.timeout = timeout
+        self.source = source  # what the job works on, for log lines
+        self.elapsed: Optional[float] = None  # worker seconds, once it succeeded
+        # profiling.phase() timings inside the job, when profiling is on
+        self.phases: Optional[Dict[str, float]] = None
+        self.observed = False  # counted in metrics.job_seconds
+        self._future, self._generation = pipeline._submit(fn, args)
+
+    def result(self) -> Any:
+        """
+        The job's return value, or None if it failed, crashed or timed out.
+        """
+        for attempt in range(2):
+            try:
+                elapsed, value, phases = self._future.result(timeout=self.timeout)
+                if self.elapsed is None:
+                    self.elapsed, self.phases = elapsed, phases
+                return value
+            except FuturesTimeout:
+                print(f"job timed out after {self.timeout:.0f}s: {self._describe()}")
+                self._pipeline._restart(self._generation)
+                return None
+            except BrokenProcessPool:
+                self._pipeline._restart(self._generation)
+                if attempt:
+                    print(f"job crashed its worker: {self._describe()}")
+                    return None
+                self._resubmit()
+            except CancelledError:
+                # still queued when another job's timeout killed the pool
+                if attempt or not self._pipeline._replaced(self._generation):
+                    return None  # cancelled by shutdown()
+                self._resubmit()
+            except Exception as e:
+                print("".join(traceback.format_exception(e, e, e.__traceback__)))
+                return None
+        return None
+
+    def _resubmit(self) -> None:
+        self._future, self._generation = self._pipeline._submit(self.fn, self.args)
+
+    def _describe(self) -> str:
+        # args can hold a whole score or image; never print those
+        args = ", ".join(_describe_arg(arg) for arg in self.args)
+        source = f" on {self.source}" if self.source else ""
+        return f"{self.fn.__name__}({args}){source}"
+
+
+class CompletedJob:
+    """
+    Stand-in for a Job whose result is already known (e.g. a cache hit).
+    """
+
+    elapsed = None
+    phases = None
+    observed = True
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def result(self) -> Any:
+        return self.value
+
+
+class JobPipeline:
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or _default_workers()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._inline = False  # no usable process pool here; run in the caller
+        self.in_flight = 0  # submitted, not finished yet (queued or running)
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self._inline:
+            return None
+        if self._pool is None:
+            try:
+                # spawn everywhere: forking a process full of threads and an
+                # open sqlite handle is asking for trouble
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            except (OSError, NotImplementedError, ValueError) as e:
+                print(f"process pool unavailable ({e}), converting in-process")
+                self._inline = True
+                return None
+        return self._pool
+
+    def _submit(self, fn, args) -> Tuple[Future, int]:
+        future, generation = self._start(fn, args)
+        with self._lock:
+            self.in_flight += 1
+        future.add_done_callback(self._job_done)
+        return future, generation
+
+    def _job_done(self, _future: Future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _start(self, fn, args) -> Tuple[Future, int]:
+        with self._lock:
+            pool = self._get_pool()
+            generation = self._generation
+            if pool is not None:
+                try:
+                    return pool.submit(_timed_call, fn, *args), generation
+                except (BrokenProcessPool, RuntimeError):
+                    _kill_pool(pool)
+                    self._pool = None
+                    self._generation += 1
+                    pool = self._get_pool()
+                    generation = self._generation
+                    if pool is not None:
+                        return pool.submit(_timed_call, fn, *args), generation
+
+        future: Future = Future()
+        try:
+            future.set_result(_timed_call(fn, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future, generation
+
+    def _restart(self, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation or self._pool is None:
+                return  # somebody already replaced that pool
+            _kill_pool(self._pool)
+            self._pool = None
+            self._generation += 1
+
+    def _replaced(self, generation: int) -> bool:
+        with self._lock:
+            return generation != self._generation
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: float = JOB_TIMEOUT,
+        source: Optional[str] = None,
+    ) -> Job:
+        """
+        source: the file the job works on, named when it times out or crashes.
+        """
+        return Job(self, fn, args, timeout, source)
+
+    def shutdown(self, kill: bool = False) -> None:
+        """
+        kill: terminate the workers too, for callers about to os._exit()
+        (which would otherwise leave them behind).
+        """
+        with self._lock:
+            if self._pool is not None:
+                if kill:
+                    _kill_pool(self._pool)
+                else:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+pipeline = JobPipeline()
+atexit.register(pipeline.shutdown)
@@ -0,0 +1,181 @@
+"""
+Search index for /sonolus/levels/list: an inverted token index over folder
+names plus the library pre-sorted by name and by last modification.
+
+Like the snapshot it belongs to, an index is never mutated once built. The
+scanner publishes a new one per snapshot via updated(), which copies the
+previous index and patches only the touched folders, so neither publishing
+nor a request ever re-sorts or re-tokenizes the whole library. A page is a
+slice of one of the order tuples; a keyword search sorts just its matches,
+by the same keys.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left, insort
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+SORTS = ("name", "modified")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def _index_terms(name: str) -> set:
+    terms = set()
+    for token in tokenize(name):
+        terms.add(token)
+        if not token.isascii():
+            # CJK titles have no spaces to split on; index every suffix so
+            # the prefix match below works as a substring match for them
+            terms.update(token[i:] for i in range(1, len(token)))
+    return terms
+
+
+def _name_key(name: str) -> Tuple[str, str]:
+    # same order the scanner publishes in (lowercased name), ties by name
+    return name.lower(), name
+
+
+def _modified_key(name: str, entry: Mapping[str, Any]) -> Tuple[int, str, str]:
+    # newest first
+    return -(entry.get("modified") or 0), name.lower(), name
+
+
+class LevelIndex:
+    def __init__(
+        self,
+        terms: Dict[str, FrozenSet[str]],
+        sorted_terms: List[str],
+        name_keys: List[tuple],
+        modified_keys: List[tuple],
+        modified_of: Dict[str, tuple],
+    ):
+        self._terms = terms  # term -> folder names
+        self._sorted_terms = sorted_terms  # for prefix lookups
+        self._name_keys = name_keys
+        self._modified_keys = modified_keys
+        self._modified_of = modified_of  # folder name -> its modified_keys key
+        self.by_name: Tuple[str, ...] = tuple(k[-1] for k in name_keys)
+        self.by_modified: Tuple[str, ...] = tuple(k[-1] for k in modified_keys)
+
+    # ----- building -----
+
+    @classmethod
+    def build(cls, levels: Mapping[str, Mapping[str, Any]]) -> "LevelIndex":
+        terms: Dict[str, set] = {}
+        for name in levels:
+            for term in _index_terms(name):
+                terms.setdefault(term, set()).add(name)
+        modified_of = {
+            name: _modified_key(name, entry) for name, entry in levels.items()
+        }
+        return cls(
+            {t: frozenset(names) for t, names in terms.items()},
+            sorted(terms),
+            sorted(_name_key(name) for name in levels),
+            sorted(modified_of.values()),
+            modified_of,
+        )
+
+    def updated(
+        self,
+        old_levels: Mapping[str, Mapping[str, Any]],
+        levels: Mapping[str, Mapping[str, Any]],
+        touched: Iterable[str],
+    ) -> "LevelIndex":
+        """
+        New index for `levels`, given that only `touched` folder names differ
+        from `old_levels` (what this index was built for).
+        """
+        terms = dict(self._terms)
+        sorted_terms = list(self._sorted_terms)
+        name_keys = list(self._name_keys)
+        modified_keys = list(self._modified_keys)
+        modified_of = dict(self._modified_of)
+
+        changed: Dict[str, set] = {}  # term -> its (copied) name set
+
+        def _names_of(term: str) -> set:
+            names = changed.get(term)
+            if names is None:
+                names = changed[term] = set(terms.get(term, ()))
+            return names
+
+        for name in set(touched):
+            old = old_levels.get(name)
+            new = levels.get(name)
+            if old is not None:
+                if new is None:
+                    for term in _index_terms(name):
+                        _names_of(term).discard(name)
+                    _remove(name_keys, _name_key(name))
+                _remove(modified_keys, _modified_key(name, old))
+                modified_of.pop(name, None)
+            if new is not None:
+                if old is None:
+                    for term in _index_terms(name):
+                        _names_of(term).add(name)
+                    insort(name_keys, _name_key(name))
+                key = modified_of[name] = _modified_key(name, new)
+                insort(modified_keys, key)
+
+        for term, names in changed.items():
+            if names:
+                if term not in terms:
+                    insort(sorted_terms, term)
+                terms[term] = frozenset(names)
+            elif terms.pop(term, None) is not None:
+                _remove(sorted_terms, term)
+        return LevelIndex(terms, sorted_terms, name_keys, modified_keys, modified_of)
+
+    # ----- querying -----
+
+    def _prefix_matches(self, token: str) -> FrozenSet[str]:
+        sorted_terms = self._sorted_terms
+        found: set = set()
+        i = bisect_left(sorted_terms, token)
+        while i < len(sorted_terms) and sorted_terms[i].startswith(token):
+            found.update(self._terms[sorted_terms[i]])
+            i += 1
+        return frozenset(found)
+
+    def search(self, keywords: str) -> Optional[FrozenSet[str]]:
+        """
+        Folder names matching every keyword (each one as a word prefix),
+        or None if there are no keywords (everything matches).
+        """
+        tokens = sorted(set(tokenize(keywords)), key=len, reverse=True)
+        if not tokens:
+            return None
+        result: Optional[FrozenSet[str]] = None
+        for token in tokens:
+            matches = self._prefix_matches(token)
+            result = matches if result is None else result & matches
+            if not result:
+                return frozenset()
+        return result
+
+    def order(self, sort: str = "name") -> Tuple[str, ...]:
+        return self.by_modified if sort == "modified" else self.by_name
+
+    def ordered(self, sort: str = "name", keywords: str = "") -> Tuple[str, ...]:
+        matches = self.search(keywords)
+        if matches is None:
+            return self.order(sort)
+        # O(k log k) in the hits, not a pass over the whole library
+        key = self._modified_of.__getitem__ if sort == "modified" else _name_key
+        return tuple(sorted(matches, key=key))
+
+
+def _remove(keys: list, key: Any) -> None:
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+EMPTY_INDEX = LevelIndex({}, [], [], [], {})
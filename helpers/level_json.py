@@ -0,0 +1,357 @@
+"""
+Pre-encoded JSON for /sonolus/levels/info, /list and the detail endpoint.
+
+The engine fragment (engine, skin, effect, particle, ~20 SRLs) is the same
+for every level; it is built and encoded once. Each level's item is encoded
+once per (folder name, id, hashes) and spliced together with the fragment,
+and whole info/list pages are kept per snapshot version, so a request is a
+dict lookup plus a write. Cached bodies also keep their gzip/brotli variants
+(made on first request for that encoding), so those aren't recompressed
+per request either.
+
+Items are only cached once every hash they mention is in the repository
+(otherwise get_srl gives null and that null would stick).
+
+Encoding uses orjson (requirements.txt) and falls back to the json module,
+with the same output, where it isn't installed.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from helpers.compression import maybe_compress
+from helpers.create_level_item import create_engine_data, create_level_item
+from helpers.level_index import SORTS
+from helpers.repository import repo
+from helpers.snapshot import LevelEntry, LevelsSnapshot
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; json gives the same bytes, slower
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Same output as FastAPI's JSONResponse (compact, non-ASCII kept).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+INFO_ITEMS = 20
+ITEMS_PER_PAGE = 10
+MAX_CACHED_SEARCHES = 64
+
+# offered on info and list; the client sends the answers back to /list as
+# ?type=advanced&keywords=...&sort=... (its built-in search box: type=quick)
+SEARCHES = [
+    {
+        "type": "advanced",
+        "title": "#FILTER",
+        "icon": "search",
+        "requireConfirmation": False,
+        "options": [
+            {
+                "query": "keywords",
+                "name": "#KEYWORDS",
+                "required": False,
+                "type": "text",
+                "def": "",
+                "placeholder": "#KEYWORDS",
+                "limit": 0,
+                "shortcuts": [],
+            },
+            {
+                "query": "sort",
+                "name": "#SORT",
+                "required": False,
+                "type": "select",
+                "def": SORTS[0],
+                "values": [
+                    {"name": "name", "title": "#NAME"},
+                    {"name": "modified", "title": "Recently modified"},
+                ],
+            },
+        ],
+    }
+]
+_SEARCHES_JSON = dumps(SEARCHES)
+
+_ENGINE_KEYS = (
+    "thumbnail",
+    "engine_config",
+    "engine_play",
+    "engine_watch",
+    "engine_preview",
+    "engine_tut",
+    "engine_rom",
+    "skin_data",
+    "skin_texture",
+    "bg_data",
+    "bg_config",
+    "bg_image",
+    "sfx_data",
+    "sfx_audio",
+    "particle_data",
+    "particle_texture",
+)
+
+# same checks (and messages) the routes always did, first failure wins
+_REQUIRED = (
+    ("cover", ".png/.jpg/.jpeg???"),
+    ("bgm", ".mp3/.ogg???"),
+    ("data", ".sus/.usc/LevelData/.json/.gz/.mmws/.ccmmws/.unchmmws???"),
+)
+
+
+class EncodedItem(NamedTuple):
+    body: bytes  # the item object, engine included
+    error: Optional[str]  # 400 detail if a required file is missing
+    complete: bool  # every hash resolved; safe to cache
+
+
+class JsonBody(NamedTuple):
+    body: bytes
+    error: Optional[str]  # 400 detail; body is then b""
+    encoding: Optional[str] = None  # Content-Encoding of body, None = identity
+
+
+class _Engine(NamedTuple):
+    key: Tuple[str, ...]
+    data: dict
+    encoded: bytes
+    complete: bool
+
+
+def _entry_hashes(entry: LevelEntry) -> Tuple[Optional[str], ...]:
+    return (
+        entry.get("cover"),
+        entry.get("background"),
+        entry.get("music"),
+        entry.get("score"),
+    )
+
+
+class LevelJsonCache:
+    def __init__(self):
+        self._engine: Optional[_Engine] = None
+        self._items: Dict[tuple, EncodedItem] = {}
+
+        # per snapshot version
+        self._version = -1
+        self._pages: Dict[Any, bytes] = {}
+        self._variants: Dict[tuple, JsonBody] = {}  # (page key, encoding)
+        self._searches: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+
+    # ----- building blocks -----
+
+    def engine(self, files: Mapping[str, str]) -> _Engine:
+        key = tuple(files.get(k) for k in _ENGINE_KEYS)
+        engine = self._engine
+        if engine is not None and engine.key == key and engine.complete:
+            return engine
+        if engine is not None and engine.key != key:
+            # every cached item embeds the old fragment
+            self._items = {}
+            self._pages = {}
+            self._variants = {}
+        data = create_engine_data(files)
+        complete = all(h is not None and repo.has_hash(h) for h in key)
+        engine = self._engine = _Engine(key, data, dumps(data), complete)
+        return engine
+
+    def item(
+        self, files: Mapping[str, str], folder_name: str, entry: LevelEntry
+    ) -> EncodedItem:
+        engine = self.engine(files)
+        key = (folder_name, entry.get("id")) + _entry_hashes(entry)
+        cached = self._items.get(key)
+        if cached is not None and engine.complete:
+            return cached
+
+        item = create_level_item(None, entry, folder_name, engine_data=engine.data)
+        error = None
+        for field, message in _REQUIRED:
+            if item[field] is None:
+                error = f"\n\n{message}\n/levels/{folder_name}"
+                break
+        complete = engine.complete and all(
+            h is None or repo.has_hash(h) for h in _entry_hashes(entry)
+        )
+
+        # the engine is encoded once; splice it in instead of re-encoding it
+        del item["engine"]
+        head = dumps(item)
+        body = b"".join((head[:-1], b',"engine":', engine.encoded, b"}"))
+
+        encoded = EncodedItem(body, error, complete)
+        if complete:
+            self._items[key] = encoded
+        return encoded
+
+    def _sync(self, snapshot: LevelsSnapshot) -> None:
+        if snapshot.version == self._version:
+            return
+        self._version = snapshot.version
+        self._pages = {}
+        self._variants = {}
+        self._searches = {}
+        # forget items of folders that changed or went away
+        if len(self._items) > 2 * max(len(snapshot.levels), 64):
+            live = {
+                (name, entry.get("id")) + _entry_hashes(entry)
+                for name, entry in snapshot.levels.items()
+            }
+            self._items = {k: v for k, v in self._items.items() if k in live}
+
+    def _encode_items(
+        self, snapshot: LevelsSnapshot, files: Mapping[str, str], names
+    ) -> Tuple[bytes, Optional[str], bool]:
+        parts = []
+        complete = True
+        for name in names:
+            encoded = self.item(files, name, snapshot.levels[name])
+            if encoded.error is not None:
+                return b"", encoded.error, False
+            complete = complete and encoded.complete
+            parts.append(encoded.body)
+        return b"[" + b",".join(parts) + b"]", None, complete
+
+    def _encoded(self, key: Any, body: bytes, encoding: Optional[str]) -> JsonBody:
+        """
+        body in `encoding` if that's worth it; key (None: don't keep) names
+        a body that stays the same for this snapshot version.
+        """
+        if encoding is None:
+            return JsonBody(body, None)
+        variant = self._variants.get((key, encoding)) if key is not None else None
+        if variant is None:
+            out = maybe_compress(body, encoding, "application/json", quick=True)
+            variant = (
+                JsonBody(body, None) if out is None else JsonBody(out, None, encoding)
+            )
+            if key is not None:
+                self._variants[(key, encoding)] = variant
+        return variant
+
+    # ----- endpoints -----
+    # encoding: what the client accepts (helpers.compression.negotiate)
+
+    def _ordered(
+        self, snapshot: LevelsSnapshot, sort: str, keywords: str
+    ) -> Tuple[str, ...]:
+        if not keywords:
+            return snapshot.search.order(sort)
+        key = (sort, keywords)
+        names = self._searches.get(key)
+        if names is None:
+            if len(self._searches) >= MAX_CACHED_SEARCHES:
+                self._searches = {}
+            names = self._searches[key] = snapshot.search.ordered(sort, keywords)
+        return names
+
+    def info(
+        self,
+        snapshot: LevelsSnapshot,
+        files: Mapping[str, str],
+        encoding: Optional[str] = None,
+    ) -> JsonBody:
+        self._sync(snapshot)
+        cached = self._pages.get("info")
+        if cached is not None:
+            return self._encoded("info", cached, encoding)
+
+        items, error, complete = self._encode_items(
+            snapshot, files, snapshot.search.by_name[:INFO_ITEMS]
+        )
+        if error is not None:
+            return JsonBody(b"", error)
+        banner = repo.get_srl(files["banner"])
+        body = b"".join(
+            (
+                b'{"searches":',
+                _SEARCHES_JSON,
+                b',"sections":[{"title":"#LEVEL","itemType":"level","items":',
+                items,
+                b'}],"banner":',
+                dumps(banner),
+                b"}",
+            )
+        )
+        if complete and banner is not None:
+            self._pages["info"] = body
+            return self._encoded("info", body, encoding)
+        return self._encoded(None, body, encoding)
+
+    def list_page(
+        self,
+        snapshot: LevelsSnapshot,
+        files: Mapping[str, str],
+        page: int,
+        sort: str = "name",
+        keywords: str = "",
+        encoding: Optional[str] = None,
+    ) -> JsonBody:
+        self._sync(snapshot)
+        if sort not in SORTS:
+            sort = SORTS[0]
+        keywords = " ".join(keywords.split())
+        # keyword pages aren't kept (unbounded); their filtered order is
+        page_key = None if keywords else (sort, page)
+        cached = self._pages.get(page_key)
+        if cached is not None:
+            return self._encoded(page_key, cached, encoding)
+
+        names = self._ordered(snapshot, sort, keywords)
+        page_count = (len(names) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+        start = page * ITEMS_PER_PAGE
+        items, error, complete = self._encode_items(
+            snapshot, files, names[start : start + ITEMS_PER_PAGE]
+        )
+        if error is not None:
+            return JsonBody(b"", error)
+        body = b'{"pageCount":%d,"items":%s,"searches":%s}' % (
+            page_count,
+            items,
+            _SEARCHES_JSON,
+        )
+        # only real pages, so arbitrary ?page=N can't grow this
+        if page_key is not None and complete and 0 <= page < max(page_count, 1):
+            self._pages[page_key] = body
+            return self._encoded(page_key, body, encoding)
+        return self._encoded(None, body, encoding)
+
+    def detail(
+        self,
+        snapshot: LevelsSnapshot,
+        files: Mapping[str, str],
+        item_name: str,
+        encoding: Optional[str] = None,
+    ) -> Optional[JsonBody]:
+        """
+        None if there is no such level.
+        """
+        found = snapshot.find(item_name)
+        if not found:
+            return None
+        self._sync(snapshot)
+        encoded = self.item(files, found[0], found[1])
+        if encoded.error is not None:
+            return JsonBody(b"", encoded.error)
+        body = b"".join(
+            (
+                b'{"item":',
+                encoded.body,
+                b',"actions":[],"hasCommunity":false,'
+                b'"leaderboards":[],"sections":[]}',
+            )
+        )
+        key = ("detail", found[0]) if encoded.complete else None
+        return self._encoded(key, body, encoding)
+
+
+level_json = LevelJsonCache()
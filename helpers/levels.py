@@ -2,35 +2,60 @@
 
 from __future__ import annotations
 
+import functools
 import gzip
+import importlib
+import io
+import itertools
 import json
 import os
+import tempfile
 import threading
 import time
 import traceback
 import uuid
+import zlib
+from collections import deque
+from importlib import metadata
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
-
-from PIL import Image
-
-import sonolus_converters
-
-from helpers.background import render_png
+from types import MappingProxyType
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from helpers.background import BACKGROUND_GENERATOR, RENDER_REVISION, render_png
+from helpers import metrics, profiling
+from helpers.derived_cache import DerivedCache, DerivedEntry, get_derived_cache
+from helpers.jobs import CompletedJob, Job, pipeline
 from helpers.repository import repo
-
+from helpers.repository_index import get_repository_index
+from helpers.sha1 import calculate_sha1
+from helpers.snapshot import LevelEntry, current_snapshot, publish_snapshot
+from helpers.state_store import get_state_store
 
 # -----------------------------
-# Global: stale-return cache + single-writer gate
+# Global: single-writer gate (readers use helpers.snapshot)
 # -----------------------------
 
 _LEVELS_SCAN_LOCK = threading.Lock()
-_LAST_LEVELS_RESULT: Dict[str, Dict[str, Optional[str]]] = {}
-_HAS_LAST_LEVELS_RESULT = False
 
+# folders with a running missing-grace timer or a failed confirm waiting for
+# its retry; they must be revisited even when the watcher reports nothing,
+# otherwise the timer would never expire
+_PENDING_FOLDERS: Set[str] = set()
 
-def _clone_last_result() -> Dict[str, Dict[str, Optional[str]]]:
-    return {k: dict(v) for k, v in _LAST_LEVELS_RESULT.items()}
+
+def has_pending_folders() -> bool:
+    return bool(_PENDING_FOLDERS)
 
 
 # -----------------------------
@@ -47,44 +72,110 @@ def _print_exc(e: BaseException) -> None:
 # -----------------------------
 
 
-def _repo_map() -> Optional[dict]:
-    return getattr(repo, "_map", None)
-
-
 def _repo_has_hash(h: Optional[str]) -> bool:
     if not h:
         return False
-    m = _repo_map()
-    if m is None:
-        return False
-    return h in m
+    return repo.has_hash(h)
 
 
 def _repo_is_empty() -> bool:
-    m = _repo_map()
-    if m is None:
-        return False
-    try:
-        return len(m) == 0
-    except TypeError:
-        return False
+    return len(repo) == 0
+
+
+_HASH_KEYS = ("cover_hash", "background_hash", "music_hash", "converted_score_hash")
+
+
+# hash keys that come from a file in the folder itself (the others point into
+# the derived caches, which folders share anyway)
+_SOURCE_RELS = {"cover_hash": "cover_rel", "music_hash": "music_rel"}
 
 
-def _repo_del_hash(h: Optional[str]) -> None:
+class _HashRefs:
     """
-    Delete from repo._map directly (as requested), but ONLY when:
+    hash -> (folder id, state key) of every committed folder state holding it.
+    Identical files in two folders share a hash, and partial scans never
+    re-warm the other folder, so dropping a hash has to know who else still
+    uses it.
+    """
+
+    def __init__(self, folders_cache: Dict[str, Any]):
+        self.folders = folders_cache
+        self._refs: Dict[str, Set[Tuple[str, str]]] = {}
+        for folder_id, state in folders_cache.items():
+            self.update(folder_id, {}, state)
+
+    def update(
+        self, folder_id: str, before: Mapping[str, Any], after: Mapping[str, Any]
+    ) -> None:
+        for key in _HASH_KEYS:
+            old, new = before.get(key), after.get(key)
+            if old == new:
+                continue
+            if old is not None:
+                users = self._refs.get(old)
+                if users is not None:
+                    users.discard((folder_id, key))
+                    if not users:
+                        del self._refs[old]
+            if new is not None:
+                self._refs.setdefault(new, set()).add((folder_id, key))
+
+    def others(self, h: str, folder_id: str) -> List[Tuple[str, str]]:
+        return [ref for ref in self._refs.get(h, ()) if ref[0] != folder_id]
+
+
+def _norm_path(path: str | Path) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+_REFS: Optional[Tuple[Any, _HashRefs]] = None  # (state store, its refs)
+
+
+def _hash_refs(store) -> _HashRefs:
+    global _REFS
+    if _REFS is None or _REFS[0] is not store:
+        _REFS = (store, _HashRefs(store.folders))
+    return _REFS[1]
+
+
+def _repo_del_hash(
+    h: Optional[str], refs: _HashRefs, folder_id: str, levels_dir: Path
+) -> None:
+    """
+    Delete from the repo, but ONLY when:
       - asset confirmed deleted (>10s missing), OR
       - asset confirmed replaced (new hash confirmed)
+    and no other folder still references the same hash. If one does, the
+    entry is moved to that folder's copy when it was this folder's file.
     """
     if not h:
         return
-    m = _repo_map()
-    if m is None:
+    others = refs.others(h, folder_id)
+    if not others:
+        repo.remove_hash(h)
         return
-    try:
-        del m[h]
-    except KeyError:
-        pass
+
+    current = repo.get_file_path(h)
+    if current is None:
+        return  # a zip member; not this folder's to lose
+    name = refs.folders.get(folder_id, {}).get("name")
+    own = name is not None and os.path.dirname(_norm_path(current)) == _norm_path(
+        levels_dir / name
+    )
+    if not own and os.path.isfile(current):
+        return  # backed by a file that stays (another folder's, a derived blob)
+
+    for other_id, key in others:
+        state = refs.folders.get(other_id, {})
+        rel = state.get(_SOURCE_RELS.get(key, ""))
+        if rel and (levels_dir / rel).is_file() and repo.relocate(h, levels_dir / rel):
+            return
+    # no other copy on disk: drop it; the folders still naming it re-warm
+    repo.remove_hash(h)
+    for other_id, _key in others:
+        name = refs.folders.get(other_id, {}).get("name")
+        if name:
+            _PENDING_FOLDERS.add(name)
 
 
 # -----------------------------
@@ -103,170 +194,348 @@ _SCORE_EXTS = {
 }
 
 
-def _is_candidate_score_file(path: Path) -> bool:
-    return path.is_file() and path.suffix.lower() in _SCORE_EXTS
+# bump when convert_score's output changes, so cached conversions are redone
+_CONVERT_REVISION = 2
 
 
-def convert_score_to_cache(score_path: Path, out_path_no_ext: Path) -> bool:
+def _installed_version(top: str) -> str:
     """
-    IMPORTANT (per your requirement): open in read mode ("r"), not read_bytes().
+    Release of the package that provides the top-level module `top`, plus the
+    git commit it was installed from (ours come straight from git, often
+    without a version bump). Reads package metadata only, so the module
+    itself isn't imported unless it has no metadata.
     """
-    out_path_no_ext.parent.mkdir(parents=True, exist_ok=True)
-
     try:
-        with score_path.open("r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
-        data = text.encode("utf-8", errors="ignore")
-    except Exception as e:
-        _print_exc(e)
-        return False
+        dists = metadata.packages_distributions().get(top) or [top]
+    except AttributeError:  # python < 3.10
+        dists = [top]
+    for dist in dists:
+        try:
+            version = metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            continue
+        try:
+            direct_url = json.loads(
+                metadata.distribution(dist).read_text("direct_url.json") or "{}"
+            )
+            commit = (direct_url.get("vcs_info") or {}).get("commit_id")
+        except Exception:
+            commit = None
+        if commit:
+            version = f"{version}+{commit[:12]}"
+        return version
+    try:
+        return str(getattr(importlib.import_module(top), "__version__", "unknown"))
+    except ImportError:
+        return "unknown"
+
+
+@functools.lru_cache(maxsize=None)
+def _converter_version() -> str:
+    # part of the conversion cache key
+    return f"{_installed_version('sonolus_converters')}/r{_CONVERT_REVISION}"
+
 
+@functools.lru_cache(maxsize=None)
+def _renderer_version() -> str:
+    # part of the background render cache key
+    return f"{_installed_version(BACKGROUND_GENERATOR)}/r{RENDER_REVISION}"
+
+
+# detect() wants the whole file decoded; these are certain from the name or
+# the first bytes alone (a wrong guess still falls back to detect())
+_SCORE_EXT_FORMATS = {
+    ".sus": ("sus",),
+    ".usc": ("usc",),
+    ".mmws": ("mmw",),
+    ".ccmmws": ("mmw",),
+    ".unchmmws": ("mmw",),
+}
+_GZIP_MAGIC = b"\x1f\x8b"
+_LEVEL_DATA_HEAD = 4096  # decompressed bytes looked at before serving a .gz as is
+
+
+def _is_level_data_gzip(raw: bytes) -> bool:
+    """
+    Whether raw is gzipped LevelData JSON, judged by its first few KiB: any
+    other gzipped file (a compressed .sus, an archive) must go to detect().
+    """
+    if not raw.startswith(_GZIP_MAGIC):
+        return False
     try:
-        detection = sonolus_converters.detect(data)
-    except Exception as e:
-        _print_exc(e)
+        head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(raw, _LEVEL_DATA_HEAD)
+    except zlib.error:
         return False
+    head = head.lstrip()
+    return head.startswith(b"{") and (b'"entities"' in head or b'"bgmOffset"' in head)
+
+
+def _sniff_score_format(name: str, raw: bytes) -> Optional[Tuple[str, ...]]:
+    if _is_level_data_gzip(raw):
+        return ("lvd", "compress_pysekai")
+    return _SCORE_EXT_FORMATS.get(os.path.splitext(name)[1].lower())
 
-    if not detection:
-        return False
 
+def _text_stream(raw: bytes) -> io.TextIOWrapper:
+    # exactly what open(path, "r", encoding="utf-8", errors="ignore") hands
+    # the loaders (newline translation included), minus the second read
+    return io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8", errors="ignore")
+
+
+def _parse(loader: Any, raw: bytes) -> Any:
+    with profiling.phase("parse"):
+        return loader.load(_text_stream(raw))
+
+
+def _export_level_data(score: Any) -> bytes:
+    with profiling.phase("export"):
+        return _export(score)
+
+
+def _export(score: Any) -> bytes:
+    import sonolus_converters
+
+    buf = io.BytesIO()
     try:
-        kind = detection[0]
+        sonolus_converters.LevelData.next_sekai.export(buf, score, as_compressed=True)
+        return buf.getvalue()
+    except (TypeError, AttributeError):
+        pass  # converters that only export to a path
 
-        if kind == "sus":
-            with score_path.open("r", encoding="utf-8", errors="ignore") as fp:
-                score = sonolus_converters.sus.load(fp)
-            sonolus_converters.LevelData.next_sekai.export(
-                out_path_no_ext, score, as_compressed=True
-            )
-            return True
+    fd, tmp = tempfile.mkstemp(prefix="levels-export-")
+    os.close(fd)
+    try:
+        sonolus_converters.LevelData.next_sekai.export(
+            Path(tmp), score, as_compressed=True
+        )
+        return Path(tmp).read_bytes()
+    finally:
+        os.unlink(tmp)
 
-        if kind == "mmw":
-            with score_path.open("r", encoding="utf-8", errors="ignore") as fp:
-                score = sonolus_converters.mmws.load(fp)
-            sonolus_converters.LevelData.next_sekai.export(
-                out_path_no_ext, score, as_compressed=True
-            )
-            return True
 
-        if kind == "usc":
-            with score_path.open("r", encoding="utf-8", errors="ignore") as fp:
-                score = sonolus_converters.usc.load(fp)
-            sonolus_converters.LevelData.next_sekai.export(
-                out_path_no_ext, score, as_compressed=True
-            )
-            return True
+def _convert_as(detection: Tuple[str, ...], raw: bytes) -> Optional[Tuple[str, bytes]]:
+    # imported by the job workers that convert, never at server startup
+    import sonolus_converters
 
-        if kind == "lvd":
-            variant = detection[1] if len(detection) > 1 else None
+    kind = detection[0]
 
-            if variant == "compress_pysekai":
-                out_path_no_ext.write_bytes(data)
-                return True
+    if kind == "sus":
+        return kind, _export_level_data(_parse(sonolus_converters.sus, raw))
 
-            if variant == "pysekai":
-                out_path_no_ext.write_bytes(gzip.compress(data))
-                return True
+    if kind == "mmw":
+        return kind, _export_level_data(_parse(sonolus_converters.mmws, raw))
 
-            return False
+    if kind == "usc":
+        return kind, _export_level_data(_parse(sonolus_converters.usc, raw))
 
-        return False
+    if kind == "lvd":
+        variant = detection[1] if len(detection) > 1 else None
 
+        if variant == "compress_pysekai":
+            # already what we serve
+            if not _is_level_data_gzip(raw):
+                return None
+            return f"lvd:{variant}", raw
+
+        if variant == "pysekai":
+            text = _text_stream(raw).read().encode("utf-8", errors="ignore")
+            # mtime=0: same input, same bytes, same hash
+            return f"lvd:{variant}", gzip.compress(text, mtime=0)
+
+    return None
+
+
+def convert_score(raw: bytes, name: str = "") -> Optional[Tuple[str, bytes]]:
+    """
+    Converts a score already in memory to compressed next_sekai LevelData.
+
+    Returns (detected format, e.g. "sus" or "lvd:pysekai", LevelData bytes)
+    or None if it isn't a score we understand.
+    """
+    sniffed = _sniff_score_format(name, raw)
+    if sniffed is not None:
+        try:
+            converted = _convert_as(sniffed, raw)
+            if converted is not None:
+                return converted
+        except Exception:
+            pass  # misnamed file; let detect() have a go
+
+    try:
+        import sonolus_converters
+
+        data = _text_stream(raw).read().encode("utf-8", errors="ignore")
+        detection = sonolus_converters.detect(data)
+        if not detection or tuple(detection) == sniffed:
+            return None
+        return _convert_as(tuple(detection), raw)
     except Exception as e:
         _print_exc(e)
-        return False
+        return None
+
+
+def convert_score_to_cache(score_path: Path, out_path_no_ext: Path) -> Optional[str]:
+    """
+    File-to-file wrapper around convert_score(). Returns the detected format.
+    """
+    try:
+        converted = convert_score(score_path.read_bytes(), score_path.name)
+    except OSError as e:
+        _print_exc(e)
+        return None
+    if converted is None:
+        return None
+    out_path_no_ext.parent.mkdir(parents=True, exist_ok=True)
+    out_path_no_ext.write_bytes(converted[1])
+    return converted[0]
 
 
 # -----------------------------
-# Cache helpers
+# Folder scanning (one scandir pass per folder + fingerprint fast path)
 # -----------------------------
 
+_COVER_SUFFIXES = {".png", ".jpg", ".jpeg"}
+_MUSIC_SUFFIXES = {".mp3", ".ogg"}
 
-def _ensure_cache_json(cache_dir: Path) -> Path:
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    cache_path = cache_dir / "cache.json"
-    if not cache_path.exists():
-        cache_path.write_text(
-            json.dumps(
-                {
-                    "mtimes": {},
-                    "folders": {},  # uuid -> folder_state
-                    "folder_ids": {},  # folder_name -> uuid
-                },
-                indent=2,
-                sort_keys=True,
-            ),
-            encoding="utf-8",
-        )
-    return cache_path
+_KINDS = ("cover", "music", "score")
 
 
-def _load_cache(cache_path: Path) -> Dict[str, Any]:
-    try:
-        data = json.loads(cache_path.read_text(encoding="utf-8"))
-    except Exception as e:
-        _print_exc(e)
-        data = {}
-    if not isinstance(data, dict):
-        data = {}
-    data.setdefault("mtimes", {})
-    data.setdefault("folders", {})
-    data.setdefault("folder_ids", {})
-    return data
+class _Candidate(NamedTuple):
+    name: str
+    size: int
+    mtime_ns: int
 
 
-def _save_cache(cache_path: Path, cache: Dict[str, Any]) -> None:
-    cache_path.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+def _kind_of(name: str) -> Optional[str]:
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in _COVER_SUFFIXES:
+        return "cover"
+    if suffix in _MUSIC_SUFFIXES:
+        return "music"
+    if suffix in _SCORE_EXTS:
+        return "score"
+    return None
 
 
-def _safe_mtime(path: Path) -> Optional[float]:
+def _scan_folder(folder_dir: Path) -> Optional[Tuple[int, Dict[str, list]]]:
+    """
+    Single os.scandir pass: sorts the folder's files into cover / music / score
+    candidates, each sorted by lowercased name.
+
+    Returns (dir mtime_ns, {kind: [_Candidate, ...]}) or None if the folder is gone.
+    """
+    candidates: Dict[str, list] = {k: [] for k in _KINDS}
     try:
-        return path.stat().st_mtime
+        dir_mtime_ns = os.stat(folder_dir).st_mtime_ns
+        with os.scandir(folder_dir) as it:
+            for entry in it:
+                kind = _kind_of(entry.name)
+                if kind is None:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                candidates[kind].append(
+                    _Candidate(entry.name, st.st_size, st.st_mtime_ns)
+                )
     except OSError:
         return None
 
+    for cands in candidates.values():
+        cands.sort(key=lambda c: c.name.lower())
+    return dir_mtime_ns, candidates
 
-def _scan_mtimes(levels_dir: Path) -> Dict[str, float]:
-    mtimes: Dict[str, float] = {}
-    root_mtime = _safe_mtime(levels_dir)
-    if root_mtime is not None:
-        mtimes["."] = float(root_mtime)
 
-    for dirpath, _, filenames in os.walk(levels_dir):
-        dpath = Path(dirpath)
-        rel_dir = dpath.relative_to(levels_dir).as_posix() or "."
-        d_mtime = _safe_mtime(dpath)
-        if d_mtime is not None:
-            mtimes[rel_dir] = float(d_mtime)
+def _pick_candidate(
+    cands: list, folder_name: str, committed_rel: Optional[str]
+) -> Optional[_Candidate]:
+    # If the old committed rel still exists, prefer it; otherwise pick the first
+    # available.
+    if committed_rel:
+        for c in cands:
+            if f"{folder_name}/{c.name}" == committed_rel:
+                return c
+    return cands[0] if cands else None
 
-        for name in filenames:
-            fpath = dpath / name
-            rel_file = fpath.relative_to(levels_dir).as_posix()
-            f_mtime = _safe_mtime(fpath)
-            if f_mtime is not None:
-                mtimes[rel_file] = float(f_mtime)
 
-    return mtimes
-
-
-# -----------------------------
-# Listing helpers (non-sticky for “replacement confirmed”)
-# -----------------------------
+def _make_fingerprint(
+    dir_mtime_ns: int, picked: Dict[str, Optional[_Candidate]]
+) -> Dict[str, Any]:
+    fp: Dict[str, Any] = {"dir": dir_mtime_ns}
+    for kind in _KINDS:
+        c = picked[kind]
+        fp[kind] = list(c) if c is not None else None
+    return fp
 
 
-def _first_matching_file(
-    folder_dir: Path, *, suffixes: set[str] | None = None, predicate=None
-) -> Optional[Path]:
+def _fingerprint_unchanged(folder_dir: Path, fp: Optional[Dict[str, Any]]) -> bool:
+    """
+    Directory mtime only moves when entries are added/removed/renamed, so if it
+    is unchanged the candidate choice is too; then only the picked candidates
+    need a stat to catch in-place rewrites. No scandir, no other files touched.
+    """
+    if not fp:
+        return False
     try:
-        files = [p for p in folder_dir.iterdir() if p.is_file()]
-    except Exception:
-        return None
-    if suffixes is not None:
-        files = [p for p in files if p.suffix.lower() in suffixes]
-    if predicate is not None:
-        files = [p for p in files if predicate(p)]
-    files.sort(key=lambda p: p.name.lower())
-    return files[0] if files else None
+        if os.stat(folder_dir).st_mtime_ns != fp.get("dir"):
+            return False
+        for kind in _KINDS:
+            c = fp.get(kind)
+            if c is None:
+                continue
+            st = os.stat(folder_dir / c[0])
+            if st.st_size != c[1] or st.st_mtime_ns != c[2]:
+                return False
+    except OSError:
+        return False
+    return True
+
+
+def _candidate_changed(
+    fp: Optional[Dict[str, Any]], kind: str, cand: _Candidate
+) -> bool:
+    return (fp or {}).get(kind) != list(cand)
+
+
+def _modified_ns(fp: Optional[Dict[str, Any]]) -> int:
+    # newest of the folder itself and its picked files ("recently modified" sort)
+    if not fp:
+        return 0
+    times = [fp.get("dir") or 0]
+    times.extend(fp[kind][2] for kind in _KINDS if fp.get(kind))
+    return max(times)
+
+
+def _committed_entry(folder_id: str, folder_state: Dict[str, Any]) -> LevelEntry:
+    # read-only: entries are shared between published snapshots
+    return MappingProxyType(
+        {
+            "id": folder_id,
+            "score": folder_state.get("converted_score_hash"),
+            "cover": folder_state.get("cover_hash"),
+            "background": folder_state.get("background_hash"),
+            "music": folder_state.get("music_hash"),
+            "modified": _modified_ns(folder_state.get("fingerprint")),
+        }
+    )
+
+
+def _can_skip_folder(
+    folder_dir: Path, folder_state: Dict[str, Any], repo_empty: bool, now: float
+) -> bool:
+    if any(folder_state.get(_missing_key(k)) is not None for k in _KINDS):
+        return False
+    retry_at = folder_state.get("retry_at")
+    if retry_at is not None and now >= retry_at:
+        return False
+    for key in _HASH_KEYS:
+        h = folder_state.get(key)
+        if h is not None and (repo_empty or not _repo_has_hash(h)):
+            return False
+    return _fingerprint_unchanged(folder_dir, folder_state.get("fingerprint"))
 
 
 # -----------------------------
@@ -297,16 +566,237 @@ def _missing_too_long(folder_state: Dict[str, Any], prefix: str, now: float) ->
     return (now - float(since)) >= _GRACE_SECONDS
 
 
+# -----------------------------
+# Failed-confirm retry logic
+# -----------------------------
+
+# a candidate whose confirm failed (unreadable image, converter error, a job
+# that timed out) leaves the folder's fingerprint saved; without a retry the
+# folder would be skipped until something in it changes
+_RETRY_FIRST = 5.0
+_RETRY_MAX = 300.0
+
+
+def _uncommitted_kinds(
+    folder_state: Dict[str, Any],
+    folder_name: str,
+    picked: Dict[str, Optional[_Candidate]],
+) -> List[str]:
+    kinds = []
+    for kind in _KINDS:
+        cand = picked[kind]
+        if cand is None:
+            continue
+        rel_key, hash_keys = _CONFIRM_KEYS[kind]
+        if folder_state.get(rel_key) != f"{folder_name}/{cand.name}" or any(
+            folder_state.get(k) is None for k in hash_keys
+        ):
+            kinds.append(kind)
+    return kinds
+
+
+def _schedule_retry(folder_state: Dict[str, Any], now: float) -> None:
+    delay = folder_state.get("retry_delay")
+    delay = _RETRY_FIRST if delay is None else min(delay * 2, _RETRY_MAX)
+    folder_state["retry_delay"] = delay
+    folder_state["retry_at"] = now + delay
+
+
+def _clear_retry(folder_state: Dict[str, Any]) -> None:
+    folder_state.pop("retry_delay", None)
+    folder_state.pop("retry_at", None)
+
+
 # -----------------------------
 # Atomic confirm helpers
 # -----------------------------
 
 
+def _store_result(data: bytes, out_path: str) -> str:
+    """
+    Hashes while the bytes are still in memory, then writes them once;
+    DerivedCache.put and repo.add_file take the hash as given.
+    """
+    with profiling.phase("hash"):
+        result_sha1 = calculate_sha1(data)
+    with profiling.phase("write"):
+        with open(out_path, "wb") as f:
+            f.write(data)
+    return result_sha1
+
+
+def _read_source(path: str) -> Optional[bytes]:
+    try:
+        with profiling.phase("read"):
+            return Path(path).read_bytes()
+    except OSError:
+        return None  # gone or locked since it was hashed; the next scan retries
+
+
+def _render_background_job(
+    cover_path: str, bg_version: str, out_path: str
+) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Runs in a helpers.jobs worker process.
+    Returns (cover sha1, bg_version, out_path, result sha1) for DerivedCache.put.
+    """
+    from PIL import Image
+
+    cover = _read_source(cover_path)
+    if cover is None:
+        return None
+
+    # confirm image is readable and fully written
+    with Image.open(io.BytesIO(cover)) as im:
+        with profiling.phase("decode"):
+            im = im.convert("RGBA")
+        with profiling.phase("render"):
+            bg = render_png(bg_version, im)
+    buf = io.BytesIO()
+    with profiling.phase("encode"):
+        bg.save(buf, format="PNG")
+    return (
+        calculate_sha1(cover),
+        bg_version,
+        out_path,
+        _store_result(buf.getvalue(), out_path),
+    )
+
+
+def _convert_score_job(
+    score_path: str, name: str, out_path: str
+) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Runs in a helpers.jobs worker process.
+    Returns (source sha1, format, out_path, result sha1) for DerivedCache.put.
+    """
+    raw = _read_source(score_path)
+    if raw is None:
+        return None
+    converted = convert_score(raw, name)
+    if converted is None:
+        return None
+    fmt, level_data = converted
+    return calculate_sha1(raw), fmt, out_path, _store_result(level_data, out_path)
+
+
+# (cache name, source sha1, params) -> job already queued by this scan, so
+# folders sharing a cover or score (difficulty variants) render/convert it once
+_Inflight = Dict[Tuple[str, str, Optional[str]], Job]
+
+
+def _submit_cached(
+    cache: DerivedCache,
+    source_path: Path,
+    params: Optional[str],
+    inflight: _Inflight,
+    fn: Any,
+    *args: Any,
+) -> Job | CompletedJob:
+    """
+    Cache hit (same bytes seen before: touched, re-saved, reverted, copied
+    from another folder) => CompletedJob holding the DerivedEntry; otherwise
+    fn(source path, *args, tmp_path) on the pipeline. Only the hash is taken
+    here; the worker reads the file itself, so queued jobs hold a path rather
+    than the bytes, and it returns the hash of what it actually read.
+    """
+    try:
+        with profiling.phase("hash"):
+            source_sha1 = calculate_sha1(source_path)
+    except OSError:
+        return CompletedJob(None)  # gone or locked; the next scan retries
+
+    entry = cache.get(source_sha1, params)
+    if entry is not None:
+        return CompletedJob(entry)
+    key = (cache.name, source_sha1, params)
+    if key not in inflight:
+        inflight[key] = pipeline.submit(
+            fn, os.path.abspath(source_path), *args, str(cache.new_tmp_path())
+        )
+    return inflight[key]
+
+
+def _resolve_cached(
+    cache: DerivedCache, job: Job | CompletedJob
+) -> Optional[DerivedEntry]:
+    with profiling.phase("wait"):
+        result = job.result()
+    if not result:
+        return None
+    if isinstance(result, DerivedEntry):
+        return result
+    source_sha1, params, tmp_path, result_sha1 = result
+    if job.elapsed is not None and not job.observed:
+        job.observed = True  # folders sharing the job count it once
+        metrics.job_seconds.observe(job.elapsed, (cache.name, params))
+    with profiling.phase("cache_put"):
+        return cache.put(source_sha1, params, tmp_path, result_sha1)
+
+
+def _submit_background(
+    cover_path: Path,
+    bg_version: str,
+    cache: DerivedCache,
+    inflight: Optional[_Inflight] = None,
+) -> Job | CompletedJob:
+    return _submit_cached(
+        cache,
+        cover_path,
+        bg_version,
+        {} if inflight is None else inflight,
+        _render_background_job,
+        bg_version,
+    )
+
+
+def _submit_score(
+    score_path: Path, cache: DerivedCache, inflight: Optional[_Inflight] = None
+) -> Job | CompletedJob:
+    # the format is only known once converted, so look up by source alone
+    return _submit_cached(
+        cache,
+        score_path,
+        None,
+        {} if inflight is None else inflight,
+        _convert_score_job,
+        score_path.name,
+    )
+
+
+# written per folder before the shared caches existed
+_LEGACY_CACHE_FILES = (
+    "background.png",
+    "background.png.tmp",
+    "converted_score",
+    "converted_score.tmp",
+)
+
+
+def _drop_legacy_cache_files(folder_cache_dir: Path) -> None:
+    if not folder_cache_dir.is_dir():
+        return
+    for name in _LEGACY_CACHE_FILES:
+        path = folder_cache_dir / name
+        # still served for another folder with identical bytes => keep for now
+        if repo.get_hash_from_file_path(path) is not None:
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    try:
+        folder_cache_dir.rmdir()  # only goes if that emptied it
+    except OSError:
+        pass
+
+
 def _confirm_cover_and_background(
     *,
     cover_path: Path,
     bg_version: str,
-    folder_cache_dir: Path,
+    cache: DerivedCache,
+    job: Job | CompletedJob | None = None,
 ) -> Optional[Tuple[str, str]]:
     """
     Replacement-confirmation for cover:
@@ -314,28 +804,26 @@ def _confirm_cover_and_background(
       - background generation must succeed
       - both cover and background must be add_file()'d successfully
 
+    The render itself is a pipeline job (usually submitted ahead by the scan
+    pass) or a hit in the shared background cache, which the background is
+    then served from.
+
     Returns (cover_hash, background_hash) on success, else None.
     """
     try:
-        folder_cache_dir.mkdir(parents=True, exist_ok=True)
-
-        # confirm image is readable and fully written
-        with Image.open(cover_path) as im:
-            im = im.convert("RGBA")
-            bg = render_png(bg_version, im)
-
-        background_path = folder_cache_dir / "background.png"
-
-        # write background
-        try:
-            bg.save(background_path, format="PNG")
-        except Exception as e:
-            _print_exc(e)
+        if job is None:
+            job = _submit_background(cover_path, bg_version, cache)
+        entry = _resolve_cached(cache, job)
+        if entry is None:
             return None
 
-        # repo add_file confirmations
-        cover_hash = repo.add_file(str(cover_path))
-        bg_hash = repo.add_file(str(background_path))
+        # repo add_file confirmations; the render (or the cache hit) already
+        # hashed the cover, so it isn't read again
+        with profiling.phase("add_file"):
+            cover_hash = repo.add_file(str(cover_path), sha1=entry.source_sha1)
+            bg_hash = repo.add_file(
+                str(cache.blob_path(entry.result_sha1)), sha1=entry.result_sha1
+            )
         return cover_hash, bg_hash
 
     except Exception as e:
@@ -345,23 +833,114 @@ def _confirm_cover_and_background(
 
 def _confirm_music(*, music_path: Path) -> Optional[str]:
     try:
-        return repo.add_file(str(music_path))
+        with profiling.phase("add_file"):
+            return repo.add_file(str(music_path))
     except Exception as e:
         _print_exc(e)
         return None
 
 
-def _confirm_score(*, score_path: Path, converted_score_path: Path) -> Optional[str]:
+def _confirm_score(
+    *,
+    score_path: Path,
+    cache: DerivedCache,
+    job: Job | CompletedJob | None = None,
+) -> Optional[str]:
+    """
+    The converted score is served straight from the conversion cache, so a
+    cache hit costs one add_file and nothing else.
+    """
     try:
-        ok = convert_score_to_cache(score_path, converted_score_path)
-        if not ok or not converted_score_path.exists():
+        if job is None:
+            job = _submit_score(score_path, cache)
+        entry = _resolve_cached(cache, job)
+        if entry is None:
             return None
-        return repo.add_file(str(converted_score_path))
+        with profiling.phase("add_file"):
+            return repo.add_file(
+                str(cache.blob_path(entry.result_sha1)), sha1=entry.result_sha1
+            )
     except Exception as e:
         _print_exc(e)
         return None
 
 
+_CONFIRM_KEYS = {
+    "cover": ("cover_rel", ("cover_hash", "background_hash")),
+    "music": ("music_rel", ("music_hash",)),
+    "score": ("score_rel", ("converted_score_hash",)),
+}
+
+
+def _should_confirm(
+    kind: str,
+    folder_state: Dict[str, Any],
+    folder_name: str,
+    cand: _Candidate,
+    prev_fp: Optional[Dict[str, Any]],
+    repo_empty: bool,
+) -> bool:
+    """
+    Attempt a confirm swap if:
+      - different file than committed, OR
+      - same file but size/mtime changed, OR
+      - repo warm needed, OR
+      - no committed hash yet
+    """
+    rel_key, hash_keys = _CONFIRM_KEYS[kind]
+    committed_hash = folder_state.get(hash_keys[0])
+    needs_warm = (committed_hash is not None) and (
+        repo_empty or not _repo_has_hash(committed_hash)
+    )
+    return (
+        (f"{folder_name}/{cand.name}" != folder_state.get(rel_key))
+        or _candidate_changed(prev_fp, kind, cand)
+        or needs_warm
+        or any(folder_state.get(k) is None for k in hash_keys)
+    )
+
+
+class _FolderWork(NamedTuple):
+    folder_dir: Path
+    folder_id: str
+    folder_state: Dict[str, Any]
+    state_before: Dict[str, Any]
+    dir_mtime_ns: int
+    picked: Dict[str, Optional[_Candidate]]
+    prev_fp: Optional[Dict[str, Any]]
+    confirm: Dict[str, bool]
+    jobs: Dict[str, Job | CompletedJob]
+
+
+# changed folders pass 1 may run ahead of pass 2 (bounds queued jobs; those
+# hold source paths, not bytes)
+_LOOKAHEAD = 256
+_PUBLISH_EVERY = 1.0  # seconds between progress publishes during a scan
+_REPORT_EVERY = 5.0  # seconds between progress lines
+
+
+def _lookahead(items: Iterator[_FolderWork], size: int) -> Iterator[_FolderWork]:
+    window = deque(itertools.islice(items, size))
+    while window:
+        yield window.popleft()
+        window.extend(itertools.islice(items, 1))
+
+
+def _publish_progress(out: Dict[str, LevelEntry], fresh: list) -> None:
+    """
+    Publishes the current snapshot plus the folders committed since the last
+    publish (`fresh`, emptied). Folders that are gone stay listed until the
+    scan's final publish.
+    """
+    if not fresh:
+        return
+    levels = dict(current_snapshot().levels)
+    for name in fresh:
+        levels[name] = out[name]
+    publish_snapshot(levels, fresh)
+    fresh.clear()
+
+
 # -----------------------------
 # Main loader (sync, stale-while-running)
 # -----------------------------
@@ -371,60 +950,197 @@ def load_levels_directory(
     bg_version: str,
     levels_dir: str | Path = "levels",
     levels_cache_dir: str | Path = "levels_cache",
-) -> Dict[str, Dict[str, Optional[str]]]:
+    only_folders: Optional[Iterable[str]] = None,
+) -> Mapping[str, LevelEntry]:
     """
     Concurrency:
-      - If another call is running, return LAST COMPLETED snapshot immediately (stale).
+      - If another call is running, return the current published snapshot
+        immediately (stale).
+      - Results are published through helpers.snapshot; request handlers read that
+        and never call this.
+
+    Partial scans:
+      - only_folders (from helpers.watcher) limits the scan to those folder names
+        plus any folder with a running missing-grace timer or a pending retry;
+        everything else is carried over from the current snapshot. Falls back to
+        a full scan if nothing was published yet.
 
     Replacement / delete semantics (cover, background, music, score):
-      - If file disappears (no candidate exists), KEEP returning old hashes and keep them in repo._map.
-      - If missing persists for >10s, then drop hashes (return None) AND delete those hashes from repo._map.
-      - If replacement is confirmed (new file exists AND is usable), swap immediately and delete OLD hashes
-        from repo._map ONLY AFTER the NEW hashes are confirmed.
+      - If file disappears (no candidate exists), KEEP returning old hashes and
+        keep them in repo._map.
+      - If missing persists for >10s, then drop hashes (return None) AND delete
+        those hashes from repo._map.
+      - If replacement is confirmed (new file exists AND is usable), swap
+        immediately and delete OLD hashes from repo._map ONLY AFTER the NEW
+        hashes are confirmed.
+      - If a present file can't be confirmed (unreadable, conversion failed),
+        the folder is retried with backoff even if nothing in it changes.
     """
-    global _HAS_LAST_LEVELS_RESULT, _LAST_LEVELS_RESULT
+    global _PENDING_FOLDERS
 
     if not _LEVELS_SCAN_LOCK.acquire(blocking=False):
-        return _clone_last_result() if _HAS_LAST_LEVELS_RESULT else {}
+        return current_snapshot().levels
 
+    started = time.perf_counter()
+    kind = "full"
+    recorder = profiling.scan_recorder()
     try:
         now = time.time()
 
         levels_dir = Path(levels_dir)
         levels_cache_dir = Path(levels_cache_dir)
 
-        cache_path = _ensure_cache_json(levels_cache_dir)
-        cache = _load_cache(cache_path)
-
-        old_mtimes: Dict[str, float] = dict(cache.get("mtimes", {}))
-        new_mtimes = _scan_mtimes(levels_dir)
-
-        folders_cache: Dict[str, Any] = cache.get("folders", {})
-        folder_ids: Dict[str, str] = cache.get("folder_ids", {})
+        store = get_state_store(levels_cache_dir)
+        conversions = get_derived_cache(
+            levels_cache_dir, "conversions", _converter_version()
+        )
+        backgrounds = get_derived_cache(
+            levels_cache_dir, "backgrounds", _renderer_version()
+        )
+        inflight: _Inflight = {}
+        folders_cache: Dict[str, Any] = store.folders
+        refs = _hash_refs(store)
+        folder_ids: Dict[str, str] = store.folder_ids
+
+        # first scan since start: serve what the last run served (files that
+        # are still the same), so unchanged folders are skipped, not re-warmed
+        index = get_repository_index(levels_cache_dir)
+        if repo.index is not index:
+            restored = repo.restore(index)
+            if restored:
+                print(f"repository: {restored} files restored from the last run")
 
-        out: Dict[str, Dict[str, Optional[str]]] = {}
         repo_empty = _repo_is_empty()
 
-        cover_suffixes = {".png", ".jpg", ".jpeg"}
-        music_suffixes = {".mp3", ".ogg"}
-
-        for folder_dir in sorted(
-            (p for p in levels_dir.iterdir() if p.is_dir()),
-            key=lambda p: p.name.lower(),
-        ):
-            folder_name = folder_dir.name
-
-            # stable UUID per folder name
-            folder_id = folder_ids.get(folder_name)
-            if not folder_id:
-                folder_id = str(uuid.uuid4())
-                folder_ids[folder_name] = folder_id
+        previous = current_snapshot()
+        partial = only_folders is not None and previous.version > 0
+        if partial:
+            kind = "partial"
+            targets = set(only_folders) | _PENDING_FOLDERS
+            folder_dirs = [
+                levels_dir / name for name in targets if (levels_dir / name).is_dir()
+            ]
+            out: Dict[str, LevelEntry] = dict(previous.levels)
+            for name in targets:
+                out.pop(name, None)
+                _PENDING_FOLDERS.discard(name)
+        else:
+            with os.scandir(levels_dir) as it:
+                folder_dirs = [Path(e.path) for e in it if e.is_dir()]
+            out = {}
+            _PENDING_FOLDERS = set()
+        recorder.lap("setup")
+
+        # pass 1 (scan_changed): skip unchanged folders, scan the rest and queue
+        # their conversions/renders. Pass 2 commits them in order, staying at
+        # most _LOOKAHEAD changed folders behind, so the pipeline always has
+        # work queued while the first results get committed (and published)
+        # long before the last folder is even read.
+        checked = 0
+        fresh: list = []  # names added to `out` since the last publish
+
+        def scan_changed() -> Iterator[_FolderWork]:
+            nonlocal checked
+            for folder_dir in sorted(folder_dirs, key=lambda p: p.name.lower()):
+                folder_name = folder_dir.name
+                checked += 1
+
+                # stable UUID per folder name
+                folder_id = folder_ids.get(folder_name)
+                if not folder_id:
+                    folder_id = str(uuid.uuid4())
+                    store.set_folder_id(folder_name, folder_id)
+
+                folder_state: Dict[str, Any] = folders_cache.get(folder_id, {})
+
+                # unchanged since last scan => a few stats, no scandir, no work
+                if folder_state.get("name") == folder_name and _can_skip_folder(
+                    folder_dir, folder_state, repo_empty, now
+                ):
+                    out[folder_name] = _committed_entry(folder_id, folder_state)
+                    fresh.append(folder_name)
+                    if folder_state.get("retry_at") is not None:
+                        _PENDING_FOLDERS.add(folder_name)  # retry not due yet
+                    continue
+
+                state_before = dict(folder_state)
+                folder_state["name"] = folder_name
+
+                recorder.at(folder_name)
+                with profiling.phase("scandir"):
+                    scanned = _scan_folder(folder_dir)
+                if scanned is None:
+                    continue  # vanished mid-scan; the next event/tick handles it
+                dir_mtime_ns, candidates = scanned
+                prev_fp = folder_state.get("fingerprint")
+
+                picked = {
+                    kind: _pick_candidate(
+                        candidates[kind],
+                        folder_name,
+                        folder_state.get(_CONFIRM_KEYS[kind][0]),
+                    )
+                    for kind in _KINDS
+                }
+                confirm = {
+                    kind: picked[kind] is not None
+                    and _should_confirm(
+                        kind,
+                        folder_state,
+                        folder_name,
+                        picked[kind],
+                        prev_fp,
+                        repo_empty,
+                    )
+                    for kind in _KINDS
+                }
+
+                jobs: Dict[str, Job | CompletedJob] = {}
+                if confirm["cover"]:
+                    jobs["cover"] = _submit_background(
+                        folder_dir / picked["cover"].name,
+                        bg_version,
+                        backgrounds,
+                        inflight,
+                    )
+                if confirm["score"]:
+                    jobs["score"] = _submit_score(
+                        folder_dir / picked["score"].name, conversions, inflight
+                    )
 
-            folder_state: Dict[str, Any] = folders_cache.get(folder_id, {})
-            folder_state["name"] = folder_name
+                yield _FolderWork(
+                    folder_dir,
+                    folder_id,
+                    folder_state,
+                    state_before,
+                    dir_mtime_ns,
+                    picked,
+                    prev_fp,
+                    confirm,
+                    jobs,
+                )
 
-            folder_cache_dir = levels_cache_dir / folder_id
-            converted_score_path = folder_cache_dir / "converted_score"
+        # pass 2: commit results folder by folder
+        reprocessed = 0
+        metrics.scan_progress.set(len(folder_dirs), ("total",))
+        metrics.scan_progress.set(0, ("checked",))
+        metrics.scan_progress.set(0, ("reprocessed",))
+        next_publish = time.perf_counter() + _PUBLISH_EVERY
+        next_report = time.perf_counter() + _REPORT_EVERY
+        for (
+            folder_dir,
+            folder_id,
+            folder_state,
+            state_before,
+            dir_mtime_ns,
+            picked,
+            prev_fp,
+            confirm,
+            jobs,
+        ) in _lookahead(scan_changed(), _LOOKAHEAD):
+            folder_name = folder_dir.name
+            recorder.at(folder_name)
+            reprocessed += 1
 
             # ----- load current "committed" values -----
             cover_rel = folder_state.get("cover_rel")
@@ -437,29 +1153,15 @@ def load_levels_directory(
             score_rel = folder_state.get("score_rel")
             score_hash = folder_state.get("converted_score_hash")
 
-            # ----- determine candidates right now -----
-            # If the old committed rel exists, prefer it as the candidate; otherwise pick the first available.
-            committed_cover_path = (levels_dir / cover_rel) if cover_rel else None
+            # ----- candidates picked in pass 1 -----
             cover_candidate = (
-                committed_cover_path
-                if (committed_cover_path and committed_cover_path.exists())
-                else _first_matching_file(folder_dir, suffixes=cover_suffixes)
+                folder_dir / picked["cover"].name if picked["cover"] else None
             )
-
-            committed_music_path = (levels_dir / music_rel) if music_rel else None
             music_candidate = (
-                committed_music_path
-                if (committed_music_path and committed_music_path.exists())
-                else _first_matching_file(folder_dir, suffixes=music_suffixes)
+                folder_dir / picked["music"].name if picked["music"] else None
             )
-
-            committed_score_path = (levels_dir / score_rel) if score_rel else None
             score_candidate = (
-                committed_score_path
-                if (committed_score_path and committed_score_path.exists())
-                else _first_matching_file(
-                    folder_dir, predicate=_is_candidate_score_file
-                )
+                folder_dir / picked["score"].name if picked["score"] else None
             )
 
             # ----- COVER+BACKGROUND: gap-safe state machine -----
@@ -471,9 +1173,9 @@ def load_levels_directory(
 
                     if _missing_too_long(folder_state, "cover", now):
                         # delete confirmed => drop & delete from repo map
-                        _repo_del_hash(cover_hash)
+                        _repo_del_hash(cover_hash, refs, folder_id, levels_dir)
                         if bg_hash:
-                            _repo_del_hash(bg_hash)
+                            _repo_del_hash(bg_hash, refs, folder_id, levels_dir)
                         cover_hash = None
                         bg_hash = None
                         cover_rel = None
@@ -499,43 +1201,33 @@ def load_levels_directory(
                 _clear_missing(folder_state, "cover")
                 _clear_missing(folder_state, "background")
 
-                candidate_rel = cover_candidate.relative_to(levels_dir).as_posix()
+                candidate_rel = f"{folder_name}/{cover_candidate.name}"
 
-                candidate_mtime_changed = (
-                    candidate_rel in new_mtimes
-                    and old_mtimes.get(candidate_rel) != new_mtimes.get(candidate_rel)
-                )
-                needs_warm = (cover_hash is not None) and (
-                    repo_empty or not _repo_has_hash(cover_hash)
-                )
-
-                # decide if we should attempt a confirm swap:
-                # - different file than committed, OR
-                # - same file but mtime changed, OR
-                # - repo warm needed, OR
-                # - no committed hash yet
-                should_confirm = (
-                    (candidate_rel != cover_rel)
-                    or candidate_mtime_changed
-                    or needs_warm
-                    or (cover_hash is None)
-                    or (bg_hash is None)
+                # re-check: another folder's commit may have dropped a shared hash
+                should_confirm = confirm["cover"] or _should_confirm(
+                    "cover",
+                    folder_state,
+                    folder_name,
+                    picked["cover"],
+                    prev_fp,
+                    repo_empty,
                 )
 
                 if should_confirm:
                     confirmed = _confirm_cover_and_background(
                         cover_path=cover_candidate,
                         bg_version=bg_version,
-                        folder_cache_dir=folder_cache_dir,
+                        cache=backgrounds,
+                        job=jobs.get("cover"),
                     )
                     if confirmed is not None:
                         new_cover_hash, new_bg_hash = confirmed
 
                         # replacement confirmed => NOW delete old hashes (only now)
                         if cover_hash and cover_hash != new_cover_hash:
-                            _repo_del_hash(cover_hash)
+                            _repo_del_hash(cover_hash, refs, folder_id, levels_dir)
                         if bg_hash and bg_hash != new_bg_hash:
-                            _repo_del_hash(bg_hash)
+                            _repo_del_hash(bg_hash, refs, folder_id, levels_dir)
 
                         cover_hash = new_cover_hash
                         bg_hash = new_bg_hash
@@ -546,10 +1238,12 @@ def load_levels_directory(
                         folder_state["cover_rel"] = cover_rel
                     else:
                         # not confirmed yet (file incomplete) => keep old hashes/rel
-                        # do NOT start missing timer because "a file exists" (replacement in progress)
+                        # do NOT start missing timer because "a file exists"
+                        # (replacement in progress)
                         pass
                 else:
-                    # committed cover still valid; ensure background is present in repo if needed
+                    # committed cover still valid; ensure background is present
+                    # in repo if needed
                     pass
 
             # ----- MUSIC: gap-safe -----
@@ -557,7 +1251,7 @@ def load_levels_directory(
                 if music_hash is not None:
                     _mark_missing(folder_state, "music", now)
                     if _missing_too_long(folder_state, "music", now):
-                        _repo_del_hash(music_hash)
+                        _repo_del_hash(music_hash, refs, folder_id, levels_dir)
                         music_hash = None
                         music_rel = None
                         folder_state["music_hash"] = None
@@ -572,26 +1266,21 @@ def load_levels_directory(
                     folder_state["music_rel"] = None
             else:
                 _clear_missing(folder_state, "music")
-                candidate_rel = music_candidate.relative_to(levels_dir).as_posix()
-                candidate_mtime_changed = (
-                    candidate_rel in new_mtimes
-                    and old_mtimes.get(candidate_rel) != new_mtimes.get(candidate_rel)
-                )
-                needs_warm = (music_hash is not None) and (
-                    repo_empty or not _repo_has_hash(music_hash)
-                )
-                should_confirm = (
-                    (candidate_rel != music_rel)
-                    or candidate_mtime_changed
-                    or needs_warm
-                    or (music_hash is None)
+                candidate_rel = f"{folder_name}/{music_candidate.name}"
+                should_confirm = confirm["music"] or _should_confirm(
+                    "music",
+                    folder_state,
+                    folder_name,
+                    picked["music"],
+                    prev_fp,
+                    repo_empty,
                 )
 
                 if should_confirm:
                     new_hash = _confirm_music(music_path=music_candidate)
                     if new_hash is not None:
                         if music_hash and music_hash != new_hash:
-                            _repo_del_hash(music_hash)
+                            _repo_del_hash(music_hash, refs, folder_id, levels_dir)
                         music_hash = new_hash
                         music_rel = candidate_rel
                         folder_state["music_hash"] = music_hash
@@ -605,7 +1294,7 @@ def load_levels_directory(
                 if score_hash is not None:
                     _mark_missing(folder_state, "score", now)
                     if _missing_too_long(folder_state, "score", now):
-                        _repo_del_hash(score_hash)
+                        _repo_del_hash(score_hash, refs, folder_id, levels_dir)
                         score_hash = None
                         score_rel = None
                         folder_state["converted_score_hash"] = None
@@ -620,29 +1309,25 @@ def load_levels_directory(
                     folder_state["score_rel"] = None
             else:
                 _clear_missing(folder_state, "score")
-                candidate_rel = score_candidate.relative_to(levels_dir).as_posix()
-                candidate_mtime_changed = (
-                    candidate_rel in new_mtimes
-                    and old_mtimes.get(candidate_rel) != new_mtimes.get(candidate_rel)
-                )
-                needs_warm = (score_hash is not None) and (
-                    repo_empty or not _repo_has_hash(score_hash)
-                )
-                should_confirm = (
-                    (candidate_rel != score_rel)
-                    or candidate_mtime_changed
-                    or needs_warm
-                    or (score_hash is None)
+                candidate_rel = f"{folder_name}/{score_candidate.name}"
+                should_confirm = confirm["score"] or _should_confirm(
+                    "score",
+                    folder_state,
+                    folder_name,
+                    picked["score"],
+                    prev_fp,
+                    repo_empty,
                 )
 
                 if should_confirm:
                     new_hash = _confirm_score(
                         score_path=score_candidate,
-                        converted_score_path=converted_score_path,
+                        cache=conversions,
+                        job=jobs.get("score"),
                     )
                     if new_hash is not None:
                         if score_hash and score_hash != new_hash:
-                            _repo_del_hash(score_hash)
+                            _repo_del_hash(score_hash, refs, folder_id, levels_dir)
                         score_hash = new_hash
                         score_rel = candidate_rel
                         folder_state["converted_score_hash"] = score_hash
@@ -651,30 +1336,86 @@ def load_levels_directory(
                         # not confirmed => keep old
                         pass
 
+            _drop_legacy_cache_files(levels_cache_dir / folder_id)
+
+            if _uncommitted_kinds(folder_state, folder_name, picked):
+                _schedule_retry(folder_state, now)
+            else:
+                _clear_retry(folder_state)
+
             # save folder state
-            folders_cache[folder_id] = folder_state
+            folder_state["fingerprint"] = _make_fingerprint(dir_mtime_ns, picked)
+            if folder_state != state_before or folder_id not in folders_cache:
+                with profiling.phase("store"):
+                    store.put(folder_id, folder_state)
+                refs.update(folder_id, state_before, folder_state)
+            if folder_state.get("retry_at") is not None or any(
+                folder_state.get(_missing_key(k)) is not None for k in _KINDS
+            ):
+                _PENDING_FOLDERS.add(folder_name)
 
             # IMPORTANT: return committed state (never transient locals)
-            out[folder_name] = {
-                "id": folder_id,
-                "score": folder_state.get("converted_score_hash"),
-                "cover": folder_state.get("cover_hash"),
-                "background": folder_state.get("background_hash"),
-                "music": folder_state.get("music_hash"),
-            }
-
-        cache["mtimes"] = new_mtimes
-        cache["folders"] = folders_cache
-        cache["folder_ids"] = folder_ids
-        _save_cache(cache_path, cache)
-
-        _LAST_LEVELS_RESULT = out
-        _HAS_LAST_LEVELS_RESULT = True
-        return _clone_last_result()
+            out[folder_name] = _committed_entry(folder_id, folder_state)
+            fresh.append(folder_name)
+
+            if "cover" in jobs:
+                cover_format = Path(picked["cover"].name).suffix[1:].lower()
+                recorder.job(folder_name, "render", jobs["cover"], cover_format)
+            if "score" in jobs:
+                recorder.job(folder_name, "convert", jobs["score"])
+
+            # long scans (first start, a big copy into levels/): show what's
+            # committed so far instead of nothing / the old state until the end
+            clock = time.perf_counter()
+            if clock >= next_publish:
+                recorder.at(None)
+                _publish_progress(out, fresh)
+                next_publish = clock + _PUBLISH_EVERY
+                metrics.scan_progress.set(checked, ("checked",))
+                metrics.scan_progress.set(reprocessed, ("reprocessed",))
+            if clock >= next_report:
+                print(
+                    f"scanning levels: {checked}/{len(folder_dirs)} folders checked, "
+                    f"{reprocessed} updated, {len(current_snapshot().levels)} shown"
+                )
+                next_report = clock + _REPORT_EVERY
+
+        recorder.at(None)
+        recorder.lap("scan")
+        metrics.scan_progress.set(checked, ("checked",))
+        metrics.scan_progress.set(reprocessed, ("reprocessed",))
+
+        metrics.scan_folders.inc(len(folder_dirs), ("scanned",))
+        metrics.scan_folders.inc(reprocessed, ("reprocessed",))
+        metrics.scan_last_folders.set(len(folder_dirs), ("scanned",))
+        metrics.scan_last_folders.set(reprocessed, ("reprocessed",))
+
+        if reprocessed:
+            conversions.evict(
+                keep=(s.get("converted_score_hash") for s in folders_cache.values())
+            )
+            backgrounds.evict(
+                keep=(s.get("background_hash") for s in folders_cache.values())
+            )
+        recorder.lap("evict")
+
+        if partial:
+            out = dict(sorted(out.items(), key=lambda kv: kv[0].lower()))
+
+        # progress publishes may have moved the snapshot on since `previous`
+        # (partial scans only ever touch `targets`, so that still holds)
+        current = current_snapshot()
+        if current.version == 0 or out != current.levels:
+            published = publish_snapshot(out, targets if partial else None)
+            recorder.lap("publish")
+            return published.levels
+        return current.levels
 
     except Exception as e:
         _print_exc(e)
-        return _clone_last_result() if _HAS_LAST_LEVELS_RESULT else {}
+        return current_snapshot().levels
 
     finally:
         _LEVELS_SCAN_LOCK.release()
+        metrics.scan_seconds.observe(time.perf_counter() - started, (kind,))
+        recorder.finish(kind)
@@ -0,0 +1,210 @@
+"""
+Counters and histograms for /metrics (Prometheus text format).
+
+Deliberately tiny: a metric is a dict from label values to numbers behind a
+lock, so an increment costs about as much as a dict update. Set `enabled` to
+False (app.METRICS) and every inc/observe/set returns immediately.
+
+State that already lives somewhere else (repository size, blob cache hits,
+queue depths) isn't duplicated here; routes/metrics.py reads it at scrape
+time and passes it to render() as extra samples.
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+enabled = True
+
+_REGISTRY: List["_Metric"] = []
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _lines(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._lines())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, labels: LabelValues = ()) -> None:
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _lines(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: LabelValues = ()) -> None:
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = ()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        if not enabled:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def _lines(self):
+        with self._lock:
+            values = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield (
+                    f"{self.name}_bucket"
+                    f"{_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total!r}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+# ----- what the app records -----
+
+_SCAN_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+_JOB_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 120)
+_REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+scan_seconds = Histogram(
+    "scoresync_scan_duration_seconds",
+    "load_levels_directory() wall time, by scan kind (full/partial).",
+    ("kind",),
+    _SCAN_BUCKETS,
+)
+scan_folders = Counter(
+    "scoresync_scan_folders_total",
+    "Folders looked at (scanned) and actually re-read (reprocessed).",
+    ("result",),
+)
+scan_last_folders = Gauge(
+    "scoresync_scan_last_folders",
+    "Folders scanned / reprocessed by the most recent scan.",
+    ("result",),
+)
+scan_progress = Gauge(
+    "scoresync_scan_progress_folders",
+    "Running (or last) scan: folders in it (total), checked so far and "
+    "re-read so far (reprocessed). Updated about once a second.",
+    ("state",),
+)
+job_seconds = Histogram(
+    "scoresync_job_duration_seconds",
+    "Worker time of conversions and background renders, by detected format "
+    "(renders: by background version).",
+    ("job", "format"),
+    _JOB_BUCKETS,
+)
+repository_reads = Counter(
+    "scoresync_repository_reads_total",
+    "Repository.get_file() calls by where the bytes came from.",
+    ("source",),
+)
+repository_read_bytes = Counter(
+    "scoresync_repository_read_bytes_total",
+    "Bytes returned by Repository.get_file(), by source.",
+    ("source",),
+)
+request_seconds = Histogram(
+    "scoresync_http_request_duration_seconds",
+    "Time to the last byte of the response, by route.",
+    ("method", "route"),
+    _REQUEST_BUCKETS,
+)
+response_bytes = Counter(
+    "scoresync_http_response_bytes_total",
+    "Response body bytes sent, by route.",
+    ("route",),
+)
+
+
+# recorded by whichever process scans; with several workers (app.serve_workers)
+# that isn't one that serves /metrics, so it hands them over (helpers.shared_state)
+SCANNER = (scan_seconds, scan_folders, scan_last_folders, scan_progress, job_seconds)
+
+
+def render(
+    extra: Iterable[Tuple[str, str, str, Dict[str, float]]] = (),
+    only: Optional[Iterable[_Metric]] = None,
+    exclude: Iterable[_Metric] = (),
+) -> str:
+    """
+    Every registered metric (or just `only`) but `exclude`, then `extra`:
+    (name, type, help, {labels: value}) where labels is a preformatted
+    '{a="b"}' string or "".
+    """
+    skip = set(exclude)
+    out = [
+        metric.render()
+        for metric in (_REGISTRY if only is None else only)
+        if metric not in skip
+    ]
+    for name, kind, help, samples in extra:
+        lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines.extend(f"{name}{labels} {_number(v)}" for labels, v in samples.items())
+        out.append("\n".join(lines) + "\n")
+    return "".join(out)
@@ -0,0 +1,316 @@
+"""
+Opt-in profiling for scans and requests.
+
+Off unless SCORESYNC_PROFILE=1 or `python main.py --profile`. When on:
+  - every load_levels_directory() call times its phases per folder (scandir,
+    read, hash, the conversion/render worker's parse/decode/render/export,
+    waiting on the pipeline, repo/state-store commits) and per scan;
+  - a scan or request slower than the threshold gets a .pstats dump
+    (python -m pstats <file>);
+  - report.txt, rewritten after every scan that processed a folder or was
+    slow, lists the slowest recent folders and the conversion/render time
+    per format. Scans that found nothing to do (most polling rescans) are
+    neither profiled nor reported.
+
+Settings (environment, or the matching main.py flags):
+  SCORESYNC_PROFILE_DIR        dumps and report.txt (levels_cache/profiles)
+  SCORESYNC_PROFILE_THRESHOLD  seconds before a dump is written (1.0)
+
+configure() writes them back into the environment, so spawned job workers
+pick the setting up on import and time their own phases.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import os
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+ENV_ENABLED = "SCORESYNC_PROFILE"
+ENV_DIR = "SCORESYNC_PROFILE_DIR"
+ENV_THRESHOLD = "SCORESYNC_PROFILE_THRESHOLD"
+
+enabled = os.environ.get(ENV_ENABLED, "") not in ("", "0")
+directory = Path(os.environ.get(ENV_DIR) or "levels_cache/profiles")
+threshold = float(os.environ.get(ENV_THRESHOLD) or 1.0)
+
+REPORT_FOLDERS = 2000  # folder records the rolling report is built from
+REPORT_TOP = 25
+
+
+def configure(
+    on: bool = True,
+    profile_dir: Optional[str | Path] = None,
+    profile_threshold: Optional[float] = None,
+) -> None:
+    global enabled, directory, threshold
+    enabled = on
+    if profile_dir is not None:
+        directory = Path(profile_dir)
+    if profile_threshold is not None:
+        threshold = profile_threshold
+    os.environ[ENV_ENABLED] = "1" if on else "0"
+    os.environ[ENV_DIR] = str(directory)
+    os.environ[ENV_THRESHOLD] = str(threshold)
+
+
+# ----- phases -----
+# phase() adds its wall time to whatever dict is being collected into on this
+# thread: a folder's (ScanRecorder.at) or a job's (helpers.jobs). With
+# nothing collecting, it's a no-op context.
+
+_local = threading.local()
+_NULL = nullcontext()
+
+
+@contextmanager
+def collecting(target: Dict[str, float]) -> Iterator[Dict[str, float]]:
+    previous = getattr(_local, "target", None)
+    _local.target = target
+    try:
+        yield target
+    finally:
+        _local.target = previous
+
+
+@contextmanager
+def _timed(target: Dict[str, float], name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        target[name] = target.get(name, 0.0) + time.perf_counter() - start
+
+
+def phase(name: str):
+    target = getattr(_local, "target", None)
+    if target is None:
+        return _NULL
+    return _timed(target, name)
+
+
+# ----- cProfile dumps -----
+
+# one cProfile at a time (3.12+ refuses a second one anyway)
+_PROFILE_LOCK = threading.Lock()
+
+
+def _start_profile() -> Optional[cProfile.Profile]:
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # some other profiler is active
+        _PROFILE_LOCK.release()
+        return None
+    return profile
+
+
+def _slug(label: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:80]
+
+
+def _finish_profile(
+    profile: Optional[cProfile.Profile], elapsed: float, label: str
+) -> Optional[Path]:
+    if profile is None:
+        return None
+    try:
+        profile.disable()
+    finally:
+        _PROFILE_LOCK.release()
+    if elapsed < threshold:
+        return None
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = directory / f"{stamp}-{_slug(label)}-{elapsed * 1000:.0f}ms.pstats"
+        profile.dump_stats(str(path))
+    except OSError as e:
+        print(f"profile: couldn't write dump: {e}")
+        return None
+    print(f"profile: {label} took {elapsed:.2f}s, wrote {path}")
+    return path
+
+
+class RequestProfile:
+    """
+    Around one request. The event loop runs other requests in between, so
+    a dump can include their frames too; read it as "what the loop did".
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self._profile = _start_profile()
+        self._start = time.perf_counter()
+
+    def finish(self) -> None:
+        _finish_profile(self._profile, time.perf_counter() - self._start, self.label)
+
+
+# ----- scans -----
+
+_report_lock = threading.Lock()
+# (folder, total seconds, phases) of recently processed folders
+_recent_folders: Deque[Tuple[str, float, Dict[str, float]]] = deque(
+    maxlen=REPORT_FOLDERS
+)
+# (job kind, format) -> recent worker times
+_recent_jobs: Dict[Tuple[str, str], Deque[float]] = defaultdict(
+    lambda: deque(maxlen=REPORT_FOLDERS)
+)
+_last_scans: Deque[Tuple[str, float, Dict[str, float], int]] = deque(maxlen=10)
+
+
+class ScanRecorder:
+    """
+    One load_levels_directory() call. at(folder) points phase() at that
+    folder's timings until the next at(); lap(name) closes a scan-level
+    phase (time since the previous lap); job() merges in the worker phases
+    of a conversion/render the folder waited on. The scan runs under
+    cProfile from the first folder it processes on.
+    """
+
+    def __init__(self):
+        self.folders: Dict[str, Dict[str, float]] = {}
+        self.scan: Dict[str, float] = {}
+        self.jobs: Dict[int, Tuple[str, str, float]] = {}
+        self._start = self._lap = time.perf_counter()
+        self._profile: Optional[cProfile.Profile] = None
+
+    def at(self, folder: Optional[str]) -> None:
+        if folder is None:
+            _local.target = None
+            return
+        if not self.folders:
+            # started here, not in __init__: no-op scans stay unprofiled
+            self._profile = _start_profile()
+        _local.target = self.folders.setdefault(folder, {})
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        self.scan[name] = self.scan.get(name, 0.0) + now - self._lap
+        self._lap = now
+
+    def job(self, folder: str, kind: str, job: Any, fmt: Optional[str] = None) -> None:
+        """
+        Adds the job's worker time to the folder as <kind> and its phases
+        as <kind>.<phase>. fmt defaults to the format a conversion detected.
+        Cache hits (no elapsed) add nothing.
+        """
+        elapsed = getattr(job, "elapsed", None)
+        if elapsed is None:
+            return
+        target = self.folders.setdefault(folder, {})
+        for name, seconds in (getattr(job, "phases", None) or {}).items():
+            key = f"{kind}.{name}"
+            target[key] = target.get(key, 0.0) + seconds
+        target[kind] = target.get(kind, 0.0) + elapsed
+        if fmt is None:
+            value = job.result()  # already done and successful, so no wait
+            fmt = value[1] if isinstance(value, tuple) else None
+        # folders sharing a job all waited on it; the format stats count it once
+        self.jobs[id(job)] = (kind, fmt or "unknown", elapsed)
+
+    def finish(self, kind: str) -> None:
+        _local.target = None
+        elapsed = time.perf_counter() - self._start
+        _finish_profile(self._profile, elapsed, f"scan-{kind}")
+        if not self.folders and elapsed < threshold:
+            return  # nothing changed; don't rewrite the report 10 times a second
+        with _report_lock:
+            for name, phases in self.folders.items():
+                # "<kind>.<phase>" entries are already inside <kind>
+                total = sum(v for k, v in phases.items() if "." not in k)
+                _recent_folders.append((name, total, phases))
+            for job_kind, fmt, seconds in self.jobs.values():
+                _recent_jobs[(job_kind, fmt)].append(seconds)
+            _last_scans.append((kind, elapsed, self.scan, len(self.folders)))
+        try:
+            write_report()
+        except OSError as e:
+            print(f"profile: couldn't write report: {e}")
+
+
+class _NullRecorder:
+    def at(self, folder: Optional[str]) -> None:
+        pass
+
+    def lap(self, name: str) -> None:
+        pass
+
+    def job(self, folder: str, kind: str, job: Any, fmt: Optional[str] = None) -> None:
+        pass
+
+    def finish(self, kind: str) -> None:
+        pass
+
+
+_NULL_RECORDER = _NullRecorder()
+
+
+def scan_recorder() -> ScanRecorder | _NullRecorder:
+    return ScanRecorder() if enabled else _NULL_RECORDER
+
+
+def _phases_text(phases: Dict[str, float], top: int = 8) -> str:
+    ordered = sorted(phases.items(), key=lambda kv: -kv[1])[:top]
+    return ", ".join(f"{k} {v * 1000:.1f}" for k, v in ordered)
+
+
+def report() -> str:
+    with _report_lock:
+        folders = list(_recent_folders)
+        jobs = {key: list(values) for key, values in _recent_jobs.items()}
+        scans = list(_last_scans)
+
+    lines = [f"# generated {time.strftime('%Y-%m-%d %H:%M:%S')}, times in ms", ""]
+    lines.append("## recent scans")
+    for kind, elapsed, phases, count in reversed(scans):
+        lines.append(
+            f"{kind:<8} {elapsed * 1000:>10.1f}  {count} folders  "
+            f"({_phases_text(phases)})"
+        )
+
+    lines += ["", f"## slowest folders (last {len(folders)} processed)"]
+    latest: Dict[str, Tuple[float, Dict[str, float]]] = {}
+    for name, total, phases in folders:
+        latest[name] = (total, phases)
+    slowest = sorted(latest.items(), key=lambda kv: -kv[1][0])[:REPORT_TOP]
+    for name, (total, phases) in slowest:
+        lines.append(f"{total * 1000:>10.1f}  {name}  ({_phases_text(phases)})")
+
+    lines += [
+        "",
+        "## worker time by format",
+        f"{'job':<12} {'format':<10} "
+        f"{'count':>6} {'mean':>9} {'p50':>9} {'max':>9} {'total':>10}",
+    ]
+    by_total = sorted(jobs.items(), key=lambda kv: -sum(kv[1]))
+    for (kind, fmt), values in by_total:
+        if not values:
+            continue
+        lines.append(
+            f"{kind:<12} {fmt:<10} {len(values):>6} "
+            f"{statistics.fmean(values) * 1000:>9.1f} "
+            f"{statistics.median(values) * 1000:>9.1f} "
+            f"{max(values) * 1000:>9.1f} {sum(values) * 1000:>10.1f}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_report() -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "report.txt"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(report(), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
@@ -1,70 +1,204 @@
+from helpers import metrics
+from helpers.hash_manifest import fingerprint
 from helpers.sha1 import calculate_sha1
+from helpers.blob_cache import BlobCache
+from helpers.zip_reader import zip_reader
 
-from typing import Optional, Union, IO
+from typing import Optional, Tuple, Union, IO
 from helpers.datastructs import SRL
 
 from pathlib import Path
 from io import BytesIO
-from zipfile import ZipFile
+import mimetypes
+import threading
 import os
 
 
+def _path_key(file: os.PathLike) -> str:
+    return os.path.normcase(os.path.abspath(str(file)))
+
+
+# engine data, converted scores etc. have no extension; sniff those instead
+_MAGIC_TYPES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"ID3", "audio/mpeg"),
+    (b"OggS", "audio/ogg"),
+    (b"\x1f\x8b", "application/gzip"),
+)
+_DEFAULT_TYPE = "application/octet-stream"
+
+
+def _sniff_media_type(head: bytes) -> str:
+    for magic, media_type in _MAGIC_TYPES:
+        if head.startswith(magic):
+            return media_type
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "audio/mpeg"  # bare MPEG frame sync, no ID3 tag
+    return _DEFAULT_TYPE
+
+
+def _count_read(source: str, data: bytes) -> None:
+    if metrics.enabled:
+        metrics.repository_reads.inc(1, (source,))
+        metrics.repository_read_bytes.inc(len(data), (source,))
+
+
 class Repository:
+    """
+    Writers (add_*, pop_hash, remove_hash) serialize on a lock and change
+    _map one key at a time. Readers (get_file, get_srl, has_hash) never
+    iterate _map; they do single dict lookups, which are atomic under the GIL,
+    so they need no lock and can't observe a resize mid-iteration. Anything
+    that needs to walk the whole map uses snapshot().
+    """
+
     def __init__(self):
         self._map = {}
+        self._paths = {}  # normalized file path -> hash (reverse of _map)
+        self._lock = threading.Lock()
+        self.version = 0  # bumped on every change
+        self.blob_cache = BlobCache()
+        self._media_types = {}  # hash -> Content-Type, filled lazily
+        self.index = None  # helpers.repository_index, once restore() ran
 
     def _read_from_zip_chain(self, parts: list[str]) -> bytes:
         """
-        Recursively reads a file through a chain of ZIPs.
+        Reads a file through a chain of ZIPs.
         Example: path/to/a.zip|inner.zip|file.png
         """
-        current_bytes = None
-
-        for i, part in enumerate(parts):
-            if i == 0:
-                # First part is always a real file on disk
-                with open(part, "rb") as f:
-                    current_bytes = f.read()
-            else:
-                # Open previous bytes as ZIP
-                with ZipFile(BytesIO(current_bytes)) as zip_file:
-                    try:
-                        current_bytes = zip_file.read(zip_file.getinfo(part))
-                    except KeyError:
-                        raise FileNotFoundError(f"{part} not found in zip chain")
-        return current_bytes
+        return zip_reader.read(parts)
 
     def add_file(
-        self, file: os.PathLike, error_on_file_nonexistent: bool = True
+        self,
+        file: os.PathLike,
+        error_on_file_nonexistent: bool = True,
+        sha1: Optional[str] = None,
     ) -> Optional[str]:
+        """
+        sha1: the file's hash, if the caller just wrote it and already knows
+        (content-addressed files); skips reading it back.
+        """
         if not error_on_file_nonexistent:
             if not os.path.exists(file):
                 return None
-        hash = self.get_hash_from_file_path(file)
-        if hash:
-            del self._map[hash]
-        if "|" in str(file):
-            file_data = self._read_from_zip_chain(str(file).split("|"))
-            sha1 = calculate_sha1(file_data)
-        else:
-            sha1 = calculate_sha1(file)
+        index = self.index if "|" not in str(file) else None
+        # stat before reading: a file rewritten meanwhile won't match later
+        fp = fingerprint(os.stat(file)) if "|" not in str(file) else None
+        if sha1 is None:
+            if "|" in str(file):
+                file_data = self._read_from_zip_chain(str(file).split("|"))
+                sha1 = calculate_sha1(file_data)
+            else:
+                sha1 = calculate_sha1(file)
         file_path = str(file)
-        if sha1 not in self._map.keys():
-            self._map[sha1] = {"hash": sha1, "file": file_path}
+        key = _path_key(file_path)
+        with self._lock:
+            hash = self._paths.pop(key, None)
+            if hash:
+                self._map.pop(hash, None)
+                if hash != sha1:
+                    self.blob_cache.invalidate(hash)
+            added = sha1 not in self._map
+            if added:
+                self._map[sha1] = {"hash": sha1, "file": file_path, "fp": fp}
+                self._paths[key] = sha1
+            self.version += 1
+        if index is not None:
+            if added:
+                index.record(key, file_path, sha1, fp)
+            elif hash:
+                index.delete(key)
         return sha1
 
+    def restore(self, index) -> int:
+        """
+        Re-adds the on-disk entries a previous run recorded in index (a
+        helpers.repository_index.RepositoryIndex) whose files still have the
+        recorded size, mtime and inode, without reading them; rows that no
+        longer match are dropped. From then on every add/remove is recorded
+        there. Returns the number of entries restored.
+        """
+        restored = []
+        for key, (file_path, sha1, fp) in index.rows():
+            try:
+                unchanged = fingerprint(os.stat(file_path)) == fp
+            except OSError:
+                unchanged = False
+            if unchanged:
+                restored.append((key, file_path, sha1, fp))
+            else:
+                index.delete(key)
+        with self._lock:
+            for key, file_path, sha1, fp in restored:
+                if sha1 not in self._map and key not in self._paths:
+                    self._map[sha1] = {"hash": sha1, "file": file_path, "fp": fp}
+                    self._paths[key] = sha1
+            self.version += 1
+            self.index = index
+        return len(restored)
+
+    def relocate(self, hash: str, file: os.PathLike) -> bool:
+        """
+        Points hash's entry at another file with the same content (a folder
+        dropped the copy it was added from; another folder still has one).
+        False if the hash isn't here or that path already backs another hash.
+        """
+        index = self.index
+        fp = fingerprint(os.stat(file))
+        file_path = str(file)
+        key = _path_key(file_path)
+        with self._lock:
+            item = self._map.get(hash)
+            if item is None or self._paths.get(key, hash) != hash:
+                return False
+            old_key = None
+            if isinstance(item["file"], (str, Path)):
+                old_key = _path_key(item["file"])
+                if self._paths.get(old_key) == hash:
+                    del self._paths[old_key]
+            self._map[hash] = {"hash": hash, "file": file_path, "fp": fp}
+            self._paths[key] = hash
+            self.version += 1
+        if index is not None:
+            index.record(key, file_path, hash, fp)
+            if old_key is not None and old_key != key:
+                index.delete(old_key)
+        return True
+
     def add_bytes(self, data: Union[IO[bytes], bytes]):
         """
         Warning: cannot be updated!
         """
         sha1 = calculate_sha1(data)
-        if sha1 not in self._map.keys():
-            self._map[sha1] = {"hash": sha1, "file": data}
+        with self._lock:
+            if sha1 not in self._map:
+                self._map[sha1] = {"hash": sha1, "file": data}
+                self.version += 1
+
+    def _remove_locked(self, hash: str) -> bool:
+        item = self._map.pop(hash, None)
+        if item is None:
+            return False
+        self.blob_cache.invalidate(hash)
+        self._media_types.pop(hash, None)
+        if isinstance(item["file"], (str, Path)):
+            key = _path_key(item["file"])
+            if self._paths.get(key) == hash:
+                del self._paths[key]
+            if self.index is not None:
+                self.index.delete(key)
+        self.version += 1
+        return True
+
+    def remove_hash(self, hash: str) -> bool:
+        with self._lock:
+            return self._remove_locked(hash)
 
     def pop_hash(self, hash: str) -> Optional[bytes]:
         file_data = self.get_file(hash)
         if file_data:
-            del self._map[hash]
+            self.remove_hash(hash)
         return file_data
 
     def update_file(self, file: os.PathLike):
@@ -74,15 +208,94 @@ class Repository:
         self.add_file(file)
 
     def get_hash_from_file_path(self, file: os.PathLike) -> Optional[str]:
-        input_path = os.path.abspath(file)
-        for sha1, data in self._map.items():
-            if type(data["file"]) != str:
-                continue
-            stored_path = os.path.abspath(data["file"])
-            if input_path == stored_path:
-                return sha1
+        return self._paths.get(_path_key(file))
+
+    def has_hash(self, hash: str) -> bool:
+        return hash in self._map
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def snapshot(self) -> dict:
+        """
+        Consistent copy of the hash -> entry map, for anything that iterates.
+        """
+        with self._lock:
+            return dict(self._map)
+
+    def get_file_path(self, hash: str) -> Optional[str]:
+        """
+        Backing path for plain on-disk entries; None for ZIP members and
+        in-memory entries.
+        """
+        item = self._map.get(hash, None)
+        if not item:
+            return None
+        file = item["file"]
+        if isinstance(file, (str, Path)) and "|" not in str(file):
+            return str(file)
         return None
 
+    def stat_file(self, hash: str) -> Optional[Tuple[str, int]]:
+        """
+        (backing path, size) for plain on-disk entries, for streaming straight
+        from the file; None for ZIP members and in-memory entries. A file
+        whose stat no longer matches the one taken when it was added is
+        re-hashed; FileNotFoundError if it's gone or now holds other bytes.
+        """
+        item = self._map.get(hash, None)
+        file_path = self.get_file_path(hash)
+        if item is None or file_path is None:
+            return None
+        st = os.stat(file_path)
+        fp = fingerprint(st)
+        if fp != item.get("fp"):
+            if calculate_sha1(file_path) != hash:
+                raise FileNotFoundError(f"{file_path} no longer holds {hash}")
+            with self._lock:
+                if self._map.get(hash) is item:
+                    item["fp"] = fp  # touched, not changed
+        return file_path, st.st_size
+
+    def get_media_type(self, hash: str, sniff: bool = True) -> Optional[str]:
+        """
+        sniff=False: never open the file; None if its name doesn't tell and
+        it hasn't been sniffed yet.
+        """
+        media_type = self._media_types.get(hash)
+        if media_type is not None:
+            return media_type
+        item = self._map.get(hash, None)
+        if not item:
+            return None
+        file = item["file"]
+        if isinstance(file, (str, Path)):
+            name = str(file).rsplit("|", 1)[-1]
+            media_type = mimetypes.guess_type(name)[0]
+            if media_type is None and not sniff:
+                return None
+            if media_type is None and "|" not in str(file):
+                try:
+                    with open(file, "rb") as f:
+                        media_type = _sniff_media_type(f.read(16))
+                except OSError:
+                    return _DEFAULT_TYPE  # don't remember a failed sniff
+        else:
+            data = file.getvalue() if isinstance(file, BytesIO) else file
+            media_type = _sniff_media_type(data[:16])
+        media_type = media_type or _DEFAULT_TYPE
+        self._media_types[hash] = media_type
+        return media_type
+
+    def pin(self, hash: str, load: bool = True) -> None:
+        """
+        Keep this blob in memory for good (engine/skin/effect/particle assets).
+        load=False leaves reading it to the first get_file().
+        """
+        self.blob_cache.pin(hash)
+        if load:
+            self.get_file(hash)
+
     def get_file(self, hash: str) -> Optional[bytes]:
         item = self._map.get(hash, None)
         if not item:
@@ -90,23 +303,38 @@ class Repository:
         file = item["file"]
         file_data: Optional[bytes] = None
         if isinstance(file, (str, Path)):
+            file_data = self.blob_cache.get(hash)
+            if file_data is not None:
+                _count_read("cache", file_data)
+                return file_data
             file_path = Path(file)
             if "|" in str(file_path):
                 # Handle files in ZIP (this is chainable)
                 parts = str(file_path).split("|")
                 file_data = self._read_from_zip_chain(parts)
+                _count_read("zip", file_data)
             else:
                 with open(file_path, "rb") as f:
                     file_data = f.read()
+                _count_read("disk", file_data)
+            # the file may have been rewritten since it was hashed; only cache
+            # bytes that really are this hash
+            if (
+                len(file_data) <= self.blob_cache.max_entry_bytes
+                or self.blob_cache.is_pinned(hash)
+            ) and calculate_sha1(file_data) == hash:
+                self.blob_cache.put(hash, file_data)
         elif isinstance(file, BytesIO):
             file.seek(0)
             file_data = file.read()
+            _count_read("memory", file_data)
         elif isinstance(file, bytes):
             file_data = file
+            _count_read("memory", file_data)
         return file_data
 
     def get_srl(self, hash: str) -> Optional[SRL]:
-        if hash in self._map.keys():
+        if hash in self._map:
             return {"hash": hash, "url": f"/sonolus/repository/{hash}"}
         return None
 
@@ -0,0 +1,106 @@
+"""
+The repository's on-disk entries, persisted (levels_cache/repository.sqlite3)
+so a restart doesn't start from an empty repo._map.
+
+One row per backing file: path -> sha1 plus the file's size, mtime_ns and
+inode when it was added. Repository.restore() re-adds every row whose file
+still has that fingerprint without reading it; the scanner then finds each
+folder's committed hashes already served and skips the folder instead of
+re-reading (and re-hashing) its cover, music and score.
+
+Writes are batched like helpers.state_store (helpers.sqlite_store.WriteBehind):
+record()/delete() queue the row, a timer thread writes the batch in one
+transaction a moment later.
+"""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+from helpers.hash_manifest import Fingerprint
+from helpers.sqlite_store import Registry, WriteBehind, connect
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " key TEXT PRIMARY KEY,"
+    " file TEXT NOT NULL,"
+    " sha1 TEXT NOT NULL,"
+    " size INTEGER NOT NULL,"
+    " mtime_ns INTEGER NOT NULL,"
+    " inode INTEGER NOT NULL)"
+)
+
+FLUSH_DELAY = 1.0  # seconds between the first unsaved change and the write
+
+# key (normalized path) -> (file as added, sha1, fingerprint)
+Row = Tuple[str, str, Fingerprint]
+
+
+class RepositoryIndex:
+    def __init__(self, cache_dir: str | Path, flush_delay: float = FLUSH_DELAY):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / "repository.sqlite3"
+        self.flush_delay = flush_delay
+
+        # key -> row to write, or None to delete
+        self._writes = WriteBehind(self._write, flush_delay)
+
+        self._db_lock = threading.Lock()
+        self._db = connect(self.path, (_SCHEMA,))
+
+    def rows(self) -> Iterator[Tuple[str, Row]]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT key, file, sha1, size, mtime_ns, inode FROM entries"
+            ).fetchall()
+        for key, file, sha1, size, mtime_ns, inode in rows:
+            yield key, (file, sha1, (size, mtime_ns, inode))
+
+    # ----- write-behind -----
+
+    def record(self, key: str, file: str, sha1: str, fp: Fingerprint) -> None:
+        self._queue(key, (file, sha1, fp))
+
+    def delete(self, key: str) -> None:
+        self._queue(key, None)
+
+    def _queue(self, key: str, row: Optional[Row]) -> None:
+        self._writes.put(key, row)
+
+    def flush(self) -> None:
+        self._writes.flush()
+
+    def _write(self, pending: Dict[Hashable, Optional[Row]]) -> None:
+        upserts, deletes = [], []
+        for key, row in pending.items():
+            if row is None:
+                deletes.append((key,))
+            else:
+                file, sha1, fp = row
+                upserts.append((key, file, sha1, *fp))
+        with self._db_lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries"
+                    " (key, file, sha1, size, mtime_ns, inode)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    upserts,
+                )
+                self._db.executemany("DELETE FROM entries WHERE key = ?", deletes)
+
+    def close(self) -> None:
+        self._writes.close()
+        with self._db_lock:
+            self._db.close()
+
+
+_INDEXES: Registry[RepositoryIndex] = Registry()
+
+
+def get_repository_index(cache_dir: str | Path) -> RepositoryIndex:
+    key = Path(cache_dir).resolve()
+    return _INDEXES.get(key, lambda: RepositoryIndex(key))
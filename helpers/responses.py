@@ -0,0 +1,170 @@
+"""
+Responses for /sonolus/repository blobs.
+
+Large on-disk blobs are never read whole into memory: they go out through the
+ASGI zero-copy extension (sendfile) when the server offers it, otherwise in
+64 KiB chunks. Both paths, and the in-memory one, understand a single
+`Range: bytes=...` request and answer 206 / 416 accordingly.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Mapping, Optional, Tuple, Union
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 64 * 1024
+
+# (start, end) inclusive, or None for "send everything"
+ByteRange = Optional[Tuple[int, int]]
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> ByteRange:
+    """
+    Single-range `bytes=` parser. Anything we don't understand (other units,
+    multiple ranges, garbage) means "send the whole thing", which RFC 9110
+    allows. Raises RangeNotSatisfiable for ranges entirely past the end.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _range_headers(byte_range: ByteRange, size: int) -> dict:
+    headers = {"accept-ranges": "bytes"}
+    if byte_range is not None:
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return headers
+
+
+def range_not_satisfiable(size: int, headers: Optional[Mapping[str, str]] = None):
+    h = dict(headers or {})
+    h["content-range"] = f"bytes */{size}"
+    return Response(status_code=416, headers=h)
+
+
+def bytes_response(
+    data: bytes,
+    range_header: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    size = len(data)
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return range_not_satisfiable(size, headers)
+
+    h = dict(headers or {})
+    h.update(_range_headers(byte_range, size))
+    if byte_range is None:
+        return Response(content=data, headers=h, media_type=media_type)
+    start, end = byte_range
+    return Response(
+        content=memoryview(data)[start : end + 1].tobytes(),
+        status_code=206,
+        headers=h,
+        media_type=media_type,
+    )
+
+
+class FileRangeResponse(Response):
+    """
+    Streams [start, end] of a file with bounded memory.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        size: int,
+        byte_range: ByteRange = None,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+    ):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        if byte_range is None:
+            self.status_code = 200
+            self.start, self.length = 0, size
+        else:
+            self.status_code = 206
+            self.start, self.length = byte_range[0], byte_range[1] - byte_range[0] + 1
+
+        h = dict(headers or {})
+        h.update(_range_headers(byte_range, size))
+        h["content-length"] = str(self.length)
+        self.init_headers(h)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+            try:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": fd,
+                        "offset": self.start,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+            finally:
+                os.close(fd)
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            left = self.length
+            while left > 0:
+                chunk = await f.read(min(CHUNK_SIZE, left))
+                if not chunk:
+                    break  # truncated underneath us; nothing sane left to send
+                left -= len(chunk)
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": left > 0}
+                )
+            if left > 0:
+                await send(
+                    {"type": "http.response.body", "body": b"", "more_body": False}
+                )
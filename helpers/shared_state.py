@@ -0,0 +1,291 @@
+"""
+The level snapshot and the repository map, shared with other processes
+(levels_cache/shared.sqlite3), so several uvicorn workers can serve one
+library (main.py --workers N).
+
+One process scans, as before, and runs a SharedPublisher: on every snapshot
+it publishes, the levels and repository entries that changed since the last
+one are written in one transaction, each row stamped with a new version. The
+HTTP workers never scan; each polls that version (SharedFollower.poll) and
+applies only the rows newer than what it has, then publishes the result as
+its own snapshot, so the handlers read current_snapshot() and repo exactly
+as in a single process.
+
+The scanner's own metrics (scans, jobs, derived caches) go through the same
+store, as one JSON row rewritten every METRICS_INTERVAL, for the workers'
+/metrics.
+
+A removed level or repository entry stays behind as a row without data, so a
+follower that skipped versions still sees it go. Every publisher start
+clears the store and picks a new epoch; followers that see the epoch change
+reload everything.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import traceback
+import uuid
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from helpers.repository import repo
+from helpers.sqlite_store import connect
+from helpers.snapshot import (
+    LevelEntry,
+    LevelsSnapshot,
+    current_snapshot,
+    publish_snapshot,
+    subscribe,
+)
+
+_NAME = "shared.sqlite3"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    # entry / file NULL: removed in that version
+    "CREATE TABLE IF NOT EXISTS levels ("
+    " name TEXT PRIMARY KEY, entry TEXT, version INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS repository ("
+    " hash TEXT PRIMARY KEY, file TEXT, version INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS levels_version ON levels (version)",
+    "CREATE INDEX IF NOT EXISTS repository_version ON repository (version)",
+)
+
+# set in the scanning process, inherited by the uvicorn workers it starts
+WORKER_ENV = "SCORESYNC_SHARED_WORKER"
+
+POLL_INTERVAL = 0.1  # seconds between a worker's version checks
+METRICS_INTERVAL = 1.0  # seconds between the scanner's metrics updates
+
+
+def is_worker() -> bool:
+    return os.environ.get(WORKER_ENV) == "1"
+
+
+def _connect(cache_dir: str | Path) -> sqlite3.Connection:
+    path = Path(cache_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    # the workers read while the scanner writes; wait out its transactions
+    return connect(path / _NAME, _SCHEMA, timeout=30)
+
+
+def _repository_files() -> Dict[str, str]:
+    # in-memory entries (add_bytes) can't be shared; nothing the scanner adds is
+    return {
+        hash: str(item["file"])
+        for hash, item in repo.snapshot().items()
+        if isinstance(item["file"], (str, Path))
+    }
+
+
+class SharedPublisher:
+    def __init__(self, cache_dir: str | Path):
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self._levels: Mapping[str, LevelEntry] = {}
+        self._files: Dict[str, str] = {}
+        self._repo_version = -1
+        self._metrics: Optional[str] = None
+        self._lock = threading.Lock()
+        self._db = _connect(cache_dir)
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM levels")
+            self._db.execute("DELETE FROM repository")
+            self._db.execute("DELETE FROM meta WHERE key = 'metrics'")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (("epoch", self.epoch), ("version", "0")),
+            )
+
+    def publish(self, snapshot: LevelsSnapshot) -> None:
+        with self._lock:
+            levels = snapshot.levels
+            level_rows = [
+                (name, json.dumps(dict(entry)))
+                for name, entry in levels.items()
+                if self._levels.get(name) != entry
+            ]
+            level_rows.extend(
+                (name, None) for name in self._levels if name not in levels
+            )
+
+            files, file_rows = self._files, []
+            if repo.version != self._repo_version:
+                self._repo_version = repo.version  # before the copy: never skips one
+                files = _repository_files()
+                file_rows = [
+                    (hash, file)
+                    for hash, file in files.items()
+                    if self._files.get(hash) != file
+                ]
+                file_rows.extend(
+                    (hash, None) for hash in self._files if hash not in files
+                )
+
+            if not level_rows and not file_rows:
+                self._levels = levels
+                return
+            version = self.version + 1
+            try:
+                with self._db:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO repository (hash, file, version)"
+                        " VALUES (?, ?, ?)",
+                        [(*row, version) for row in file_rows],
+                    )
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO levels (name, entry, version)"
+                        " VALUES (?, ?, ?)",
+                        [(*row, version) for row in level_rows],
+                    )
+                    self._db.execute(
+                        "UPDATE meta SET value = ? WHERE key = 'version'",
+                        (str(version),),
+                    )
+            except sqlite3.Error:
+                traceback.print_exc()
+                self._repo_version = -1  # diff against the same base next time
+                return
+            self.version = version
+            self._levels = levels
+            self._files = files
+
+    def publish_metrics(self, state: Dict[str, Any]) -> None:
+        """
+        state: whatever routes/metrics.py needs from the scanner, JSON-able.
+        """
+        text = json.dumps(state, sort_keys=True)
+        with self._lock:
+            if text == self._metrics:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('metrics', ?)",
+                    (text,),
+                )
+            except sqlite3.Error:
+                traceback.print_exc()
+                return
+            self._metrics = text
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class SharedFollower:
+    def __init__(self, cache_dir: str | Path):
+        self.epoch: Optional[str] = None
+        self.version = 0
+        self._files: Dict[str, str] = {}  # what this process added from the store
+        self._lock = threading.Lock()  # poll() and metrics() share the connection
+        self._db = _connect(cache_dir)
+
+    def _read_meta(self) -> Dict[str, str]:
+        return dict(
+            self._db.execute(
+                "SELECT key, value FROM meta WHERE key IN ('epoch', 'version')"
+            ).fetchall()
+        )
+
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        The scanner's latest publish_metrics() state, None before the first.
+        """
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value FROM meta WHERE key = 'metrics'"
+                ).fetchone()
+        except sqlite3.Error:
+            traceback.print_exc()
+            return None
+        return json.loads(row[0]) if row else None
+
+    def poll(self) -> bool:
+        """
+        Applies whatever the publisher wrote since the last call. Returns
+        whether anything changed.
+        """
+        try:
+            with self._lock, self._db:
+                # one read transaction: rows and version from the same commit
+                self._db.execute("BEGIN")
+                meta = self._read_meta()
+                epoch, version = meta.get("epoch"), int(meta.get("version", 0))
+                if epoch == self.epoch and version == self.version:
+                    return False
+                since = self.version if epoch == self.epoch else 0
+                files = self._db.execute(
+                    "SELECT hash, file FROM repository WHERE version > ?", (since,)
+                ).fetchall()
+                levels = self._db.execute(
+                    "SELECT name, entry FROM levels WHERE version > ?", (since,)
+                ).fetchall()
+        except sqlite3.Error:
+            traceback.print_exc()
+            return False
+
+        reload = epoch != self.epoch
+        if reload:
+            gone = set(self._files).difference(hash for hash, _ in files)
+            files.extend((hash, None) for hash in gone)
+        self._apply(files, levels, reload)
+        self.epoch, self.version = epoch, version
+        return True
+
+    def _apply(self, files: list, levels: list, reload: bool) -> None:
+        # new blobs before the levels that point at them, removals after
+        removed = []
+        for hash, file in files:
+            if file is None:
+                if self._files.pop(hash, None) is not None:
+                    removed.append(hash)
+            else:
+                # an entry moved to another folder's copy keeps its hash
+                if not repo.relocate(hash, file):
+                    repo.add_file(file, sha1=hash)
+                self._files[hash] = file
+
+        out = {} if reload else dict(current_snapshot().levels)
+        added = False
+        for name, entry in levels:
+            if entry is None:
+                out.pop(name, None)
+            else:
+                added = added or name not in out
+                out[name] = MappingProxyType(json.loads(entry))
+        if added:
+            out = dict(sorted(out.items(), key=lambda kv: kv[0].lower()))
+        if levels or reload:
+            publish_snapshot(out, None if reload else (name for name, _ in levels))
+
+        for hash in removed:
+            repo.remove_hash(hash)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_PUBLISHER: Optional[SharedPublisher] = None
+
+
+def start_publishing(cache_dir: str | Path) -> SharedPublisher:
+    """
+    Makes this process the scanner: every snapshot it publishes from now on
+    goes to the store, and the processes it starts afterwards are workers.
+    """
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        _PUBLISHER = SharedPublisher(cache_dir)
+        subscribe(_PUBLISHER.publish)
+        os.environ[WORKER_ENV] = "1"
+    return _PUBLISHER
@@ -0,0 +1,125 @@
+"""
+Read-only view of the level library, published by the scanner.
+
+Only helpers.levels publishes (in the HTTP workers of a multi-process server,
+helpers.shared_state, replaying what the scanning process published). Request
+handlers call current_snapshot() and read from it directly: a plain reference
+read (atomic under the GIL), with no lock, no executor hop and no copy. A new
+snapshot reuses the entry mappings of unchanged folders, so publishing costs
+one dict, not a deep copy.
+"""
+
+from __future__ import annotations
+
+import traceback
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from helpers.level_index import EMPTY_INDEX, LevelIndex
+
+# id, cover, background, music, score (hashes or None), modified (ns)
+LevelEntry = Mapping[str, Any]
+
+
+class LevelsSnapshot(NamedTuple):
+    version: int
+    levels: Mapping[str, LevelEntry]  # folder name -> entry, sorted by name
+    by_id: Mapping[str, str]  # level id -> folder name
+    search: LevelIndex  # keyword index + name/modified orderings
+
+    def find(self, item_name: str) -> Optional[Tuple[str, LevelEntry]]:
+        """
+        O(1) lookup by level id, falling back to the folder name.
+        """
+        folder_name = self.by_id.get(item_name)
+        if folder_name is None and item_name in self.levels:
+            folder_name = item_name
+        if folder_name is None:
+            return None
+        entry = self.levels.get(folder_name)
+        if entry is None:
+            return None
+        return folder_name, entry
+
+
+_EMPTY = MappingProxyType({})
+_CURRENT = LevelsSnapshot(0, _EMPTY, _EMPTY, EMPTY_INDEX)
+_LISTENERS: List[Callable[[LevelsSnapshot], None]] = []
+
+
+def current_snapshot() -> LevelsSnapshot:
+    return _CURRENT
+
+
+def subscribe(listener: Callable[[LevelsSnapshot], None]) -> None:
+    """
+    Calls listener(snapshot) after every publish, on the publishing thread.
+    """
+    _LISTENERS.append(listener)
+
+
+def _build_id_index(levels: Mapping[str, LevelEntry]) -> Dict[str, str]:
+    return {entry["id"]: name for name, entry in levels.items()}
+
+
+def _update_id_index(
+    previous: LevelsSnapshot,
+    levels: Mapping[str, LevelEntry],
+    touched: Iterable[str],
+) -> Dict[str, str]:
+    # a rename shows up as two touched names: the old one gone, the new one added
+    touched = tuple(touched)
+    by_id = dict(previous.by_id)
+    for name in touched:
+        old = previous.levels.get(name)
+        if old is not None and by_id.get(old["id"]) == name:
+            del by_id[old["id"]]
+    for name in touched:
+        new = levels.get(name)
+        if new is not None:
+            by_id[new["id"]] = name
+    return by_id
+
+
+def publish_snapshot(
+    levels: Dict[str, LevelEntry], touched: Optional[Iterable[str]] = None
+) -> LevelsSnapshot:
+    """
+    `levels` must not be mutated after this call.
+
+    `touched` lists the folder names that may have been added, changed or
+    removed since the current snapshot; the id and search indexes are then
+    patched instead of rebuilt. None means "anything may have changed".
+    """
+    global _CURRENT
+    previous = _CURRENT
+    if touched is None or previous.version == 0:
+        by_id = _build_id_index(levels)
+        search = LevelIndex.build(levels)
+    else:
+        touched = tuple(touched)
+        by_id = _update_id_index(previous, levels, touched)
+        search = previous.search.updated(previous.levels, levels, touched)
+    snapshot = LevelsSnapshot(
+        previous.version + 1,
+        MappingProxyType(levels),
+        MappingProxyType(by_id),
+        search,
+    )
+    _CURRENT = snapshot
+    for listener in _LISTENERS:
+        try:
+            listener(snapshot)
+        except Exception:
+            traceback.print_exc()  # never fails the scan that published
+    return snapshot
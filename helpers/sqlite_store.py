@@ -0,0 +1,138 @@
+"""
+What the SQLite files under levels_cache have in common (helpers.state_store,
+repository_index, hash_manifest, derived_cache, shared_state):
+
+  - connect(): one connection shared by the store's threads, autocommit (the
+    stores BEGIN their own transactions), WAL, so a process killed halfway
+    through a write leaves the file consistent;
+  - Registry: one store per cache directory, closed at exit;
+  - WriteBehind: rows queued by key and written in one batch by a timer
+    thread a moment after the first unsaved change.
+"""
+
+from __future__ import annotations
+
+import atexit
+import sqlite3
+import threading
+import traceback
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+def connect(
+    path: str | Path, schema: Iterable[str] = (), timeout: float = 5.0
+) -> sqlite3.Connection:
+    db = sqlite3.connect(
+        path, check_same_thread=False, isolation_level=None, timeout=timeout
+    )
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        db.execute(statement)
+    return db
+
+
+class Registry(Generic[T]):
+    """
+    key -> store, created on first use. Every store still open at exit gets
+    its close() called (which flushes what it has queued).
+    """
+
+    def __init__(self):
+        self._items: Dict[Hashable, T] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close_all)
+
+    def get(
+        self,
+        key: Hashable,
+        create: Callable[[], T],
+        reuse: Callable[[T], bool] = lambda item: True,
+    ) -> T:
+        """
+        The store under key, or create()'s, which replaces one reuse()
+        turns down.
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or not reuse(item):
+                item = self._items[key] = create()
+            return item
+
+    def values(self) -> List[T]:
+        with self._lock:
+            return list(self._items.values())
+
+    def close_all(self) -> None:
+        with self._lock:
+            for item in self._items.values():
+                try:
+                    item.close()
+                except Exception:
+                    traceback.print_exc()
+            self._items.clear()
+
+
+class WriteBehind:
+    """
+    put() queues a row under its key (a newer row replaces a queued one);
+    write(rows) gets the whole batch on a timer thread, flush_delay after the
+    first unsaved change, so a key that keeps changing still gets written
+    regularly. A batch that fails with sqlite3.Error is queued again, behind
+    anything newer.
+    """
+
+    def __init__(self, write: Callable[[Dict[Hashable, Any]], None], delay: float):
+        self._write = write
+        self.delay = delay
+        self._pending: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def put(self, key: Hashable, row: Any) -> None:
+        with self._lock:
+            self._pending[key] = row
+            self._schedule_locked()
+
+    def _schedule_locked(self) -> None:
+        if self._timer is not None:
+            return
+        self._timer = threading.Timer(self.delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending:
+            return
+        try:
+            self._write(pending)
+        except sqlite3.Error:
+            traceback.print_exc()
+            # keep the rows for the next attempt unless newer ones arrived
+            with self._lock:
+                for key, row in pending.items():
+                    self._pending.setdefault(key, row)
+                self._schedule_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.flush()
@@ -0,0 +1,128 @@
+"""
+Persistent per-folder level state (replaces levels_cache/cache.json).
+
+State lives in memory; the scanner hands over changed folders with put(),
+which serializes them right away. A timer thread writes only those rows to
+levels_cache/state.sqlite3 a moment later, in one transaction
+(helpers.sqlite_store.WriteBehind). SQLite in WAL mode keeps the file
+consistent if the process dies halfway through a write.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Hashable
+
+from helpers.sqlite_store import Registry, WriteBehind, connect
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS folders (id TEXT PRIMARY KEY, state TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS folder_ids (name TEXT PRIMARY KEY, id TEXT NOT NULL)",
+)
+
+FLUSH_DELAY = 1.0  # seconds between the first unsaved change and the write
+
+
+class LevelStateStore:
+    def __init__(self, cache_dir: str | Path, flush_delay: float = FLUSH_DELAY):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / "state.sqlite3"
+        self.flush_delay = flush_delay
+
+        # only the scanner thread touches these
+        self.folders: Dict[str, Dict[str, Any]] = {}  # uuid -> folder_state
+        self.folder_ids: Dict[str, str] = {}  # folder_name -> uuid
+
+        # ("folders", uuid) -> serialized state, ("folder_ids", name) -> uuid
+        self._writes = WriteBehind(self._write, flush_delay)
+
+        self._db_lock = threading.Lock()
+        self._db = connect(self.path, _SCHEMA)
+
+        self._load()
+
+    # ----- loading -----
+
+    def _load(self) -> None:
+        with self._db_lock:
+            for folder_id, state in self._db.execute("SELECT id, state FROM folders"):
+                try:
+                    self.folders[folder_id] = json.loads(state)
+                except ValueError:
+                    continue
+            for name, folder_id in self._db.execute("SELECT name, id FROM folder_ids"):
+                self.folder_ids[name] = folder_id
+
+        if not self.folders and not self.folder_ids:
+            self._import_legacy_cache()
+
+    def _import_legacy_cache(self) -> None:
+        legacy = self.cache_dir / "cache.json"
+        if not legacy.exists():
+            return
+        try:
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+        except Exception:
+            traceback.print_exc()
+            return
+        if not isinstance(data, dict):
+            return
+
+        for folder_id, state in (data.get("folders") or {}).items():
+            if isinstance(state, dict):
+                self.folders[folder_id] = state
+                self.put(folder_id, state)
+        for name, folder_id in (data.get("folder_ids") or {}).items():
+            self.set_folder_id(name, folder_id)
+        self.flush()
+        legacy.replace(legacy.with_name("cache.json.migrated"))
+
+    # ----- write-behind -----
+
+    def set_folder_id(self, folder_name: str, folder_id: str) -> None:
+        self.folder_ids[folder_name] = folder_id
+        self._writes.put(("folder_ids", folder_name), folder_id)
+
+    def put(self, folder_id: str, folder_state: Dict[str, Any]) -> None:
+        """
+        Marks a folder dirty. Serialized now, so the scanner may keep mutating
+        folder_state while the flush thread writes the previous version.
+        """
+        self.folders[folder_id] = folder_state
+        row = json.dumps(folder_state, separators=(",", ":"))
+        self._writes.put(("folders", folder_id), row)
+
+    def flush(self) -> None:
+        self._writes.flush()
+
+    def _write(self, rows: Dict[Hashable, str]) -> None:
+        folders = [(key[1], row) for key, row in rows.items() if key[0] == "folders"]
+        ids = [(key[1], row) for key, row in rows.items() if key[0] == "folder_ids"]
+        with self._db_lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO folders (id, state) VALUES (?, ?)",
+                    folders,
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO folder_ids (name, id) VALUES (?, ?)",
+                    ids,
+                )
+
+    def close(self) -> None:
+        self._writes.close()
+        with self._db_lock:
+            self._db.close()
+
+
+_STORES: Registry[LevelStateStore] = Registry()
+
+
+def get_state_store(cache_dir: str | Path) -> LevelStateStore:
+    key = Path(cache_dir).resolve()
+    return _STORES.get(key, lambda: LevelStateStore(key))
@@ -0,0 +1,270 @@
+"""
+Turns filesystem events under levels/ into per-folder dirty marks.
+
+On Linux this talks to inotify directly through ctypes (no extra dependency).
+Everywhere else, or if inotify can't be set up, it falls back to polling,
+which just tells the loader to rescan everything on every tick.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+# -----------------------------
+# inotify constants (linux/inotify.h)
+# -----------------------------
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# editors write in bursts (truncate, write, close, rename), so after the first
+# event keep draining for a moment and hand the loader one coalesced batch
+_SETTLE_SECONDS = 0.05
+
+
+class PollingWatcher:
+    """
+    Fallback: no events, so every tick is a full rescan (the old behaviour).
+    """
+
+    event_driven = False
+
+    def __init__(self, levels_dir: str | Path, interval: float = 0.1):
+        self.levels_dir = Path(levels_dir)
+        self.interval = interval
+
+    def mark_scanned(self) -> None:
+        pass
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        time.sleep(min(timeout, self.interval))
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watches levels/ and every folder directly inside it.
+
+    wait() returns:
+      - a set of folder names that changed (possibly empty on timeout)
+      - None when the loader must rescan everything (queue overflow,
+        levels/ itself deleted or moved, watches could not be re-established)
+    """
+
+    event_driven = True
+
+    def __init__(self, levels_dir: str | Path):
+        self.levels_dir = Path(levels_dir)
+
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+
+        self._root_wd: Optional[int] = None
+        self._folders: Dict[int, str] = {}  # wd -> folder name
+        # first wait() asks for a full scan, unless mark_scanned() says the
+        # caller did one
+        self._needs_full = True
+
+        self._watch_root()
+
+    # ----- watch management -----
+
+    def _add_watch(self, path: Path) -> int:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def _watch_root(self) -> bool:
+        for wd in list(self._folders):
+            self._libc.inotify_rm_watch(self._fd, wd)
+        self._folders.clear()
+        if self._root_wd is not None:
+            self._libc.inotify_rm_watch(self._fd, self._root_wd)
+            self._root_wd = None
+
+        try:
+            self._root_wd = self._add_watch(self.levels_dir)
+        except OSError:
+            return False
+
+        try:
+            with os.scandir(self.levels_dir) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        self._watch_folder(entry.name)
+        except OSError:
+            return False
+        return True
+
+    def _watch_folder(self, name: str) -> None:
+        try:
+            wd = self._add_watch(self.levels_dir / name)
+        except OSError:
+            return
+        # a renamed folder keeps its wd, so this also handles MOVED_TO
+        self._folders[wd] = name
+
+    # ----- event reading -----
+
+    def _read_events(self, dirty: Set[str]) -> None:
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if not buf:
+                return
+
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                raw_name = buf[offset : offset + length].split(b"\0", 1)[0]
+                offset += length
+                name = os.fsdecode(raw_name)
+                self._handle_event(wd, mask, name, dirty)
+
+    def _handle_event(self, wd: int, mask: int, name: str, dirty: Set[str]) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self._needs_full = True
+            return
+
+        if wd == self._root_wd:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                self._root_wd = None
+                self._needs_full = True
+                return
+            if not (mask & IN_ISDIR) or not name:
+                return  # loose files in levels/ are not levels
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_folder(name)
+            dirty.add(name)
+            return
+
+        folder = self._folders.get(wd)
+        if folder is None:
+            return
+        if mask & IN_IGNORED:
+            # folder deleted or moved out; the root event already marked it
+            self._folders.pop(wd, None)
+            return
+        dirty.add(folder)
+
+    def mark_scanned(self) -> None:
+        """
+        The caller has just scanned everything itself, after this watcher was
+        created: the first wait() then reports the folders that changed since
+        instead of asking for another full scan.
+        """
+        self._needs_full = False
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        if self._root_wd is None:
+            if not self._watch_root():
+                time.sleep(timeout)
+                return None
+            self._needs_full = True
+
+        if self._needs_full:
+            self._needs_full = False
+            self._read_events(set())  # drop anything a full scan covers anyway
+            return None
+
+        dirty: Set[str] = set()
+        try:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+        except InterruptedError:
+            return dirty
+        if not ready:
+            return dirty
+
+        self._read_events(dirty)
+        deadline = time.monotonic() + _SETTLE_SECONDS
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            ready, _, _ = select.select([self._fd], [], [], left)
+            if not ready:
+                break
+            self._read_events(dirty)
+
+        if self._needs_full or self._root_wd is None:
+            self._needs_full = False
+            if self._root_wd is None:
+                self._watch_root()
+            return None
+        return dirty
+
+    def close(self) -> None:
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+
+def create_watcher(levels_dir: str | Path) -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(levels_dir)
+        except (OSError, AttributeError):
+            # AttributeError: libc without inotify symbols (e.g. some musl builds)
+            pass
+    return PollingWatcher(levels_dir)
@@ -0,0 +1,250 @@
+"""
+Random-access reader for `outer.zip|inner.zip|file` chains.
+
+The outermost archive is opened once and read with positional reads. Stored
+(uncompressed) inner archives are opened in place through a window over
+their byte range, without copying them. Only deflated inner archives get
+decompressed into memory. Open ZipFile handles are kept in a small LRU keyed
+by the chain and the outer file's (mtime_ns, size), so an edited archive is
+picked up on the next read; a timer closes the ones left idle for max_idle.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from zipfile import ZIP_STORED, ZipFile, ZipInfo
+
+_LOCAL_HEADER = struct.Struct("<4s22xHH")  # signature, ..., name len, extra len
+_LOCAL_MAGIC = b"PK\x03\x04"
+
+
+class _OuterFile:
+    """
+    One open handle on the outermost archive, shared by every window into it.
+    """
+
+    def __init__(self, path: str):
+        self._f = open(path, "rb")
+        self._lock = threading.Lock()
+        self.refs = 0
+
+    def pread(self, offset: int, n: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self._f.fileno(), n, offset)
+        with self._lock:
+            self._f.seek(offset)
+            return self._f.read(n)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _Window(io.RawIOBase):
+    """
+    Seekable read-only view of [offset, offset + size) of an _OuterFile.
+    Keeps its own position, so windows never disturb each other.
+    """
+
+    def __init__(self, outer: _OuterFile, offset: int, size: int):
+        super().__init__()
+        self.outer = outer
+        self.offset = offset
+        self.size = size
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        if pos < 0:
+            raise ValueError("negative seek position")
+        self._pos = pos
+        return pos
+
+    def read(self, n: int = -1) -> bytes:
+        left = self.size - self._pos
+        if left <= 0:
+            return b""
+        if n is None or n < 0 or n > left:
+            n = left
+        data = self.outer.pread(self.offset + self._pos, n)
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+
+class _Handle:
+    def __init__(self, zf: ZipFile, outer: _OuterFile, window: Optional[_Window]):
+        self.zf = zf
+        self.outer = outer
+        self.window = window  # None when the archive was decompressed into memory
+        self.used = time.monotonic()
+
+
+class NestedZipReader:
+    def __init__(self, max_handles: int = 16, max_idle: float = 10.0):
+        self.max_handles = max_handles
+        # open handles keep the archive locked on Windows; let go of idle ones
+        self.max_idle = max_idle
+        self._handles: "OrderedDict[tuple, _Handle]" = OrderedDict()
+        self._outers: dict = {}  # (path, mtime_ns, size) -> _OuterFile
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Timer] = None
+
+    # ----- handle cache -----
+
+    def _release(self, handle: _Handle) -> None:
+        handle.zf.close()
+        handle.outer.refs -= 1
+        if handle.outer.refs <= 0:
+            for k, v in list(self._outers.items()):
+                if v is handle.outer:
+                    del self._outers[k]
+            handle.outer.close()
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        while self._handles:
+            key, handle = next(iter(self._handles.items()))
+            if (
+                len(self._handles) <= self.max_handles
+                and (now - handle.used) < self.max_idle
+            ):
+                break
+            del self._handles[key]
+            self._release(handle)
+
+    def _schedule_sweep_locked(self) -> None:
+        # reads alone never close the last handles once reads stop coming
+        if self._sweeper is not None or not self._handles:
+            return
+        oldest = next(iter(self._handles.values()))
+        delay = max(0.0, oldest.used + self.max_idle - time.monotonic())
+        self._sweeper = threading.Timer(delay, self._sweep)
+        self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def _sweep(self) -> None:
+        with self._lock:
+            self._sweeper = None
+            self._evict_locked()
+            self._schedule_sweep_locked()
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._handles:
+                _, handle = self._handles.popitem(last=False)
+                self._release(handle)
+
+    # ----- opening -----
+
+    def _outer_for(self, outer_key: tuple) -> _OuterFile:
+        outer = self._outers.get(outer_key)
+        if outer is None:
+            outer = self._outers[outer_key] = _OuterFile(outer_key[0])
+        return outer
+
+    @staticmethod
+    def _member_window(parent: _Handle, info: ZipInfo) -> Optional[_Window]:
+        """
+        Window over a stored member's bytes, or None if it must be decompressed.
+        """
+        if parent.window is None or info.compress_type != ZIP_STORED:
+            return None
+        if info.flag_bits & 0x1:  # encrypted
+            return None
+        base = parent.window.offset + info.header_offset
+        header = parent.outer.pread(base, _LOCAL_HEADER.size)
+        if len(header) != _LOCAL_HEADER.size:
+            return None
+        magic, name_len, extra_len = _LOCAL_HEADER.unpack(header)
+        if magic != _LOCAL_MAGIC:
+            return None
+        data_offset = base + _LOCAL_HEADER.size + name_len + extra_len
+        return _Window(parent.outer, data_offset, info.compress_size)
+
+    def _open_locked(self, outer_key: tuple, chain: Tuple[str, ...]) -> _Handle:
+        key = outer_key + chain
+        handle = self._handles.get(key)
+        if handle is not None:
+            self._handles.move_to_end(key)
+            handle.used = time.monotonic()
+            return handle
+
+        if len(chain) == 1:
+            outer = self._outer_for(outer_key)
+            window = _Window(outer, 0, outer_key[2])
+            handle = _Handle(ZipFile(window), outer, window)
+        else:
+            parent = self._open_locked(outer_key, chain[:-1])
+            info = self._getinfo(parent.zf, chain[-1])
+            window = self._member_window(parent, info)
+            if window is not None:
+                handle = _Handle(ZipFile(window), parent.outer, window)
+            else:
+                data = parent.zf.read(info)
+                handle = _Handle(ZipFile(io.BytesIO(data)), parent.outer, None)
+
+        handle.outer.refs += 1
+        self._handles[key] = handle
+        return handle
+
+    @staticmethod
+    def _getinfo(zf: ZipFile, name: str) -> ZipInfo:
+        try:
+            return zf.getinfo(name)
+        except KeyError:
+            raise FileNotFoundError(f"{name} not found in zip chain")
+
+    # ----- public -----
+
+    def read(self, parts: list[str]) -> bytes:
+        """
+        parts[0] is a real file on disk, every following part is a member of
+        the archive before it; returns the bytes of the last one.
+        """
+        if len(parts) == 1:
+            with open(parts[0], "rb") as f:
+                return f.read()
+
+        path = os.path.abspath(parts[0])
+        st = os.stat(path)
+        outer_key = (path, st.st_mtime_ns, st.st_size)
+        archives = (path,) + tuple(parts[1:-1])
+
+        # the read stays under the lock so the handle can't be evicted (and
+        # closed) halfway through; members here are covers/scores, not bgm
+        with self._lock:
+            self._evict_locked()
+            try:
+                handle = self._open_locked(outer_key, archives)
+                info = self._getinfo(handle.zf, parts[-1])
+                window = self._member_window(handle, info)
+                if window is not None:
+                    return window.read()
+                return handle.zf.read(info)
+            finally:
+                self._schedule_sweep_locked()
+
+
+zip_reader = NestedZipReader()
@@ -1,8 +1,47 @@
 def main():
+    import multiprocessing
+
+    if multiprocessing.parent_process() is not None:
+        # a helpers.jobs worker re-running the entry point (spawn, zipapp)
+        return
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time scan phases per folder and dump cProfiles of slow scans/requests",
+    )
+    parser.add_argument(
+        "--profile-dir", help="where dumps and report.txt go (levels_cache/profiles)"
+    )
+    parser.add_argument(
+        "--profile-threshold",
+        type=float,
+        help="seconds a scan or request may take before it's dumped (1.0)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="HTTP worker processes; above 1 the main process only scans (1)",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        # before the app is imported, so the job workers inherit it
+        from helpers import profiling
+
+        profiling.configure(True, args.profile_dir, args.profile_threshold)
+
     import asyncio
-    from app import start_fastapi
+    import app
 
-    asyncio.run(start_fastapi())
+    workers = args.workers or app.WORKERS
+    if workers > 1:
+        app.serve_workers(workers)
+    else:
+        asyncio.run(app.start_fastapi())
 
 
 if __name__ == "__main__":
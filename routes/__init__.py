@@ -1,6 +1,7 @@
-from . import homepage, levels, level_details, repository
+from . import homepage, levels, level_details, metrics, repository
 
 routers = [
+    metrics.router,
     repository.router,
     homepage.router,
     levels.router,
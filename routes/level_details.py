@@ -1,6 +1,7 @@
 from helpers.sonolus_typings import ItemType
-from helpers.create_level_item import create_level_item
-from helpers.levels import load_levels_directory
+from helpers.compression import encoded_response, negotiate
+from helpers.level_json import level_json
+from helpers.snapshot import current_snapshot
 from fastapi import APIRouter, Request, HTTPException, status
 
 router = APIRouter()
@@ -9,39 +10,18 @@ router = APIRouter()
 @router.get("/sonolus/{item_type}/{item_name}")
 async def main(request: Request, item_type: ItemType, item_name: str):
 
-    level_data = await request.app.run_blocking(
-        load_levels_directory, request.app.bgver
-    )
-    found_level_data = next(
-        ((k, d) for k, d in level_data.items() if d["id"] == item_name), None
+    found = level_json.detail(
+        current_snapshot(),
+        request.app.files,
+        item_name,
+        encoding=negotiate(request.headers.get("accept-encoding")),
     )
 
-    if not found_level_data:
+    if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    item = create_level_item(request, found_level_data[1], found_level_data[0])
-
-    if item["cover"] == None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"\n\n.png/.jpg/.jpeg???\n/levels/{found_level_data[0]}",
-        )
-    if item["bgm"] == None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"\n\n.mp3/.ogg???\n/levels/{found_level_data[0]}",
-        )
-    if item["data"] == None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"\n\n.sus/.usc/LevelData/.json/.gz/.mmws/.ccmmws/.unchmmws???\n/levels/{found_level_data[0]}",
-        )
+    body, error, encoding = found
+    if error is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
 
-    data = {
-        "item": item,
-        "actions": [],
-        "hasCommunity": False,
-        "leaderboards": [],
-        "sections": [],
-    }
-    return data
+    return encoded_response(body, encoding, "application/json")
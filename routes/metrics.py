@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Request, HTTPException, Response, status
+
+from helpers import metrics
+from helpers.compression import variants
+from helpers.derived_cache import derived_caches
+from helpers.jobs import pipeline
+from helpers.repository import repo
+from helpers.snapshot import current_snapshot
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _scanner_samples() -> dict:
+    return {
+        "derived_cache_bytes": {c.name: c.total_bytes() for c in derived_caches()},
+        "jobs": pipeline.in_flight,
+    }
+
+
+def scanner_state() -> dict:
+    """
+    What only the scanning process knows, for app.serve_workers to hand to
+    the HTTP workers through helpers.shared_state.
+    """
+    state = _scanner_samples()
+    state["metrics"] = metrics.render(only=metrics.SCANNER)
+    return state
+
+
+def _state_samples(app, scanner: dict):
+    blob = repo.blob_cache.stats()
+    compressed = variants.cache.stats()
+    work_queue = getattr(app.executor, "_work_queue", None)
+    return [
+        (
+            "scoresync_levels",
+            "gauge",
+            "Levels in the published snapshot.",
+            {"": len(current_snapshot().levels)},
+        ),
+        (
+            "scoresync_repository_files",
+            "gauge",
+            "Blobs /sonolus/repository can serve.",
+            {"": len(repo)},
+        ),
+        (
+            "scoresync_blob_cache_lookups_total",
+            "counter",
+            "Blob cache lookups by result.",
+            {
+                '{cache="blobs",result="hit"}': blob["hits"],
+                '{cache="blobs",result="miss"}': blob["misses"],
+                '{cache="compressed",result="hit"}': compressed["hits"],
+                '{cache="compressed",result="miss"}': compressed["misses"],
+            },
+        ),
+        (
+            "scoresync_blob_cache_hit_ratio",
+            "gauge",
+            "Hits / lookups since start.",
+            {
+                '{cache="blobs"}': blob["hit_rate"],
+                '{cache="compressed"}': compressed["hit_rate"],
+            },
+        ),
+        (
+            "scoresync_blob_cache_bytes",
+            "gauge",
+            "Bytes held in memory, pinned blobs included.",
+            {
+                '{cache="blobs"}': blob["resident_bytes"],
+                '{cache="compressed"}': compressed["resident_bytes"],
+            },
+        ),
+        (
+            "scoresync_derived_cache_bytes",
+            "gauge",
+            "On-disk size of the conversion and background caches.",
+            {
+                f'{{cache="{name}"}}': size
+                for name, size in scanner.get("derived_cache_bytes", {}).items()
+            },
+        ),
+        (
+            "scoresync_queue_depth",
+            "gauge",
+            "Request-side thread pool backlog, and conversion/render jobs "
+            "queued or running.",
+            {
+                '{executor="threads"}': work_queue.qsize() if work_queue else 0,
+                '{executor="jobs"}': scanner.get("jobs", 0),
+            },
+        ),
+    ]
+
+
+@router.get("/metrics")
+async def main(request: Request):
+    if not metrics.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    follower = request.app.follower
+    if follower is None:
+        body = metrics.render(_state_samples(request.app, _scanner_samples()))
+    else:
+        # a worker (app.serve_workers): scans and jobs run in the main process
+        scanner = await request.app.run_blocking(follower.metrics) or {}
+        body = metrics.render(
+            _state_samples(request.app, scanner), exclude=metrics.SCANNER
+        ) + scanner.get("metrics", "")
+    return Response(content=body, media_type=CONTENT_TYPE)
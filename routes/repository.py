@@ -1,14 +1,134 @@
 from fastapi import APIRouter, Request, status, Response
 from fastapi import HTTPException
 
+from helpers.compression import (
+    ENCODINGS,
+    compressible_type,
+    encoded_response,
+    negotiate,
+    variants,
+)
 from helpers.repository import repo
+from helpers.responses import (
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    bytes_response,
+    parse_range,
+    range_not_satisfiable,
+)
 
 router = APIRouter()
 
+# blobs are addressed by their sha1, so a given URL never changes content
+CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-@router.get("/sonolus/repository/{hash}")
+# on-disk blobs above this (bgm, covers) are streamed rather than read whole
+STREAM_THRESHOLD = 1024 * 1024
+
+
+def _etag_matches(header: str | None, *etags: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+def _encoded_etag(hash: str, encoding: str) -> str:
+    return f'"{hash}-{encoding}"'
+
+
+def _load(hash: str, encoding: str | None, media_type: str | None):
+    data = repo.get_file(hash)
+    if data is None:
+        return None, None
+    return data, variants.get(hash, data, encoding, media_type)
+
+
+@router.api_route("/sonolus/repository/{hash}", methods=["GET", "HEAD"])
 async def main(request: Request, hash: str):
-    file_data = await request.app.run_blocking(repo.get_file, hash)
-    if file_data:
-        return Response(content=file_data)
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not repo.has_hash(hash):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    etag = f'"{hash}"'
+    headers = {"etag": etag, "cache-control": CACHE_CONTROL}
+    # same content whichever encoding the client got, so any tag of it will do
+    if _etag_matches(
+        request.headers.get("if-none-match"),
+        etag,
+        *(_encoded_etag(hash, e) for e in ENCODINGS),
+    ):
+        # revalidations never touch the disk: a type not known yet (it would
+        # take a sniff) keeps the vary, as a compressible one would
+        if compressible_type(repo.get_media_type(hash, sniff=False)):
+            headers["vary"] = "Accept-Encoding"
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type = repo.get_media_type(hash, sniff=False)
+    if media_type is None:
+        media_type = await request.app.run_blocking(repo.get_media_type, hash)
+    compressible = compressible_type(media_type)
+    if compressible:
+        headers["vary"] = "Accept-Encoding"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+    head = request.method == "HEAD"
+    # ranges are always of the identity encoding
+    encoding = None
+    if compressible and range_header is None:
+        encoding = negotiate(request.headers.get("accept-encoding"))
+
+    # the response is cached for good: never send a file that no longer
+    # holds this hash (rewritten in place, not rescanned yet)
+    try:
+        on_disk = await request.app.run_blocking(repo.stat_file, hash)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    file_path, size = on_disk if on_disk is not None else (None, None)
+
+    # ranges and bigger on-disk blobs (bgm) are streamed, never held in
+    # memory; pinned blobs are in memory already
+    if (
+        size is not None
+        and encoding is None
+        and (
+            range_header is not None
+            or (size > STREAM_THRESHOLD and not repo.blob_cache.is_pinned(hash))
+        )
+    ):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return range_not_satisfiable(size, headers)
+        return FileRangeResponse(file_path, size, byte_range, headers, media_type)
+
+    if head and size is not None and encoding is None:
+        headers.update({"content-length": str(size), "accept-ranges": "bytes"})
+        return Response(headers=headers, media_type=media_type)
+
+    file_data, compressed = await request.app.run_blocking(
+        _load, hash, encoding, media_type
+    )
+    if file_data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if compressed is not None:
+        headers["etag"] = _encoded_etag(hash, encoding)
+        if head:
+            headers["content-length"] = str(len(compressed))
+            return encoded_response(b"", encoding, media_type, headers)
+        return encoded_response(compressed, encoding, media_type, headers)
+    if head:
+        headers.update(
+            {"content-length": str(len(file_data)), "accept-ranges": "bytes"}
+        )
+        return Response(headers=headers, media_type=media_type)
+    return bytes_response(file_data, range_header, headers, media_type)
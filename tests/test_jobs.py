@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from helpers.jobs import JobPipeline
+
+
+def _square(x):
+    time.sleep(0.3)
+    return x * x
+
+
+def _hang():
+    time.sleep(60)
+
+
+def test_timeout_only_fails_the_hung_job():
+    pipeline = JobPipeline(max_workers=2)
+    try:
+        hung = pipeline.submit(_hang, timeout=2.0)
+        healthy = [pipeline.submit(_square, x, timeout=30.0) for x in range(20)]
+
+        # resolve the hung one first, so the rest are still queued or running
+        # when its pool gets killed
+        assert hung.result() is None
+        assert [job.result() for job in healthy] == [x * x for x in range(20)]
+    finally:
+        pipeline.shutdown(kill=True)
+
+
+# the killed pool's manager thread trips over the future cancelled by hand
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_job_cancelled_with_its_pool_is_resubmitted():
+    # what a timeout's pool kill does to jobs that were still queued
+    pipeline = JobPipeline(max_workers=1)
+    try:
+        jobs = [pipeline.submit(_square, x, timeout=30.0) for x in range(5)]
+        assert jobs[-1]._future.cancel()
+        pipeline._restart(jobs[-1]._generation)
+        assert [job.result() for job in jobs] == [x * x for x in range(5)]
+    finally:
+        pipeline.shutdown(kill=True)
+
+
+def test_describe_leaves_out_the_bytes():
+    pipeline = JobPipeline(max_workers=1)
+    try:
+        job = pipeline.submit(len, bytes(1 << 20), source="levels/a/score.sus")
+        assert job._describe() == "len(<1048576 bytes>) on levels/a/score.sus"
+    finally:
+        pipeline.shutdown(kill=True)
@@ -0,0 +1,63 @@
+import gzip
+
+from helpers import levels
+from helpers.repository import repo
+
+
+def _scan(tmp_path):
+    return levels.load_levels_directory(
+        "v3", levels_dir=tmp_path / "levels", levels_cache_dir=tmp_path / "cache"
+    )
+
+
+def test_failed_confirm_is_retried(tmp_path, monkeypatch):
+    folder = tmp_path / "levels" / "song"
+    folder.mkdir(parents=True)
+    (folder / "music.mp3").write_bytes(b"ID3" + bytes(64))
+
+    confirm_music = levels._confirm_music
+    monkeypatch.setattr(levels, "_confirm_music", lambda **kwargs: None)
+    monkeypatch.setattr(levels, "_RETRY_FIRST", 60.0)
+    assert _scan(tmp_path)["song"]["music"] is None
+
+    # nothing in the folder changed: skipped until the retry is due...
+    monkeypatch.setattr(levels, "_confirm_music", confirm_music)
+    assert _scan(tmp_path)["song"]["music"] is None
+    assert "song" in levels._PENDING_FOLDERS
+
+    # ...then confirmed, and no longer retried
+    state = next(s for s in levels.get_state_store(tmp_path / "cache").folders.values())
+    state["retry_at"] = 0.0
+    music = _scan(tmp_path)["song"]["music"]
+    assert music is not None and repo.has_hash(music)
+    assert "retry_at" not in state
+    assert "song" not in levels._PENDING_FOLDERS
+
+
+def test_shared_music_survives_the_other_folder_switching(tmp_path):
+    song = b"ID3" + bytes(range(64))
+    for name in ("a", "b"):
+        folder = tmp_path / "levels" / name
+        folder.mkdir(parents=True)
+        (folder / f"{name}.mp3").write_bytes(song)
+    music = _scan(tmp_path)["b"]["music"]
+    assert _scan(tmp_path)["a"]["music"] == music
+
+    # a picks another song; its copy of the shared one goes away
+    (tmp_path / "levels" / "a" / "a.mp3").unlink()
+    (tmp_path / "levels" / "a" / "other.mp3").write_bytes(b"ID3" + bytes(32))
+    levels = _scan(tmp_path)
+    assert levels["a"]["music"] != music and levels["b"]["music"] == music
+    assert repo.get_file(music) == song
+
+
+def test_only_gzipped_level_data_is_served_as_is():
+    level_data = b'{"bgmOffset": 0, "entities": []}'
+    assert levels._sniff_score_format("a.gz", gzip.compress(level_data)) == (
+        "lvd",
+        "compress_pysekai",
+    )
+    sus = b'#TITLE "x"\n#00002: 4\n'
+    assert levels._sniff_score_format("a.gz", gzip.compress(sus)) is None
+    assert levels._sniff_score_format("a.sus", gzip.compress(sus)) == ("sus",)
+    assert levels._sniff_score_format("a.gz", b"\x1f\x8bnot gzip") is None
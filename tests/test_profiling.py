@@ -0,0 +1,19 @@
+from helpers import profiling
+
+
+def test_noop_scans_are_not_profiled_or_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "directory", tmp_path)
+    monkeypatch.setattr(profiling, "threshold", 60.0)
+
+    recorder = profiling.ScanRecorder()
+    recorder.lap("setup")
+    recorder.finish("partial")
+    assert recorder._profile is None
+    assert not (tmp_path / "report.txt").exists()
+
+    recorder = profiling.ScanRecorder()
+    recorder.at("song")
+    recorder.at(None)
+    recorder.finish("partial")
+    assert recorder._profile is not None
+    assert (tmp_path / "report.txt").exists()
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from helpers.repository import Repository
+
+
+def test_stat_file_refuses_a_rewritten_file(tmp_path):
+    blob = tmp_path / "music.mp3"
+    blob.write_bytes(b"ID3" + bytes(64))
+    repo = Repository()
+    hash = repo.add_file(blob)
+    assert repo.stat_file(hash) == (str(blob), 67)
+
+    # touched but the same bytes: still served
+    st = blob.stat()
+    os.utime(blob, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert repo.stat_file(hash) == (str(blob), 67)
+
+    blob.write_bytes(b"ID3" + bytes(65))
+    with pytest.raises(FileNotFoundError):
+        repo.stat_file(hash)
+
+
+def test_stat_file_skips_in_memory_entries():
+    repo = Repository()
+    repo.add_bytes(b"data")
+    assert repo.stat_file("a17c9aaa61e80a1bf71d0d850af4e5baa9800bbd") is None
@@ -0,0 +1,21 @@
+import io
+import time
+import zipfile
+
+from helpers.zip_reader import NestedZipReader
+
+
+def test_idle_handles_are_closed_without_another_read(tmp_path):
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, "w") as zf:
+        zf.writestr("score.sus", "#TITLE")
+    outer = tmp_path / "pack.zip"
+    with zipfile.ZipFile(outer, "w") as zf:
+        zf.writestr("inner.zip", inner.getvalue())
+
+    reader = NestedZipReader(max_idle=0.2)
+    assert reader.read([str(outer), "inner.zip", "score.sus"]) == b"#TITLE"
+    assert reader._handles
+
+    time.sleep(1.0)
+    assert not reader._handles and not reader._outers